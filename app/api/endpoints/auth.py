@@ -3,24 +3,24 @@ from typing import Any
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
 from app.core.security import create_access_token
-from app.db.session import get_db
-from app.services.auth import authenticate_user, get_current_user
+from app.db.session import get_async_db
+from app.services.auth import aauthenticate_user, get_current_user
 from app.schemas.token import Token
 
 router = APIRouter()
 
 @router.post("/token", response_model=Token)
-def login_access_token(
-    db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()
+async def login_access_token(
+    db: AsyncSession = Depends(get_async_db), form_data: OAuth2PasswordRequestForm = Depends()
 ) -> Any:
     """
     OAuth2 兼容的令牌登录，获取访问令牌
     """
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await aauthenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -5,8 +5,8 @@ from sqlalchemy.orm import Session
 
 from app.db.session import get_db
 from app.services.auth import get_current_user
-from app.services.knowledge_manager import store_short_term_memory, get_short_term_memory, add_knowledge, search_knowledge, get_knowledge_entry
-from app.schemas.knowledge import ShortTermMemoryCreate, ShortTermMemoryResponse, KnowledgeCreate, KnowledgeResponse, KnowledgeSearchResponse
+from app.services.knowledge_manager import store_short_term_memory, get_short_term_memory, add_knowledge, bulk_add_knowledge, search_knowledge, get_knowledge_entry
+from app.schemas.knowledge import ShortTermMemoryCreate, ShortTermMemoryResponse, KnowledgeCreate, KnowledgeBulkCreate, KnowledgeBulkResponse, KnowledgeResponse, KnowledgeSearchResponse
 
 router = APIRouter()
 
@@ -24,7 +24,7 @@ def store_memory(
 @router.get("/short-term", response_model=ShortTermMemoryResponse)
 def get_memory(
     task_id: int,
-    limit: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, description="只返回最近的若干条"),
     current_user = Depends(get_current_user)
 ) -> Any:
     """
@@ -50,17 +50,31 @@ def add_knowledge_entry(
     knowledge_id = add_knowledge(db=db, knowledge_in=knowledge_in, user_id=current_user.id)
     return {"knowledge_id": knowledge_id, "message": "Knowledge entry saved"}
 
+@router.post("/bulk", response_model=KnowledgeBulkResponse)
+def bulk_add_knowledge_entries(
+    bulk_in: KnowledgeBulkCreate,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+) -> Any:
+    """
+    批量添加知识条目，分批嵌入并批量写入，返回导入吞吐量
+    """
+    stats = bulk_add_knowledge(db=db, entries=bulk_in.entries, user_id=current_user.id)
+    return stats.to_dict()
+
 @router.get("/search", response_model=KnowledgeSearchResponse)
 def search_knowledge_entries(
     query: str,
-    top_k: int = 5,
+    top_k: int = Query(5, ge=1, le=100, description="返回结果数量"),
+    tags: Optional[List[str]] = Query(None, description="按标签过滤，可指定多个"),
+    mode: Optional[str] = Query(None, description="检索模式: hybrid, vector, keyword"),
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ) -> Any:
     """
     搜索知识库
     """
-    results = search_knowledge(db=db, query=query, top_k=top_k)
+    results = search_knowledge(db=db, query=query, top_k=top_k, tags=tags, mode=mode)
     return {"query": query, "results": results}
 
 @router.get("/{knowledge_id}", response_model=KnowledgeResponse)
@@ -1,70 +1,112 @@
+import json
+from bisect import bisect_right
 from typing import Any, List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db.session import get_db
+from app.core.config import settings
+from app.db.session import get_async_db
 # 暂时注释掉认证
 # from app.services.auth import get_current_user
-from app.services.tool_manager import get_tools, invoke_tool, get_tool_invocation
-from app.models.tool import Tool
+from app.services.tool_manager import tool_registry, encode_page_cursor, decode_page_cursor, ainvoke_tool, ainvoke_tools_batch, aget_tool_invocation, await_tool_invocation
+from app.services.tool_manager.validation import format_validation_error
 from app.schemas.tool import (
-    MCPToolDefinition, 
     MCPToolsListResponse, 
     MCPToolCallRequest, 
-    MCPToolCallResponse
+    MCPToolCallResponse,
+    MCPToolBatchCallRequest,
+    MCPToolBatchCallResponse
 )
 
 router = APIRouter()
 
+# MCP工具列表游标的作用域
+MCP_LIST_SCOPE = "mcp:tools"
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+def _invocation_content(invocation) -> MCPToolCallResponse:
+    """
+    将调用记录（或批量调用的单项结果）转换为MCP调用响应，未完成时返回调用ID
+    """
+    if invocation.status == "success":
+        output = invocation.output
+        text = output if isinstance(output, str) else json.dumps(output, ensure_ascii=False, default=str)
+        return MCPToolCallResponse(
+            content=[{"type": "text", "text": text}],
+            invokeId=invocation.invoke_id,
+            status=invocation.status
+        )
+    if invocation.status == "failed":
+        return MCPToolCallResponse(
+            content=[{"type": "text", "text": invocation.error or "工具调用失败"}],
+            isError=True,
+            invokeId=invocation.invoke_id,
+            status=invocation.status
+        )
+    return MCPToolCallResponse(
+        content=[
+            {
+                "type": "text",
+                "text": f"调用已接受，调用ID: {invocation.invoke_id}"
+            }
+        ],
+        invokeId=invocation.invoke_id,
+        status=invocation.status
+    )
+
 @router.get("/tools/list", response_model=MCPToolsListResponse)
-def list_mcp_tools(
-    db: Session = Depends(get_db),
+async def list_mcp_tools(
     # 暂时注释掉认证
     # current_user = Depends(get_current_user),
     cursor: Optional[str] = None,
-    limit: int = 50
+    limit: int = Query(50, ge=1, le=500),
+    if_none_match: Optional[str] = Header(None)
 ) -> Any:
     """
     列出可用的MCP工具
     
-    符合MCP协议的工具列表端点
+    符合MCP协议的工具列表端点；按工具ID分页，nextCursor为下一页的游标。
+    列表在注册表每次加载后预先序列化，响应带有ETag，客户端可用If-None-Match重新验证
     """
-    tools = get_tools(db=db, skip=0, limit=limit, status="active")
+    listing = await tool_registry.amcp_listing()
+    after_id = decode_page_cursor(cursor, MCP_LIST_SCOPE) if cursor else 0
+    etag = f'"{listing.digest}-{after_id}-{limit}"'
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
     
-    # 转换为MCP格式
-    mcp_tools = []
-    for tool in tools:
-        # 确保工具有输入模式
-        if not tool.input_schema:
-            continue
-            
-        mcp_tool = MCPToolDefinition(
-            name=tool.name,
-            description=tool.description,
-            capabilities=tool.capabilities,
-            inputSchema=tool.input_schema
-        )
-        mcp_tools.append(mcp_tool)
-    
-    return MCPToolsListResponse(
-        tools=mcp_tools,
-        nextCursor=None  # 简化实现，不支持分页
-    )
+    start = bisect_right(listing.ids, after_id)
+    end = start + limit
+    next_cursor = encode_page_cursor(listing.ids[end - 1], MCP_LIST_SCOPE) if end < len(listing.ids) else None
+    body = b"".join([
+        b'{"tools":[',
+        b",".join(listing.fragments[start:end]),
+        b'],"nextCursor":',
+        json.dumps(next_cursor).encode("utf-8"),
+        b"}"
+    ])
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
 
 @router.post("/tools/call", response_model=MCPToolCallResponse)
 async def call_mcp_tool(
     request: MCPToolCallRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     # 暂时注释掉认证
-    # current_user = Depends(get_current_user)
+    # current_user = Depends(get_current_user),
+    wait: Optional[float] = Query(None, ge=0, le=settings.MCP_LONG_POLL_MAX_WAIT, description="等待结果的最长时间（秒），0表示立即返回调用ID")
 ) -> Any:
     """
     调用MCP工具
     
-    符合MCP协议的工具调用端点
+    符合MCP协议的工具调用端点；在等待时间内完成的调用直接返回结果，
+    超时仍未完成时返回调用ID，可通过状态端点继续等待
     """
     # 根据名称查找工具
-    tool = db.query(Tool).filter(Tool.name == request.name, Tool.status == "active").first()
+    tool = await tool_registry.aget_by_name(request.name)
     if not tool:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -74,12 +116,21 @@ async def call_mcp_tool(
     # 调用工具
     # 暂时使用固定用户ID
     user_id = 1
-    invocation = invoke_tool(
-        db=db, 
-        tool_id=tool.id, 
-        params=request.arguments, 
-        user_id=user_id
-    )
+    try:
+        invocation = await ainvoke_tool(
+            db=db, 
+            tool_id=tool.id, 
+            params=request.arguments, 
+            user_id=user_id
+        )
+    except HTTPException as e:
+        # 参数校验失败按MCP约定作为工具错误返回，由调用方修正参数
+        if e.status_code != status.HTTP_422_UNPROCESSABLE_ENTITY:
+            raise
+        return MCPToolCallResponse(
+            content=[{"type": "text", "text": format_validation_error(e)}],
+            isError=True
+        )
     
     if not invocation:
         raise HTTPException(
@@ -87,32 +138,53 @@ async def call_mcp_tool(
             detail="工具调用失败"
         )
     
-    # 等待工具执行完成
-    # 注意：在实际生产环境中，应该使用异步方式或WebSocket通知
-    # 这里简化处理，直接返回调用ID
+    # 命中缓存的调用已经完成，否则在等待时间内等待执行结果
+    wait = settings.MCP_CALL_WAIT_TIMEOUT if wait is None else wait
+    if invocation.status == "running" and wait > 0:
+        invocation = await await_tool_invocation(db=db, invoke_id=invocation.invoke_id, timeout=wait) or invocation
     
-    return MCPToolCallResponse(
-        content=[
-            {
-                "type": "text",
-                "text": f"工具 '{request.name}' 调用已接受，调用ID: {invocation.invoke_id}"
-            }
-        ]
+    return _invocation_content(invocation)
+
+@router.post("/tools/call/batch", response_model=MCPToolBatchCallResponse)
+async def call_mcp_tools_batch(
+    request: MCPToolBatchCallRequest,
+    db: AsyncSession = Depends(get_async_db),
+    # 暂时注释掉认证
+    # current_user = Depends(get_current_user),
+    wait: Optional[float] = Query(None, ge=0, le=settings.MCP_LONG_POLL_MAX_WAIT, description="等待结果的最长时间（秒），0表示立即返回调用ID")
+) -> Any:
+    """
+    批量调用MCP工具
+
+    非标准MCP端点，一次请求并发执行多个调用，结果与请求顺序一致
+    """
+    # 暂时使用固定用户ID
+    user_id = 1
+    results = await ainvoke_tools_batch(
+        db=db,
+        calls=[(call.name, call.arguments) for call in request.calls],
+        user_id=user_id,
+        wait=settings.MCP_CALL_WAIT_TIMEOUT if wait is None else wait
     )
+    return MCPToolBatchCallResponse(results=[_invocation_content(item) for item in results])
 
 @router.get("/tools/status/{invoke_id}")
 async def get_mcp_tool_status(
     invoke_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     # 暂时注释掉认证
-    # current_user = Depends(get_current_user)
+    # current_user = Depends(get_current_user),
+    wait: float = Query(0, ge=0, le=settings.MCP_LONG_POLL_MAX_WAIT, description="长轮询：调用未完成时最多等待的时间（秒）")
 ) -> Any:
     """
     获取MCP工具调用状态
     
-    非标准MCP端点，用于查询工具调用状态
+    非标准MCP端点，用于查询工具调用状态；指定wait时调用完成或超时后才返回
     """
-    invocation = get_tool_invocation(db=db, invoke_id=invoke_id)
+    if wait > 0:
+        invocation = await await_tool_invocation(db=db, invoke_id=invoke_id, timeout=wait)
+    else:
+        invocation = await aget_tool_invocation(db=db, invoke_id=invoke_id)
     if not invocation:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
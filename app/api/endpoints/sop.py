@@ -1,12 +1,17 @@
-from typing import Any, List, Optional
+import json
+from typing import Any, Dict, List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.db.session import get_db
+from app.core.config import settings
+from app.db.session import get_async_db, get_db
 from app.services.auth import get_current_user
-from app.services.sop_manager import create_sop_template, get_sop_templates, get_sop_template, start_sop_run, get_sop_run, cancel_sop_run
-from app.schemas.sop import SOPTemplateCreate, SOPTemplateResponse, SOPRunCreate, SOPRunResponse
+from app.services.sop_manager import create_sop_template, get_sop_templates, get_sop_template, update_sop_template, start_sop_run, get_sop_run, get_sop_run_events, cancel_sop_run, get_approvals, decide_approval, astart_sop_run_batch, aget_sop_run_batch
+from app.schemas.sop import SOPTemplateCreate, SOPTemplateUpdate, SOPTemplateResponse, SOPRunCreate, SOPRunResponse, SOPRunEventResponse, SOPRunBatchCreate, SOPRunBatchResponse
+from app.schemas.tool import ToolApprovalDecision, ToolApprovalResponse
 
 router = APIRouter()
 
@@ -52,6 +57,18 @@ def read_template(
         )
     return template
 
+@router.put("/templates/{template_id}", response_model=SOPTemplateResponse)
+def update_template(
+    template_id: int,
+    template_in: SOPTemplateUpdate,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+) -> Any:
+    """
+    修改SOP模板，生成新的修订
+    """
+    return update_sop_template(db=db, template_id=template_id, template_in=template_in)
+
 @router.post("/runs", response_model=SOPRunResponse)
 def start_run(
     run_in: SOPRunCreate,
@@ -59,29 +76,94 @@ def start_run(
     current_user = Depends(get_current_user)
 ) -> Any:
     """
-    启动SOP流程
+    启动SOP流程，模板不存在时返回404
     """
-    # 检查模板是否存在
-    template = get_sop_template(db=db, template_id=run_in.template_id)
-    if not template:
+    run = start_sop_run(db=db, run_in=run_in, user_id=current_user.id)
+    return run
+
+async def _read_ndjson_contexts(request: Request) -> List[Dict[str, Any]]:
+    """逐块读取NDJSON请求体，每行一个流程上下文，超过批量上限时立即停止读取"""
+    contexts: List[Dict[str, Any]] = []
+    buffer = b""
+
+    def parse(line: bytes) -> None:
+        line = line.strip()
+        if not line:
+            return
+        try:
+            context = json.loads(line)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"第{len(contexts) + 1}个上下文不是合法的JSON")
+        if not isinstance(context, dict):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"第{len(contexts) + 1}个上下文必须是JSON对象")
+        if len(contexts) >= settings.SOP_BATCH_MAX_RUNS:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"单次批量启动最多{settings.SOP_BATCH_MAX_RUNS}个流程")
+        contexts.append(context)
+
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            parse(line)
+    parse(buffer)
+    return contexts
+
+async def _read_batch(request: Request, template_id: Optional[int]) -> Tuple[int, List[Dict[str, Any]]]:
+    """解析批量启动请求：JSON请求体为SOPRunBatchCreate，NDJSON请求体每行一个上下文，模板ID由查询参数给出"""
+    if "ndjson" in request.headers.get("content-type", ""):
+        if template_id is None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="NDJSON请求需要通过template_id查询参数指定模板")
+        return template_id, await _read_ndjson_contexts(request)
+    try:
+        batch_in = SOPRunBatchCreate.model_validate_json(await request.body())
+    except ValidationError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=e.errors(include_url=False))
+    return batch_in.template_id, batch_in.contexts
+
+@router.post("/batches", response_model=SOPRunBatchResponse)
+async def launch_batch(
+    request: Request,
+    template_id: Optional[int] = Query(None, description="NDJSON请求的模板ID"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_current_user)
+) -> Any:
+    """
+    批量启动SOP流程，每个上下文启动一个流程
+
+    请求体为 {"template_id": ..., "contexts": [...]}，或 Content-Type 为 application/x-ndjson、每行一个上下文；
+    流程由执行引擎按速率逐步放行，返回批次ID，可据此查询整体进度
+    """
+    template_id, contexts = await _read_batch(request, template_id)
+    return await astart_sop_run_batch(db=db, template_id=template_id, contexts=contexts, user_id=current_user.id)
+
+@router.get("/batches/{batch_id}", response_model=SOPRunBatchResponse)
+async def read_batch(
+    batch_id: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_current_user)
+) -> Any:
+    """
+    获取SOP流程批次的整体进度
+    """
+    batch = await aget_sop_run_batch(db=db, batch_id=batch_id)
+    if not batch:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="SOP模板不存在"
+            detail="SOP流程批次不存在"
         )
-    
-    run = start_sop_run(db=db, run_in=run_in, user_id=current_user.id)
-    return run
+    return batch
 
 @router.get("/runs/{run_id}", response_model=SOPRunResponse)
 def read_run(
     run_id: str,
     db: Session = Depends(get_db),
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    since: Optional[int] = Query(None, ge=0, description="只返回该事件序号之后有变化的步骤")
 ) -> Any:
     """
     获取SOP流程执行状态
     """
-    run = get_sop_run(db=db, run_id=run_id)
+    run = get_sop_run(db=db, run_id=run_id, since=since)
     if not run:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -89,6 +171,19 @@ def read_run(
         )
     return run
 
+@router.get("/runs/{run_id}/events", response_model=List[SOPRunEventResponse])
+def read_run_events(
+    run_id: str,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user),
+    since: int = Query(0, ge=0, description="只返回该事件序号之后的事件"),
+    limit: int = Query(500, ge=1, le=5000)
+) -> Any:
+    """
+    获取SOP流程事件
+    """
+    return get_sop_run_events(db=db, run_id=run_id, since=since, limit=limit)
+
 @router.post("/runs/{run_id}/cancel", response_model=dict)
 def cancel_run(
     run_id: str,
@@ -111,4 +206,30 @@ def cancel_run(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="SOP流程无法取消，可能已完成或已取消"
         )
-    return {"run_id": run_id, "status": "canceled", "message": "SOP流程已取消"} 
\ No newline at end of file
+    return {"run_id": run_id, "status": "canceled", "message": "SOP流程已取消"}
+
+@router.get("/approvals", response_model=List[ToolApprovalResponse])
+def read_approvals(
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user),
+    approval_status: Optional[str] = Query("pending", alias="status"),
+    run_id: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100
+) -> Any:
+    """
+    获取审批列表，默认只返回待处理的审批
+    """
+    return get_approvals(db=db, status_=approval_status, sop_run_id=run_id, skip=skip, limit=limit)
+
+@router.post("/approvals/{approval_id}/decision", response_model=ToolApprovalResponse)
+def decide(
+    approval_id: int,
+    decision: ToolApprovalDecision,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+) -> Any:
+    """
+    处理审批，关联的SOP流程随即恢复执行；申请人不能处理自己的审批，指定了负责角色时需拥有该角色
+    """
+    return decide_approval(db=db, approval_id=approval_id, decision=decision, approver=current_user)
@@ -1,7 +1,9 @@
 from typing import Any, List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Query, status, BackgroundTasks, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+import json
 import uuid
 
 from app.db.session import get_db
@@ -101,6 +103,41 @@ async def get_task_status(task_id: str):
     status = await TaskSchedulerService.get_task_status(task_id)
     return {"id": task_id, "status": status["status"]}
 
+@router.get("/{task_id}/events")
+async def stream_task_events(task_id: str):
+    """
+    以SSE方式推送任务执行事件（计划、工具调用、反思、token增量等）
+    """
+    async def event_source():
+        async for event in TaskSchedulerService.stream_events(task_id):
+            if event is None:
+                # 心跳，防止代理断开空闲连接
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+    
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.websocket("/{task_id}/ws")
+async def task_events_websocket(websocket: WebSocket, task_id: str):
+    """
+    以WebSocket方式推送任务执行事件
+    """
+    await websocket.accept()
+    try:
+        async for event in TaskSchedulerService.stream_events(task_id):
+            if event is None:
+                await websocket.send_json({"type": "heartbeat", "task_id": task_id})
+                continue
+            await websocket.send_json(event)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+
 @router.post("/{task_id}/cancel", response_model=TaskStatus)
 async def cancel_task(task_id: str):
     """
@@ -112,27 +149,27 @@ async def cancel_task(task_id: str):
 @router.post("/{task_id}/execute", response_model=TaskExecutionResponse)
 async def execute_task(
     task_id: str, 
-    execution_request: TaskExecutionRequest,
-    background_tasks: BackgroundTasks
+    execution_request: TaskExecutionRequest
 ):
     """
     使用Agent执行任务
     """
-    # 在后台执行任务
-    background_tasks.add_task(
-        TaskSchedulerService.execute_task,
+    # 投递到Worker队列执行，API进程重启不影响任务
+    queued = await TaskSchedulerService.enqueue_task(
         task_id,
         execution_request.description,
-        execution_request.use_reflection,
-        execution_request.use_siliconflow
+        use_reflection=execution_request.use_reflection,
+        use_siliconflow=execution_request.use_siliconflow,
+        priority=execution_request.priority
     )
     
     agent_type = "硅基流动" if execution_request.use_siliconflow else ("反思" if execution_request.use_reflection else "标准")
     
     return {
         "task_id": task_id,
-        "status": "started",
-        "message": f"任务已开始执行，使用{agent_type}Agent，请稍后查询结果"
+        "status": queued["status"],
+        "message": f"任务已加入执行队列，使用{agent_type}Agent，请稍后查询结果",
+        "queue": queued["queue"]
     }
 
 @router.post("/{task_id}/compare-agents", response_model=AgentComparisonResponse)
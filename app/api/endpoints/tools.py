@@ -1,53 +1,109 @@
 from typing import Any, List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db.session import get_db
+from app.db.session import get_async_db
 from app.services.auth import get_current_user, get_current_active_superuser
-from app.services.tool_manager import register_tool, get_tools, invoke_tool, get_tool_invocation
-from app.schemas.tool import ToolCreate, ToolResponse, ToolInvoke, ToolInvocationResponse
+from app.services.tool_manager import aregister_tool, aupdate_tool, aget_tools, encode_page_cursor, decode_page_cursor, ainvoke_tool, ainvoke_tools_batch, aget_tool_invocation, tool_executor, tool_http_pool, tool_result_cache, tool_registry
+from app.schemas.tool import ToolCreate, ToolUpdate, ToolResponse, ToolInvoke, ToolInvocationResponse, ToolBatchInvoke, ToolBatchInvokeResponse
 
 router = APIRouter()
 
 @router.post("", response_model=ToolResponse)
-def register_new_tool(
+async def register_new_tool(
     tool_in: ToolCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_active_superuser)  # 只有管理员可以注册工具
 ) -> Any:
     """
     注册新工具
     """
-    tool = register_tool(db=db, tool_in=tool_in)
+    tool = await aregister_tool(db=db, tool_in=tool_in)
     return tool
 
+@router.put("/{tool_id}", response_model=ToolResponse)
+async def update_existing_tool(
+    tool_id: int,
+    tool_in: ToolUpdate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_current_active_superuser)  # 只有管理员可以修改工具
+) -> Any:
+    """
+    修改工具，接口、认证或参数Schema变化时工具版本递增
+    """
+    return await aupdate_tool(db=db, tool_id=tool_id, tool_in=tool_in)
+
 @router.get("", response_model=List[ToolResponse])
-def read_tools(
-    db: Session = Depends(get_db),
+async def read_tools(
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user),
     skip: int = 0,
-    limit: int = 100,
-    status: Optional[str] = None
+    limit: int = Query(100, ge=1, le=500),
+    status: Optional[str] = None,
+    cursor: Optional[str] = None
 ) -> Any:
     """
-    获取工具列表
+    获取工具列表，按ID排序
+
+    还有下一页时，下一页的游标在 X-Next-Cursor 响应头中返回；skip仅为兼容旧客户端保留
     """
-    tools = get_tools(db=db, skip=skip, limit=limit, status=status)
+    scope = f"tools:{status or ''}"
+    if cursor:
+        after_id = decode_page_cursor(cursor, scope)
+    else:
+        after_id = None if skip else 0
+    # 多取一条判断是否还有下一页
+    tools = await aget_tools(db=db, skip=skip, limit=limit + 1, status=status, after_id=after_id)
+    if len(tools) > limit:
+        tools = tools[:limit]
+        response.headers["X-Next-Cursor"] = encode_page_cursor(tools[-1].id, scope)
     return tools
 
+@router.get("/stats")
+async def read_tool_runtime_stats(
+    current_user = Depends(get_current_active_superuser)
+) -> Any:
+    """
+    获取工具注册表、执行引擎、HTTP连接池和结果缓存的运行统计
+    """
+    return {
+        "registry": tool_registry.stats(),
+        "executor": tool_executor.stats(),
+        "http_pool": tool_http_pool.stats(),
+        "result_cache": tool_result_cache.stats()
+    }
+
+@router.post("/batch/invoke", response_model=ToolBatchInvokeResponse)
+async def invoke_tools_batch(
+    batch_in: ToolBatchInvoke,
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_current_user)
+) -> Any:
+    """
+    批量调用工具，结果与请求顺序一致，每项单独给出状态
+    """
+    results = await ainvoke_tools_batch(
+        db=db,
+        calls=[(call.tool_id, call.params) for call in batch_in.calls],
+        user_id=current_user.id,
+        wait=batch_in.wait
+    )
+    return ToolBatchInvokeResponse(results=results)
+
 @router.post("/{tool_id}/invoke", response_model=ToolInvocationResponse)
-def invoke_existing_tool(
+async def invoke_existing_tool(
     tool_id: int,
     invoke_params: ToolInvoke,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ) -> Any:
     """
     调用工具
     """
     # 这里可以添加权限检查，确认用户是否有权限调用该工具
-    result = invoke_tool(db=db, tool_id=tool_id, params=invoke_params.params, user_id=current_user.id)
+    result = await ainvoke_tool(db=db, tool_id=tool_id, params=invoke_params.params, user_id=current_user.id)
     if not result:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -56,15 +112,15 @@ def invoke_existing_tool(
     return result
 
 @router.get("/invocations/{invoke_id}", response_model=ToolInvocationResponse)
-def get_tool_invocation_status(
+async def get_tool_invocation_status(
     invoke_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ) -> Any:
     """
     获取工具调用状态
     """
-    invocation = get_tool_invocation(db=db, invoke_id=invoke_id)
+    invocation = await aget_tool_invocation(db=db, invoke_id=invoke_id)
     if not invocation:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
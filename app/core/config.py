@@ -22,6 +22,12 @@ class Settings(BaseSettings):
     POSTGRES_PASSWORD: str = os.getenv("POSTGRES_PASSWORD", "postgres")
     POSTGRES_DB: str = os.getenv("POSTGRES_DB", "lifu_butler")
     SQLALCHEMY_DATABASE_URI: Optional[str] = None
+    SQLALCHEMY_ASYNC_DATABASE_URI: Optional[str] = None
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # 连接最长复用时间（秒）
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # 等待空闲连接的超时时间（秒）
+    DB_STATEMENT_TIMEOUT: int = int(os.getenv("DB_STATEMENT_TIMEOUT", "30000"))  # 单条SQL的超时时间（毫秒）
     
     # Redis配置
     REDIS_HOST: str = os.getenv("REDIS_HOST", "localhost")
@@ -32,6 +38,13 @@ class Settings(BaseSettings):
     # Celery配置
     CELERY_BROKER_URL: str = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/1")
     CELERY_RESULT_BACKEND: str = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/2")
+    CELERY_TASK_ALWAYS_EAGER: bool = os.getenv("CELERY_TASK_ALWAYS_EAGER", "False").lower() == "true"
+    CELERY_RESULT_EXPIRES: int = int(os.getenv("CELERY_RESULT_EXPIRES", str(60 * 60 * 24)))  # 1天
+    AGENT_WORKER_CONCURRENCY: int = int(os.getenv("AGENT_WORKER_CONCURRENCY", "4"))
+    AGENT_TASK_MAX_RETRIES: int = int(os.getenv("AGENT_TASK_MAX_RETRIES", "3"))
+    AGENT_TASK_RETRY_BACKOFF_MAX: int = int(os.getenv("AGENT_TASK_RETRY_BACKOFF_MAX", "600"))
+    AGENT_TASK_TIME_LIMIT: int = int(os.getenv("AGENT_TASK_TIME_LIMIT", "1800"))
+    TASK_EVENT_TTL: int = int(os.getenv("TASK_EVENT_TTL", str(60 * 60 * 24)))  # 任务状态快照保留1天
     
     # MinIO配置
     MINIO_ENDPOINT: str = os.getenv("MINIO_ENDPOINT", "localhost:9000")
@@ -42,7 +55,85 @@ class Settings(BaseSettings):
     # OpenAI配置
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     OPENAI_MODEL: str = os.getenv("OPENAI_MODEL", "gpt-4")
-    
+
+    # LLM客户端连接池配置
+    LLM_MAX_CONNECTIONS: int = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "10"))
+    LLM_KEEPALIVE_EXPIRY: float = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+    LLM_TIMEOUT: float = float(os.getenv("LLM_TIMEOUT", "120"))
+
+    # Agent检查点配置
+    CHECKPOINT_BACKEND: str = os.getenv("CHECKPOINT_BACKEND", "sql")  # sql, redis, memory
+    CHECKPOINT_KEEP_LAST: int = int(os.getenv("CHECKPOINT_KEEP_LAST", "5"))
+    CHECKPOINT_COMPACT_EVERY: int = int(os.getenv("CHECKPOINT_COMPACT_EVERY", "10"))
+    CHECKPOINT_TTL: int = int(os.getenv("CHECKPOINT_TTL", str(60 * 60 * 24 * 3)))  # 3天
+    # 只追加的消息通道，按单条消息存储，每一步只写入新增的消息
+    CHECKPOINT_MESSAGE_CHANNELS: str = os.getenv("CHECKPOINT_MESSAGE_CHANNELS", "messages")
+
+    # Agent上下文窗口配置
+    AGENT_CONTEXT_TOKEN_BUDGET: int = int(os.getenv("AGENT_CONTEXT_TOKEN_BUDGET", "6000"))
+    # Agent对比评估中单个Agent的超时时间（秒）
+    AGENT_COMPARISON_TIMEOUT: float = float(os.getenv("AGENT_COMPARISON_TIMEOUT", "600"))
+
+    # 知识库向量检索配置
+    EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small" if os.getenv("OPENAI_API_KEY") else "hashing")  # hashing为本地确定性模型
+    EMBEDDING_DIM: int = int(os.getenv("EMBEDDING_DIM", "384"))  # 本地模型的向量维度
+    KNOWLEDGE_INDEX_PATH: str = os.getenv("KNOWLEDGE_INDEX_PATH", "data/knowledge.index")
+    KNOWLEDGE_INDEX_TYPE: str = os.getenv("KNOWLEDGE_INDEX_TYPE", "IVF")  # Flat, IVF, HNSW；只有IVF索引能以内存映射方式加载，Flat和HNSW会完整读入每个进程的内存
+    KNOWLEDGE_IVF_NLIST: int = int(os.getenv("KNOWLEDGE_IVF_NLIST", "4096"))
+    KNOWLEDGE_IVF_NPROBE: int = int(os.getenv("KNOWLEDGE_IVF_NPROBE", "16"))
+    KNOWLEDGE_HNSW_M: int = int(os.getenv("KNOWLEDGE_HNSW_M", "32"))
+    KNOWLEDGE_HNSW_EF_SEARCH: int = int(os.getenv("KNOWLEDGE_HNSW_EF_SEARCH", "64"))
+    KNOWLEDGE_INDEX_MERGE_THRESHOLD: int = int(os.getenv("KNOWLEDGE_INDEX_MERGE_THRESHOLD", "10000"))  # 增量向量达到该数量时合并进磁盘索引
+    KNOWLEDGE_INDEX_TOMBSTONE_THRESHOLD: int = int(os.getenv("KNOWLEDGE_INDEX_TOMBSTONE_THRESHOLD", "1000"))  # 主索引中已删除的向量达到该数量时重写主索引
+    KNOWLEDGE_INDEX_REFRESH_INTERVAL: float = float(os.getenv("KNOWLEDGE_INDEX_REFRESH_INTERVAL", "30"))  # 同步其他进程新增向量的间隔（秒）
+    EMBEDDING_STORAGE_DTYPE: str = os.getenv("EMBEDDING_STORAGE_DTYPE", "float32")  # float32, float16（节省一半存储）
+    EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))  # 每次调用嵌入模型的分块数
+    KNOWLEDGE_CHUNK_SIZE: int = int(os.getenv("KNOWLEDGE_CHUNK_SIZE", "800"))  # 分块的最大字符数
+    KNOWLEDGE_CHUNK_OVERLAP: int = int(os.getenv("KNOWLEDGE_CHUNK_OVERLAP", "100"))  # 相邻分块重叠的字符数
+    KNOWLEDGE_INGEST_BATCH_SIZE: int = int(os.getenv("KNOWLEDGE_INGEST_BATCH_SIZE", "500"))  # 批量导入时每个事务处理的文档数
+    KNOWLEDGE_SEARCH_MODE: str = os.getenv("KNOWLEDGE_SEARCH_MODE", "hybrid")  # hybrid, vector, keyword
+    KNOWLEDGE_RRF_K: int = int(os.getenv("KNOWLEDGE_RRF_K", "60"))  # 倒数排名融合的平滑常数
+
+    # 短期记忆配置
+    SHORT_TERM_MEMORY_MAX_ITEMS: int = int(os.getenv("SHORT_TERM_MEMORY_MAX_ITEMS", "200"))  # 每个任务保留的最大记忆条数
+    SHORT_TERM_MEMORY_TTL: int = int(os.getenv("SHORT_TERM_MEMORY_TTL", str(60 * 60 * 6)))  # 最后一次写入后保留6小时
+    SHORT_TERM_MEMORY_FLUSH_INTERVAL: float = float(os.getenv("SHORT_TERM_MEMORY_FLUSH_INTERVAL", "60"))  # 归档检查间隔（秒）
+    SHORT_TERM_MEMORY_FLUSH_MARGIN: int = int(os.getenv("SHORT_TERM_MEMORY_FLUSH_MARGIN", "600"))  # 过期前多久归档到数据库（秒）
+
+    # 工具注册表配置
+    TOOL_REGISTRY_CHECK_INTERVAL: float = float(os.getenv("TOOL_REGISTRY_CHECK_INTERVAL", "1"))  # 检查工具定义版本号的间隔（秒）
+
+    # 工具执行引擎配置
+    TOOL_WORKER_COUNT: int = int(os.getenv("TOOL_WORKER_COUNT", "8"))  # 执行工具调用的Worker数量
+    TOOL_QUEUE_MAXSIZE: int = int(os.getenv("TOOL_QUEUE_MAXSIZE", "1000"))  # 积压调用上限，超出时返回429
+    TOOL_PER_TOOL_CONCURRENCY: int = int(os.getenv("TOOL_PER_TOOL_CONCURRENCY", "4"))  # 单个工具的最大并发数
+    TOOL_BATCH_MAX_CALLS: int = int(os.getenv("TOOL_BATCH_MAX_CALLS", "50"))  # 单次批量调用的最大调用数
+    TOOL_STATUS_POLL_INTERVAL: float = float(os.getenv("TOOL_STATUS_POLL_INTERVAL", "0.5"))  # 等待其他进程执行的调用时的查询间隔（秒）
+    MCP_CALL_WAIT_TIMEOUT: float = float(os.getenv("MCP_CALL_WAIT_TIMEOUT", "5"))  # MCP调用默认等待结果的时间（秒），超时后返回调用ID
+    MCP_LONG_POLL_MAX_WAIT: float = float(os.getenv("MCP_LONG_POLL_MAX_WAIT", "30"))  # 状态查询长轮询的最长等待时间（秒）
+
+    # 工具HTTP客户端配置
+    TOOL_HTTP_TIMEOUT: float = float(os.getenv("TOOL_HTTP_TIMEOUT", "30"))  # 工具未设置超时时的默认值（秒）
+    TOOL_HTTP_MAX_CONNECTIONS: int = int(os.getenv("TOOL_HTTP_MAX_CONNECTIONS", "50"))  # 每个主机的最大连接数
+    TOOL_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("TOOL_HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    TOOL_HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv("TOOL_HTTP_KEEPALIVE_EXPIRY", "60"))
+    TOOL_HTTP2_ENABLED: bool = os.getenv("TOOL_HTTP2_ENABLED", "True").lower() == "true"
+
+    # 工具结果缓存配置
+    TOOL_RESULT_CACHE_MAX_ENTRIES: int = int(os.getenv("TOOL_RESULT_CACHE_MAX_ENTRIES", "10000"))  # 进程内LRU的最大条目数
+    TOOL_RESULT_CACHE_LOCAL_TTL: float = float(os.getenv("TOOL_RESULT_CACHE_LOCAL_TTL", "30"))  # 进程内副本的最长有效期（秒）
+
+    # SOP执行引擎配置
+    SOP_MAX_ACTIVE_RUNS: int = int(os.getenv("SOP_MAX_ACTIVE_RUNS", "50"))  # 每个进程同时执行的最大流程数
+    SOP_RUN_MAX_PARALLEL_STEPS: int = int(os.getenv("SOP_RUN_MAX_PARALLEL_STEPS", "4"))  # 单个流程同时执行的最大步骤数
+    SOP_STEP_DEFAULT_TIMEOUT: float = float(os.getenv("SOP_STEP_DEFAULT_TIMEOUT", "300"))  # 步骤未设置超时时的默认值（秒）
+    SOP_PENDING_SWEEP_INTERVAL: float = float(os.getenv("SOP_PENDING_SWEEP_INTERVAL", "5"))  # 扫描待执行流程的间隔（秒）
+    SOP_RUN_LEASE_SECONDS: float = float(os.getenv("SOP_RUN_LEASE_SECONDS", "60"))  # 流程执行租约时长（秒），每1/3时长续约一次
+    SOP_BATCH_MAX_RUNS: int = int(os.getenv("SOP_BATCH_MAX_RUNS", "10000"))  # 单次批量启动的最大流程数
+    SOP_BATCH_ADMIT_RATE: float = float(os.getenv("SOP_BATCH_ADMIT_RATE", "20"))  # 每个进程每秒放行的批量流程数
+    SOP_TEMPLATE_CACHE_SIZE: int = int(os.getenv("SOP_TEMPLATE_CACHE_SIZE", "256"))  # 进程内缓存的已编译模板修订数
+
     # CORS配置
     BACKEND_CORS_ORIGINS: List[str] = [
         "http://localhost",
@@ -57,6 +148,7 @@ class Settings(BaseSettings):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.SQLALCHEMY_DATABASE_URI = f"postgresql://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_SERVER}/{self.POSTGRES_DB}"
+        self.SQLALCHEMY_ASYNC_DATABASE_URI = f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_SERVER}/{self.POSTGRES_DB}"
 
 
 settings = Settings() 
\ No newline at end of file
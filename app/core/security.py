@@ -1,5 +1,9 @@
+import base64
+import hashlib
+import hmac
+import json
 from datetime import datetime, timedelta
-from typing import Any, Optional, Union
+from typing import Any, Dict, Optional, Union
 
 from jose import jwt
 from passlib.context import CryptContext
@@ -33,4 +37,34 @@ def get_password_hash(password: str) -> str:
     """
     获取密码哈希
     """
-    return pwd_context.hash(password) 
\ No newline at end of file
+    return pwd_context.hash(password)
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+def _cursor_signature(body: str) -> str:
+    digest = hmac.new(settings.SECRET_KEY.encode("utf-8"), body.encode("ascii"), hashlib.sha256).digest()
+    return _b64encode(digest[:16])
+
+def encode_cursor(payload: Dict[str, Any]) -> str:
+    """
+    生成带签名的分页游标，客户端只能原样传回，无法伪造或修改
+    """
+    body = _b64encode(json.dumps(payload, separators=(",", ":"), sort_keys=True).encode("utf-8"))
+    return f"{body}.{_cursor_signature(body)}"
+
+def decode_cursor(cursor: str) -> Optional[Dict[str, Any]]:
+    """
+    校验并解析分页游标，签名不符或格式错误时返回None
+    """
+    body, _, signature = cursor.partition(".")
+    if not body or not hmac.compare_digest(signature, _cursor_signature(body)):
+        return None
+    try:
+        payload = json.loads(_b64decode(body))
+    except ValueError:
+        return None
+    return payload if isinstance(payload, dict) else None
@@ -0,0 +1,39 @@
+import asyncio
+import weakref
+
+import redis
+import redis.asyncio as aioredis
+
+from app.core.config import settings
+
+# 进程内共享的连接池，按是否解码响应区分
+_pools = {}
+# 异步连接绑定事件循环，按事件循环分别缓存（Celery Worker中每个任务使用独立的事件循环）
+_async_pools = weakref.WeakKeyDictionary()
+
+def _connection_kwargs(decode_responses: bool) -> dict:
+    return {
+        "host": settings.REDIS_HOST,
+        "port": settings.REDIS_PORT,
+        "db": settings.REDIS_DB,
+        "password": settings.REDIS_PASSWORD,
+        "decode_responses": decode_responses,
+    }
+
+def get_redis(decode_responses: bool = True) -> redis.Redis:
+    """获取同步Redis客户端，复用共享连接池"""
+    pool = _pools.get(decode_responses)
+    if pool is None:
+        pool = redis.ConnectionPool(**_connection_kwargs(decode_responses))
+        _pools[decode_responses] = pool
+    return redis.Redis(connection_pool=pool)
+
+def get_async_redis(decode_responses: bool = True) -> aioredis.Redis:
+    """获取异步Redis客户端，复用当前事件循环的共享连接池"""
+    loop = asyncio.get_running_loop()
+    pools = _async_pools.setdefault(loop, {})
+    pool = pools.get(decode_responses)
+    if pool is None:
+        pool = aioredis.ConnectionPool(**_connection_kwargs(decode_responses))
+        pools[decode_responses] = pool
+    return aioredis.Redis(connection_pool=pool)
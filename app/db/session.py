@@ -1,12 +1,35 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 from app.core.config import settings
 
-engine = create_engine(settings.SQLALCHEMY_DATABASE_URI, pool_pre_ping=True)
+# 连接池配置，同步和异步引擎共用
+_pool_kwargs = {
+    "pool_pre_ping": True,
+    "pool_size": settings.DB_POOL_SIZE,
+    "max_overflow": settings.DB_MAX_OVERFLOW,
+    "pool_recycle": settings.DB_POOL_RECYCLE,
+    "pool_timeout": settings.DB_POOL_TIMEOUT,
+}
+
+engine = create_engine(
+    settings.SQLALCHEMY_DATABASE_URI,
+    connect_args={"options": f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT}"},
+    **_pool_kwargs
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 异步引擎（asyncpg），供async接口使用，查询期间不阻塞事件循环
+async_engine = create_async_engine(
+    settings.SQLALCHEMY_ASYNC_DATABASE_URI,
+    connect_args={"server_settings": {"statement_timeout": str(settings.DB_STATEMENT_TIMEOUT)}},
+    **_pool_kwargs
+)
+# 提交后不过期对象，避免在异步上下文中访问属性时触发隐式IO
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 # 依赖项，用于获取数据库会话
@@ -15,4 +38,9 @@ def get_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+# 依赖项，用于获取异步数据库会话
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
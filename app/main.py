@@ -1,3 +1,5 @@
+import asyncio
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
@@ -6,6 +8,9 @@ from app.core.config import settings
 from app.api.endpoints import router as api_router
 from app.db.session import get_db
 from app.services.tool_manager.tool_service import register_example_tools
+from app.services.knowledge_manager import run_memory_flusher
+from app.services.tool_manager import tool_executor, tool_http_pool
+from app.services.sop_manager import sop_engine
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -39,6 +44,29 @@ def startup_event():
     db = next(get_db())
     register_example_tools(db)
 
+@app.on_event("startup")
+async def start_background_tasks():
+    """
+    启动后台任务
+    """
+    # 定期将即将过期的短期记忆归档到数据库
+    app.state.memory_flusher = asyncio.create_task(run_memory_flusher())
+    # 启动工具HTTP连接池和执行引擎
+    await tool_http_pool.start()
+    await tool_executor.start()
+    # 启动SOP执行引擎
+    await sop_engine.start()
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    """
+    应用关闭时停止后台任务
+    """
+    app.state.memory_flusher.cancel()
+    await sop_engine.stop()
+    await tool_executor.stop()
+    await tool_http_pool.stop()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
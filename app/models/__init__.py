@@ -2,7 +2,8 @@ from app.models.user import User, Role, Permission
 from app.models.task import Task, Subtask, Project, Tag, Attachment, Comment
 from app.models.tool import Tool, ToolInvocation, ToolApproval
 from app.models.knowledge import KnowledgeEntry, KnowledgeTag, KnowledgeEmbedding, ShortTermMemory
-from app.models.sop import SOPTemplate, SOPRun, SOPStepExecution
+from app.models.sop import SOPTemplate, SOPTemplateRevision, SOPRun, SOPRunBatch, SOPStepExecution, SOPRunEvent, SOPRunSnapshot
+from app.models.checkpoint import AgentCheckpoint, AgentCheckpointBlob, AgentCheckpointMessage, AgentCheckpointWrite
 
 # 导出所有模型，方便其他模块导入
 __all__ = [
@@ -10,5 +11,6 @@ __all__ = [
     "Task", "Subtask", "Project", "Tag", "Attachment", "Comment",
     "Tool", "ToolInvocation", "ToolApproval",
     "KnowledgeEntry", "KnowledgeTag", "KnowledgeEmbedding", "ShortTermMemory",
-    "SOPTemplate", "SOPRun", "SOPStepExecution"
+    "SOPTemplate", "SOPTemplateRevision", "SOPRun", "SOPRunBatch", "SOPStepExecution", "SOPRunEvent", "SOPRunSnapshot",
+    "AgentCheckpoint", "AgentCheckpointBlob", "AgentCheckpointMessage", "AgentCheckpointWrite"
 ] 
\ No newline at end of file
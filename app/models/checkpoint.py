@@ -0,0 +1,71 @@
+from sqlalchemy import Column, Integer, String, DateTime, LargeBinary, Index, UniqueConstraint
+from datetime import datetime
+
+from app.db.session import Base
+
+class AgentCheckpoint(Base):
+    """Agent工作流检查点模型（不含通道数据，通道数据按版本单独存储）"""
+    __tablename__ = "agent_checkpoints"
+    __table_args__ = (
+        UniqueConstraint("thread_id", "checkpoint_ns", "checkpoint_id", name="uq_agent_checkpoint"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    thread_id = Column(String, nullable=False, index=True)  # 对应任务ID
+    checkpoint_ns = Column(String, nullable=False, default="")
+    checkpoint_id = Column(String, nullable=False)
+    parent_checkpoint_id = Column(String, nullable=True)
+    checkpoint_type = Column(String, nullable=False)  # 序列化类型
+    checkpoint = Column(LargeBinary, nullable=False)
+    metadata_type = Column(String, nullable=False)
+    checkpoint_metadata = Column("metadata", LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class AgentCheckpointBlob(Base):
+    """检查点通道数据模型，每个通道的每个版本只写入一次"""
+    __tablename__ = "agent_checkpoint_blobs"
+    __table_args__ = (
+        UniqueConstraint("thread_id", "checkpoint_ns", "channel", "version", name="uq_agent_checkpoint_blob"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    thread_id = Column(String, nullable=False, index=True)
+    checkpoint_ns = Column(String, nullable=False, default="")
+    channel = Column(String, nullable=False)
+    version = Column(String, nullable=False)
+    value_type = Column(String, nullable=False)  # 序列化类型，empty表示通道为空
+    value = Column(LargeBinary, nullable=True)
+
+class AgentCheckpointMessage(Base):
+    """消息通道的单条消息模型，按内容摘要去重，通道版本只记录消息摘要列表"""
+    __tablename__ = "agent_checkpoint_messages"
+    __table_args__ = (
+        UniqueConstraint("thread_id", "checkpoint_ns", "channel", "digest", name="uq_agent_checkpoint_message"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    thread_id = Column(String, nullable=False, index=True)
+    checkpoint_ns = Column(String, nullable=False, default="")
+    channel = Column(String, nullable=False)
+    digest = Column(String, nullable=False)
+    value_type = Column(String, nullable=False)
+    value = Column(LargeBinary, nullable=True)
+
+class AgentCheckpointWrite(Base):
+    """检查点的待写入数据模型（节点已完成但检查点尚未提交的输出）"""
+    __tablename__ = "agent_checkpoint_writes"
+    __table_args__ = (
+        UniqueConstraint("thread_id", "checkpoint_ns", "checkpoint_id", "task_id", "idx", name="uq_agent_checkpoint_write"),
+        Index("ix_agent_checkpoint_writes_lookup", "thread_id", "checkpoint_ns", "checkpoint_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    thread_id = Column(String, nullable=False)
+    checkpoint_ns = Column(String, nullable=False, default="")
+    checkpoint_id = Column(String, nullable=False)
+    task_id = Column(String, nullable=False)
+    task_path = Column(String, nullable=False, default="")
+    idx = Column(Integer, nullable=False)
+    channel = Column(String, nullable=False)
+    value_type = Column(String, nullable=False)
+    value = Column(LargeBinary, nullable=True)
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Integer, String, Text, ForeignKey, DateTime, JSON, Table, Float, LargeBinary
+from sqlalchemy import Boolean, Column, Integer, String, Text, ForeignKey, DateTime, JSON, Table, Float, LargeBinary, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -43,10 +43,16 @@ class KnowledgeTag(Base):
 class KnowledgeEmbedding(Base):
     """知识向量嵌入模型"""
     __tablename__ = "knowledge_embeddings"
+    __table_args__ = (
+        Index("ix_knowledge_embedding_entry_model", "knowledge_id", "model", "chunk_index"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     knowledge_id = Column(Integer, ForeignKey("knowledge_entries.id"), nullable=False)
+    chunk_index = Column(Integer, nullable=False, default=0)  # 长文本切分后的分块序号
+    content_hash = Column(String(64), nullable=True, index=True)  # 分块内容的SHA-256，内容未变化时跳过重新嵌入
     embedding = Column(LargeBinary, nullable=False)  # 存储向量嵌入的二进制数据
+    dtype = Column(String(16), nullable=False, default="float32")  # 向量的存储精度，float32或float16
     model = Column(String, nullable=False)  # 使用的嵌入模型，如 "openai"
     created_at = Column(DateTime, default=datetime.utcnow)
 
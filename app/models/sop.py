@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Integer, String, Text, ForeignKey, DateTime, JSON
+from sqlalchemy import Boolean, Column, Integer, String, Text, ForeignKey, DateTime, JSON, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -12,6 +12,7 @@ class SOPTemplate(Base):
     name = Column(String, nullable=False)
     description = Column(Text, nullable=True)
     version = Column(String, nullable=False, default="1.0")
+    revision = Column(Integer, nullable=False, default=1)  # 内部修订号，模板每次修改时递增，已发布的修订不再变化
     creator_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -21,38 +22,88 @@ class SOPTemplate(Base):
     creator = relationship("User")
     runs = relationship("SOPRun", back_populates="template")
 
+class SOPTemplateRevision(Base):
+    """SOP模板修订模型，保存每个修订的步骤配置，执行中的流程按启动时的修订执行"""
+    __tablename__ = "sop_template_revisions"
+
+    template_id = Column(Integer, ForeignKey("sop_templates.id"), primary_key=True)
+    revision = Column(Integer, primary_key=True)
+    steps = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class SOPRun(Base):
     """SOP流程执行实例模型"""
     __tablename__ = "sop_runs"
 
     id = Column(String, primary_key=True)  # 使用UUID或自定义ID
     template_id = Column(Integer, ForeignKey("sop_templates.id"), nullable=False)
+    template_revision = Column(Integer, nullable=True)  # 启动时的模板修订号
+    batch_id = Column(String, ForeignKey("sop_run_batches.id"), nullable=True, index=True)  # 批量启动时所属的批次
     initiator_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    status = Column(String, nullable=False, default="running")  # running, completed, failed, canceled
+    status = Column(String, nullable=False, default="pending")  # queued（批量启动，等待放行）, pending, running, waiting（等待审批）, completed, failed, canceled
     context = Column(JSON, nullable=True)  # 执行上下文，JSON格式
     current_step = Column(Integer, nullable=True)  # 当前执行到的步骤序号
     started_at = Column(DateTime, default=datetime.utcnow)
     finished_at = Column(DateTime, nullable=True)
     result = Column(JSON, nullable=True)  # 执行结果，JSON格式
+    worker_id = Column(String, nullable=True)  # 认领该流程的引擎标识
+    lease_expires_at = Column(DateTime, nullable=True)  # 执行租约的到期时间，执行期间定期续约
 
     # 关系
     template = relationship("SOPTemplate", back_populates="runs")
     initiator = relationship("User")
     step_executions = relationship("SOPStepExecution", back_populates="sop_run")
 
+class SOPRunBatch(Base):
+    """SOP流程批次模型，同一模板按多个上下文批量启动"""
+    __tablename__ = "sop_run_batches"
+
+    id = Column(String, primary_key=True)
+    template_id = Column(Integer, ForeignKey("sop_templates.id"), nullable=False)
+    template_revision = Column(Integer, nullable=False)
+    initiator_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    total = Column(Integer, nullable=False)  # 批次中的流程数
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class SOPStepExecution(Base):
     """SOP步骤执行记录模型"""
     __tablename__ = "sop_step_executions"
 
     id = Column(Integer, primary_key=True, index=True)
-    sop_run_id = Column(String, ForeignKey("sop_runs.id"), nullable=False)
+    sop_run_id = Column(String, ForeignKey("sop_runs.id"), nullable=False, index=True)
     step_order = Column(Integer, nullable=False)  # 步骤序号
     step_name = Column(String, nullable=False)
-    status = Column(String, nullable=False, default="pending")  # pending, running, success, failed
+    status = Column(String, nullable=False, default="pending")  # pending, running, waiting（等待审批）, success, failed, skipped, canceled
     started_at = Column(DateTime, nullable=True)
     ended_at = Column(DateTime, nullable=True)
     result = Column(JSON, nullable=True)  # 步骤执行结果，JSON格式
     error = Column(Text, nullable=True)  # 错误信息
 
     # 关系
-    sop_run = relationship("SOPRun", back_populates="step_executions") 
\ No newline at end of file
+    sop_run = relationship("SOPRun", back_populates="step_executions")
+
+class SOPRunEvent(Base):
+    """SOP流程事件模型，只追加不修改"""
+    __tablename__ = "sop_run_events"
+    __table_args__ = (UniqueConstraint("sop_run_id", "seq", name="uq_sop_run_events_run_seq"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    sop_run_id = Column(String, ForeignKey("sop_runs.id"), nullable=False)
+    seq = Column(Integer, nullable=False)  # 流程内递增的事件序号
+    type = Column(String, nullable=False)  # run_created, run_started, step_started, step_succeeded, step_failed, run_completed, run_failed, run_canceled等
+    step_order = Column(Integer, nullable=True)  # 涉及单个步骤时的步骤序号
+    payload = Column(JSON, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class SOPRunSnapshot(Base):
+    """SOP流程状态快照模型，与事件在同一事务中更新"""
+    __tablename__ = "sop_run_snapshots"
+
+    sop_run_id = Column(String, ForeignKey("sop_runs.id"), primary_key=True)
+    status = Column(String, nullable=False)
+    current_step = Column(Integer, nullable=True)
+    step_counts = Column(JSON, nullable=False, default=dict)  # 各状态的步骤数，如 {"success": 3, "running": 2}
+    last_error = Column(Text, nullable=True)  # 最近一次错误信息
+    last_seq = Column(Integer, nullable=False, default=0)  # 已应用的最后一个事件序号
+    state = Column(JSON, nullable=False)  # 渲染流程状态所需的全部数据
+    updated_at = Column(DateTime, default=datetime.utcnow)
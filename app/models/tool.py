@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Integer, String, Text, ForeignKey, DateTime, JSON
+from sqlalchemy import Boolean, Column, Float, Integer, String, Text, ForeignKey, DateTime, JSON
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -17,6 +17,10 @@ class Tool(Base):
     auth_info = Column(JSON, nullable=True)  # 认证信息，JSON格式
     required_role = Column(String, nullable=True)  # 使用该工具所需的最低角色
     status = Column(String, nullable=False, default="active")  # active, inactive
+    timeout = Column(Float, nullable=True)  # API调用超时时间（秒），为空时使用默认值
+    cache_ttl = Column(Integer, nullable=True)  # 结果缓存时间（秒），为空表示不缓存，仅用于结果确定的工具
+    version = Column(Integer, nullable=False, default=1)  # 工具版本，实现变化时递增，使旧的缓存结果失效
+    requires_approval = Column(Boolean, nullable=False, default=False)  # SOP流程调用该工具前是否需要人工审批
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -41,6 +45,7 @@ class ToolInvocation(Base):
     error = Column(Text, nullable=True)  # 错误信息
     started_at = Column(DateTime, default=datetime.utcnow)
     finished_at = Column(DateTime, nullable=True)
+    cache_hit = Column(Boolean, nullable=False, default=False)  # 结果是否来自缓存
     
     # MCP相关字段
     context_id = Column(String, nullable=True)  # MCP上下文ID
@@ -51,15 +56,21 @@ class ToolInvocation(Base):
     user = relationship("User")
 
 class ToolApproval(Base):
-    """工具调用审批模型"""
+    """工具调用审批模型，也用于SOP流程中的人工审批步骤"""
     __tablename__ = "tool_approvals"
 
     id = Column(Integer, primary_key=True, index=True)
-    tool_id = Column(Integer, ForeignKey("tools.id"), nullable=False)
+    tool_id = Column(Integer, ForeignKey("tools.id"), nullable=True)  # 人工审批步骤不涉及工具时为空
     requester_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     approver_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     reason = Column(Text, nullable=True)  # 申请理由
-    status = Column(String, nullable=False, default="pending")  # pending, approved, rejected
+    status = Column(String, nullable=False, default="pending")  # pending, approved, rejected, canceled
+    comment = Column(Text, nullable=True)  # 审批意见
+    # SOP流程中的审批：审批通过后从该步骤继续执行
+    sop_run_id = Column(String, ForeignKey("sop_runs.id"), nullable=True, index=True)
+    step_order = Column(Integer, nullable=True)
+    assignee_role = Column(String, nullable=True)  # 负责审批的角色
+    payload = Column(JSON, nullable=True)  # 恢复执行所需的数据，如已渲染的工具调用参数
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     approved_at = Column(DateTime, nullable=True)
@@ -1,5 +1,5 @@
 from typing import List, Optional, Dict, Any
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
 
 class ShortTermMemoryCreate(BaseModel):
@@ -43,6 +43,21 @@ class KnowledgeCreate(KnowledgeBase):
     """知识条目创建模型"""
     tags: Optional[List[str]] = None  # 标签名称列表
 
+class KnowledgeBulkCreate(BaseModel):
+    """知识条目批量创建模型"""
+    entries: List[KnowledgeCreate] = Field(..., min_length=1, max_length=10000)
+
+class KnowledgeBulkResponse(BaseModel):
+    """知识条目批量创建响应模型"""
+    knowledge_ids: List[int]
+    documents: int
+    chunks_embedded: int  # 新生成嵌入的分块数
+    chunks_skipped: int  # 内容未变化而跳过的分块数
+    chunks_deleted: int
+    embedding_calls: int
+    elapsed: float  # 耗时（秒）
+    docs_per_sec: float
+
 class KnowledgeUpdate(BaseModel):
     """知识条目更新模型"""
     title: Optional[str] = None
@@ -1,5 +1,5 @@
 from typing import List, Optional, Dict, Any
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
 
 class SOPStepBase(BaseModel):
@@ -9,7 +9,8 @@ class SOPStepBase(BaseModel):
     action: str  # invoke_tool, manual_approval, etc.
     params: Optional[Dict[str, Any]] = None
     assignee_role: Optional[str] = None
-    timeout: Optional[int] = None
+    timeout: Optional[int] = None  # 步骤超时时间（秒）
+    depends_on: Optional[List[int]] = None  # 依赖的步骤序号，为空时依赖前一个步骤，空列表表示无依赖
 
 class SOPTemplateBase(BaseModel):
     """SOP模板基础模型"""
@@ -31,6 +32,7 @@ class SOPTemplateUpdate(BaseModel):
 class SOPTemplateResponse(SOPTemplateBase):
     """SOP模板响应模型"""
     id: int
+    revision: int = 1
     creator_id: int
     steps: List[SOPStepBase]
     created_at: datetime
@@ -48,6 +50,7 @@ class SOPStepExecutionResponse(BaseModel):
     ended_at: Optional[datetime] = None
     result: Optional[Dict[str, Any]] = None
     error: Optional[str] = None
+    seq: Optional[int] = None  # 该步骤最后一次变化的事件序号
 
     class Config:
         from_attributes = True
@@ -57,10 +60,27 @@ class SOPRunCreate(BaseModel):
     template_id: int
     context: Optional[Dict[str, Any]] = None
 
+class SOPRunBatchCreate(BaseModel):
+    """SOP流程批量启动模型，每个上下文启动一个流程"""
+    template_id: int
+    contexts: List[Dict[str, Any]] = Field(..., min_length=1)
+
+class SOPRunBatchResponse(BaseModel):
+    """SOP流程批次响应模型，给出批次的整体进度"""
+    id: str
+    template_id: int
+    template_revision: int
+    total: int
+    created_at: datetime
+    status_counts: Dict[str, int]  # 各状态的流程数
+    finished: int  # 已结束（完成、失败、取消）的流程数
+    progress: float  # 已结束的比例，0~1
+
 class SOPRunResponse(BaseModel):
     """SOP流程执行响应模型"""
     id: str
     template_id: int
+    template_revision: Optional[int] = None
     initiator_id: int
     status: str
     current_step: Optional[int] = None
@@ -69,6 +89,21 @@ class SOPRunResponse(BaseModel):
     started_at: datetime
     finished_at: Optional[datetime] = None
     result: Optional[Dict[str, Any]] = None
+    # 快照信息
+    seq: int = 0  # 已应用的最后一个事件序号，可作为下次查询的since
+    step_counts: Optional[Dict[str, int]] = None
+    last_error: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+class SOPRunEventResponse(BaseModel):
+    """SOP流程事件响应模型"""
+    seq: int
+    type: str
+    step_order: Optional[int] = None
+    payload: Optional[Dict[str, Any]] = None
+    created_at: datetime
 
     class Config:
         from_attributes = True 
\ No newline at end of file
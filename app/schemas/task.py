@@ -103,12 +103,14 @@ class TaskExecutionRequest(BaseModel):
     parameters: Optional[Dict[str, Any]] = Field(None, description="执行参数")
     use_reflection: bool = Field(False, description="是否使用反思Agent")
     use_siliconflow: bool = Field(False, description="是否使用硅基流动模型")
+    priority: Optional[str] = Field(None, description="覆盖任务本身的优先级，为空时按任务的优先级选择队列")
 
 class TaskExecutionResponse(BaseModel):
     """任务执行响应模型"""
     task_id: str = Field(..., description="任务ID")
     status: str = Field(..., description="执行状态")
     message: str = Field(..., description="执行消息")
+    queue: Optional[str] = Field(None, description="投递的队列")
 
 class TaskExecutionResult(BaseModel):
     """任务执行结果模型"""
@@ -146,5 +148,7 @@ class AgentComparisonResult(BaseModel):
     task_description: str = Field(..., description="任务描述")
     standard_agent: Dict[str, Any] = Field(..., description="标准Agent结果")
     reflection_agent: Dict[str, Any] = Field(..., description="反思Agent结果")
+    siliconflow_agent: Optional[Dict[str, Any]] = Field(None, description="硅基流动模型Agent结果")
     total_time: float = Field(..., description="总执行时间(秒)")
+    report: Optional[Dict[str, Any]] = Field(None, description="比较报告（各Agent耗时、token用量、工具调用数和步骤数）")
     timestamp: str = Field(..., description="时间戳") 
\ No newline at end of file
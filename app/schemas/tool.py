@@ -10,6 +10,9 @@ class ToolBase(BaseModel):
     description: Optional[str] = None
     auth_type: Optional[str] = None
     required_role: Optional[str] = None
+    timeout: Optional[float] = Field(None, gt=0, description="API调用超时时间（秒）")
+    cache_ttl: Optional[int] = Field(None, ge=0, description="结果缓存时间（秒），仅用于结果确定的工具")
+    requires_approval: bool = Field(False, description="SOP流程调用该工具前是否需要人工审批")
     # MCP相关字段
     input_schema: Optional[Dict[str, Any]] = None
     capabilities: Optional[List[str]] = None
@@ -27,6 +30,10 @@ class ToolUpdate(BaseModel):
     auth_info: Optional[Dict[str, Any]] = None
     required_role: Optional[str] = None
     status: Optional[str] = None
+    timeout: Optional[float] = Field(None, gt=0)
+    cache_ttl: Optional[int] = Field(None, ge=0)
+    requires_approval: Optional[bool] = None
+    version: Optional[int] = None
     # MCP相关字段
     input_schema: Optional[Dict[str, Any]] = None
     capabilities: Optional[List[str]] = None
@@ -35,6 +42,7 @@ class ToolResponse(ToolBase):
     """工具响应模型"""
     id: int
     status: str
+    version: int = 1
     created_at: datetime
     updated_at: datetime
 
@@ -57,6 +65,7 @@ class ToolInvocationResponse(BaseModel):
     error: Optional[str] = None
     started_at: datetime
     finished_at: Optional[datetime] = None
+    cache_hit: bool = False
     # MCP相关字段
     context_id: Optional[str] = None
     client_id: Optional[str] = None
@@ -64,6 +73,31 @@ class ToolInvocationResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class ToolBatchInvokeItem(BaseModel):
+    """批量调用中的单个调用"""
+    tool_id: int
+    params: Dict[str, Any]
+
+class ToolBatchInvoke(BaseModel):
+    """工具批量调用请求模型"""
+    calls: List[ToolBatchInvokeItem] = Field(..., min_length=1)
+    wait: float = Field(0, ge=0, description="等待结果的最长时间（秒），0表示提交后立即返回")
+
+class ToolBatchResultItem(BaseModel):
+    """批量调用中单个调用的结果"""
+    index: int  # 在请求中的序号
+    tool_id: Optional[int] = None
+    invoke_id: Optional[str] = None
+    status: str  # running, success, failed
+    output: Optional[Any] = None
+    error: Optional[str] = None
+    cache_hit: bool = False
+    finished_at: Optional[datetime] = None
+
+class ToolBatchInvokeResponse(BaseModel):
+    """工具批量调用响应模型"""
+    results: List[ToolBatchResultItem]
+
 # MCP特定模型
 class MCPToolDefinition(BaseModel):
     """MCP工具定义模型"""
@@ -85,10 +119,22 @@ class MCPToolCallRequest(BaseModel):
 class MCPToolCallResponse(BaseModel):
     """MCP工具调用响应"""
     content: List[Dict[str, Any]]
+    isError: bool = False
+    # 非标准字段：调用ID和状态，调用未在等待时间内完成时可据此查询结果
+    invokeId: Optional[str] = None
+    status: Optional[str] = None
+
+class MCPToolBatchCallRequest(BaseModel):
+    """MCP工具批量调用请求"""
+    calls: List[MCPToolCallRequest] = Field(..., min_length=1)
+
+class MCPToolBatchCallResponse(BaseModel):
+    """MCP工具批量调用响应，与请求顺序一致"""
+    results: List[MCPToolCallResponse]
 
 class ToolApprovalBase(BaseModel):
     """工具审批基础模型"""
-    tool_id: int
+    tool_id: Optional[int] = None
     reason: Optional[str] = None
 
 class ToolApprovalCreate(ToolApprovalBase):
@@ -100,12 +146,22 @@ class ToolApprovalUpdate(BaseModel):
     status: str
     approver_id: int
 
+class ToolApprovalDecision(BaseModel):
+    """审批决定"""
+    approved: bool
+    comment: Optional[str] = None
+
 class ToolApprovalResponse(ToolApprovalBase):
     """工具审批响应模型"""
     id: int
     requester_id: int
     approver_id: Optional[int] = None
     status: str
+    comment: Optional[str] = None
+    sop_run_id: Optional[str] = None
+    step_order: Optional[int] = None
+    assignee_role: Optional[str] = None
+    payload: Optional[Dict[str, Any]] = None
     created_at: datetime
     updated_at: datetime
     approved_at: Optional[datetime] = None
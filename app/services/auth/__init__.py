@@ -1 +1 @@
-from app.services.auth.auth_service import authenticate_user, create_access_token, get_current_user, get_password_hash, verify_password 
\ No newline at end of file
+from app.services.auth.auth_service import authenticate_user, aauthenticate_user, create_access_token, get_current_user, get_password_hash, verify_password 
\ No newline at end of file
@@ -1,3 +1,4 @@
+import asyncio
 from datetime import datetime, timedelta
 from typing import Optional, Union
 
@@ -5,10 +6,12 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
 
 from app.core.config import settings
-from app.db.session import get_db
+from app.db.session import get_async_db
 from app.models.user import User
 
 # 密码哈希工具
@@ -34,6 +37,16 @@ def authenticate_user(db: Session, username: str, password: str) -> Optional[Use
         return None
     return user
 
+async def aauthenticate_user(db: AsyncSession, username: str, password: str) -> Optional[User]:
+    """验证用户（异步版本，密码校验在线程中执行，不阻塞事件循环）"""
+    result = await db.execute(select(User).where(User.username == username))
+    user = result.scalars().first()
+    if not user:
+        return None
+    if not await asyncio.to_thread(verify_password, password, user.hashed_password):
+        return None
+    return user
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """创建访问令牌"""
     to_encode = data.copy()
@@ -46,7 +59,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 async def get_current_user(
-    db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)
+    db: AsyncSession = Depends(get_async_db), token: str = Depends(oauth2_scheme)
 ) -> User:
     """获取当前用户"""
     credentials_exception = HTTPException(
@@ -62,7 +75,11 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
     
-    user = db.query(User).filter(User.username == username).first()
+    # 预加载角色，会话关闭后接口仍可读取用户角色
+    result = await db.execute(
+        select(User).options(selectinload(User.roles)).where(User.username == username)
+    )
+    user = result.scalars().first()
     if user is None:
         raise credentials_exception
     return user 
\ No newline at end of file
@@ -0,0 +1,16 @@
+from app.services.knowledge_manager.knowledge_service import (
+    add_knowledge,
+    search_knowledge,
+    search_knowledge_for_agent,
+    get_knowledge_entry
+)
+from app.services.knowledge_manager.memory_service import (
+    store_short_term_memory,
+    get_short_term_memory,
+    flush_expiring_memories,
+    run_memory_flusher
+)
+from app.services.knowledge_manager.ingestion import (
+    ingest_entries,
+    bulk_add_knowledge
+)
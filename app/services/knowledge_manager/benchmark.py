@@ -0,0 +1,120 @@
+"""
+知识库检索基准测试
+比较仅向量检索、仅关键词检索和混合检索的召回率（recall@k）与延迟（p50/p95）
+
+用法:
+    python -m app.services.knowledge_manager.benchmark --top-k 10 --samples 200
+    python -m app.services.knowledge_manager.benchmark --queries queries.jsonl
+
+查询文件每行一个JSON对象: {"query": "...", "relevant_ids": [1, 2]}；
+未指定查询文件时，从知识库中随机抽取条目，以其正文中的片段作为查询，该条目即为相关结果
+"""
+
+import argparse
+import json
+import random
+import time
+from typing import Any, Dict, List, Sequence, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.db.session import SessionLocal
+from app.models.knowledge import KnowledgeEntry
+from app.services.knowledge_manager.knowledge_service import SEARCH_MODES, search_knowledge
+
+# 合成查询截取的正文片段长度
+QUERY_LENGTH = 24
+
+
+def load_queries(path: str) -> List[Tuple[str, set]]:
+    """从JSONL文件读取查询及其相关条目ID"""
+    queries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                queries.append((item["query"], set(item["relevant_ids"])))
+    return queries
+
+
+def sample_queries(db: Session, samples: int, seed: int = 42) -> List[Tuple[str, set]]:
+    """从知识库随机抽取条目生成查询"""
+    rng = random.Random(seed)
+    total = db.execute(select(func.count()).select_from(KnowledgeEntry)).scalar_one()
+    if not total:
+        return []
+    offsets = rng.sample(range(total), min(samples, total))
+    queries = []
+    for offset in offsets:
+        entry = db.execute(
+            select(KnowledgeEntry.id, KnowledgeEntry.content).order_by(KnowledgeEntry.id).offset(offset).limit(1)
+        ).first()
+        content = entry.content or ""
+        start = rng.randrange(max(len(content) - QUERY_LENGTH, 0) + 1)
+        queries.append((content[start:start + QUERY_LENGTH], {entry.id}))
+    return queries
+
+
+def _percentile(values: Sequence[float], percentile: float) -> float:
+    ordered = sorted(values)
+    index = min(int(round(percentile / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def run_benchmark(db: Session, queries: List[Tuple[str, set]], top_k: int, modes: Sequence[str] = SEARCH_MODES) -> Dict[str, Dict[str, Any]]:
+    """
+    执行基准测试
+
+    Args:
+        db: 数据库会话
+        queries: (查询, 相关条目ID集合) 列表
+        top_k: 计算召回率的k
+        modes: 参与比较的检索模式
+
+    Returns:
+        各检索模式的 recall@k 以及延迟分位数（毫秒）
+    """
+    report = {}
+    for mode in modes:
+        # 预热，排除索引首次加载的耗时
+        search_knowledge(db, queries[0][0], top_k=top_k, mode=mode)
+        latencies, recalls = [], []
+        for query, relevant in queries:
+            start = time.perf_counter()
+            results = search_knowledge(db, query, top_k=top_k, mode=mode)
+            latencies.append((time.perf_counter() - start) * 1000)
+            found = {result["knowledge_id"] for result in results}
+            recalls.append(len(found & relevant) / len(relevant))
+        report[mode] = {
+            f"recall@{top_k}": round(sum(recalls) / len(recalls), 4),
+            "p50_ms": round(_percentile(latencies, 50), 2),
+            "p95_ms": round(_percentile(latencies, 95), 2),
+            "queries": len(queries)
+        }
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="知识库检索基准测试")
+    parser.add_argument("--queries", help="查询文件（JSONL），不指定时从知识库抽样生成")
+    parser.add_argument("--samples", type=int, default=200, help="抽样生成的查询数量")
+    parser.add_argument("--top-k", type=int, default=10, help="计算recall@k的k")
+    parser.add_argument("--modes", nargs="+", default=list(SEARCH_MODES), choices=SEARCH_MODES, help="参与比较的检索模式")
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        queries = load_queries(args.queries) if args.queries else sample_queries(db, args.samples)
+        if not queries:
+            print("没有可用的查询，请先向知识库添加条目")
+            return
+        report = run_benchmark(db, queries, args.top_k, args.modes)
+
+    recall_key = f"recall@{args.top_k}"
+    print(f"{'模式':<10}{recall_key:>12}{'p50(ms)':>12}{'p95(ms)':>12}")
+    for mode, row in report.items():
+        print(f"{mode:<10}{row[recall_key]:>12.4f}{row['p50_ms']:>12.2f}{row['p95_ms']:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
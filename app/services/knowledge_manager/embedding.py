@@ -0,0 +1,121 @@
+"""
+文本向量嵌入模型
+提供基于OpenAI接口的嵌入模型，以及不依赖外部服务、结果确定的本地哈希嵌入模型（用于开发和测试）
+"""
+
+import hashlib
+import re
+import threading
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from app.core.config import settings
+
+# OpenAI嵌入模型的向量维度
+OPENAI_EMBEDDING_DIMS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+
+# 英文单词/数字，或单个中日韩字符
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+|[一-鿿぀-ヿ가-힯]")
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """按行做L2归一化，使内积等价于余弦相似度"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class EmbeddingModel:
+    """嵌入模型基类"""
+
+    name: str = ""
+    dim: int = 0
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        批量生成文本向量
+
+        Args:
+            texts: 文本列表
+
+        Returns:
+            形状为 (len(texts), dim) 的float32矩阵，已做L2归一化
+        """
+        raise NotImplementedError
+
+    def embed_query(self, text: str) -> np.ndarray:
+        """生成单条查询文本的向量"""
+        return self.embed([text])[0]
+
+
+class HashingEmbeddingModel(EmbeddingModel):
+    """
+    本地哈希嵌入模型
+    将词元（英文单词、中文单字及相邻字组成的二元组）哈希到固定维度并带符号累加，
+    相同输入始终得到相同向量
+    """
+
+    def __init__(self, dim: Optional[int] = None):
+        self.dim = dim or settings.EMBEDDING_DIM
+        self.name = f"hashing-{self.dim}"
+
+    @staticmethod
+    def _features(text: str) -> List[str]:
+        tokens = _TOKEN_PATTERN.findall(text.lower())
+        # 加入相邻词元组成的二元组，保留一定的词序信息
+        return tokens + [a + b for a, b in zip(tokens, tokens[1:])]
+
+    def _embed_one(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in self._features(text):
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            sign = 1.0 if value >> 63 else -1.0
+            vector[value % self.dim] += sign
+        return vector
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return normalize(np.stack([self._embed_one(text) for text in texts]))
+
+
+class OpenAIEmbeddingModel(EmbeddingModel):
+    """OpenAI嵌入模型"""
+
+    def __init__(self, model: str):
+        from openai import OpenAI
+
+        self.name = model
+        self.dim = OPENAI_EMBEDDING_DIMS.get(model, settings.EMBEDDING_DIM)
+        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        response = self.client.embeddings.create(model=self.name, input=list(texts))
+        data = sorted(response.data, key=lambda item: item.index)
+        return normalize(np.array([item.embedding for item in data], dtype=np.float32))
+
+
+_model: Optional[EmbeddingModel] = None
+_model_lock = threading.Lock()
+
+
+def get_embedding_model() -> EmbeddingModel:
+    """获取进程内共享的嵌入模型"""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                if settings.EMBEDDING_MODEL == "hashing":
+                    _model = HashingEmbeddingModel()
+                else:
+                    _model = OpenAIEmbeddingModel(settings.EMBEDDING_MODEL)
+    return _model
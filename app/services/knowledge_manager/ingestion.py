@@ -0,0 +1,343 @@
+"""
+知识条目批量嵌入导入
+长文本按段落/句子切分为分块，以分块内容的SHA-256跳过未变化的分块；
+待嵌入的分块去重后分批调用嵌入模型，嵌入结果按批批量写入数据库并加入向量索引
+
+用法:
+    python -m app.services.knowledge_manager.ingestion --reindex
+    python -m app.services.knowledge_manager.ingestion --file docs.jsonl --creator-id 1
+
+导入文件每行一个JSON对象: {"title": "...", "content": "...", "source": "...", "tags": ["..."]}
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import re
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.knowledge import KnowledgeEmbedding, KnowledgeEntry, KnowledgeTag, knowledge_tag
+from app.schemas.knowledge import KnowledgeCreate
+from app.services.knowledge_manager.embedding import EmbeddingModel, get_embedding_model
+from app.services.knowledge_manager.lexical_index import get_lexical_index
+from app.services.knowledge_manager.vector_index import encode_embedding, get_vector_index
+
+logger = logging.getLogger(__name__)
+
+# 优先在段落、句子边界处切分
+_SPLIT_PATTERN = re.compile(r"(?<=[\n。！？；!?;])|(?<=\. )")
+
+
+@dataclass
+class IngestionStats:
+    """导入统计"""
+    documents: int = 0
+    chunks_embedded: int = 0
+    chunks_skipped: int = 0
+    chunks_deleted: int = 0
+    embedding_calls: int = 0
+    elapsed: float = 0.0
+    knowledge_ids: List[int] = field(default_factory=list)
+
+    @property
+    def docs_per_sec(self) -> float:
+        return round(self.documents / self.elapsed, 2) if self.elapsed > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, object]:
+        result = asdict(self)
+        result["elapsed"] = round(self.elapsed, 3)
+        result["docs_per_sec"] = self.docs_per_sec
+        return result
+
+
+def chunk_text(text: str, size: Optional[int] = None, overlap: Optional[int] = None) -> List[str]:
+    """
+    将长文本切分为分块，尽量在段落和句子边界处切分，相邻分块保留少量重叠
+
+    Args:
+        text: 原文
+        size: 分块的最大字符数
+        overlap: 相邻分块重叠的字符数
+
+    Returns:
+        分块列表，短文本只有一个分块
+    """
+    size = size or settings.KNOWLEDGE_CHUNK_SIZE
+    overlap = min(overlap if overlap is not None else settings.KNOWLEDGE_CHUNK_OVERLAP, size // 2)
+    text = (text or "").strip()
+    if len(text) <= size:
+        return [text]
+
+    # 超长的句子直接按长度截断
+    pieces: List[str] = []
+    for piece in _SPLIT_PATTERN.split(text):
+        while len(piece) > size:
+            pieces.append(piece[:size])
+            piece = piece[size:]
+        if piece:
+            pieces.append(piece)
+
+    chunks: List[str] = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) > size:
+            chunks.append(current.strip())
+            current = current[-overlap:] if overlap else ""
+        current += piece
+    if current.strip():
+        chunks.append(current.strip())
+    return chunks
+
+
+def content_hash(model_name: str, text: str) -> str:
+    """分块内容哈希，包含模型名称，切换模型后会重新嵌入"""
+    return hashlib.sha256(f"{model_name}\x00{text}".encode("utf-8")).hexdigest()
+
+
+def _iter_entry_batches(db: Session, entry_ids: Optional[Sequence[int]], batch_size: int) -> Iterable[List[Tuple[int, str, str]]]:
+    """按ID顺序分批读取知识条目"""
+    if entry_ids is not None:
+        ids = sorted(set(entry_ids))
+        for i in range(0, len(ids), batch_size):
+            yield db.execute(
+                select(KnowledgeEntry.id, KnowledgeEntry.title, KnowledgeEntry.content)
+                .where(KnowledgeEntry.id.in_(ids[i:i + batch_size]))
+                .order_by(KnowledgeEntry.id)
+            ).all()
+        return
+
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(KnowledgeEntry.id, KnowledgeEntry.title, KnowledgeEntry.content)
+            .where(KnowledgeEntry.id > last_id)
+            .order_by(KnowledgeEntry.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+
+
+def _embed_unique(model: EmbeddingModel, texts: List[str], stats: IngestionStats) -> Dict[str, np.ndarray]:
+    """对去重后的文本分批调用嵌入模型，返回 文本 -> 向量"""
+    unique = list(dict.fromkeys(texts))
+    vectors: Dict[str, np.ndarray] = {}
+    batch_size = settings.EMBEDDING_BATCH_SIZE
+    for i in range(0, len(unique), batch_size):
+        batch = unique[i:i + batch_size]
+        for text, vector in zip(batch, model.embed(batch)):
+            vectors[text] = vector
+        stats.embedding_calls += 1
+    return vectors
+
+
+def _ingest_batch(db: Session, rows: Sequence[Tuple[int, str, str]], model: EmbeddingModel, force: bool, stats: IngestionStats) -> None:
+    """处理一批知识条目：对比分块哈希，嵌入变化的分块，并在一个事务中写入"""
+    knowledge_ids = [row.id for row in rows]
+    existing: Dict[Tuple[int, int], Tuple[int, Optional[str]]] = {
+        (item.knowledge_id, item.chunk_index): (item.id, item.content_hash)
+        for item in db.execute(
+            select(KnowledgeEmbedding.id, KnowledgeEmbedding.knowledge_id, KnowledgeEmbedding.chunk_index, KnowledgeEmbedding.content_hash)
+            .where(KnowledgeEmbedding.knowledge_id.in_(knowledge_ids), KnowledgeEmbedding.model == model.name)
+        ).all()
+    }
+
+    pending: List[Tuple[int, int, str, str]] = []  # (知识条目ID, 分块序号, 内容哈希, 嵌入文本)
+    stale_ids: List[int] = []
+    for row in rows:
+        chunks = chunk_text(row.content)
+        for chunk_index, chunk in enumerate(chunks):
+            # 标题参与每个分块的嵌入，保证分块脱离上下文时仍可被检索到
+            text = f"{row.title}\n{chunk}"
+            digest = content_hash(model.name, text)
+            current = existing.pop((row.id, chunk_index), None)
+            if current is not None and current[1] == digest and not force:
+                stats.chunks_skipped += 1
+                continue
+            if current is not None:
+                stale_ids.append(current[0])
+            pending.append((row.id, chunk_index, digest, text))
+    # 条目变短后多余的旧分块
+    stale_ids.extend(embedding_id for embedding_id, _ in existing.values())
+    stats.documents += len(rows)
+
+    if not pending and not stale_ids:
+        return
+
+    vectors = _embed_unique(model, [text for _, _, _, text in pending], stats)
+    dtype = settings.EMBEDDING_STORAGE_DTYPE
+    new_ids: List[int] = []
+    if stale_ids:
+        db.execute(delete(KnowledgeEmbedding).where(KnowledgeEmbedding.id.in_(stale_ids)))
+    if pending:
+        new_ids = list(db.execute(
+            insert(KnowledgeEmbedding).returning(KnowledgeEmbedding.id, sort_by_parameter_order=True),
+            [
+                {
+                    "knowledge_id": knowledge_id,
+                    "chunk_index": chunk_index,
+                    "content_hash": digest,
+                    "embedding": encode_embedding(vectors[text], dtype),
+                    "dtype": dtype,
+                    "model": model.name
+                }
+                for knowledge_id, chunk_index, digest, text in pending
+            ]
+        ).scalars())
+    db.commit()
+    stats.chunks_embedded += len(pending)
+    stats.chunks_deleted += len(stale_ids)
+
+    # 被删除的旧分块同时从向量索引中移除，避免占用检索的候选名额
+    if stale_ids:
+        get_vector_index(db).remove(db, stale_ids)
+    if new_ids:
+        matrix = np.stack([vectors[text] for _, _, _, text in pending])
+        # 与数据库中存储的精度保持一致
+        matrix = matrix.astype(dtype).astype(np.float32)
+        get_vector_index(db).add(db, new_ids, matrix)
+
+
+def ingest_entries(
+    db: Session,
+    entry_ids: Optional[Sequence[int]] = None,
+    force: bool = False,
+    batch_size: Optional[int] = None
+) -> IngestionStats:
+    """
+    为知识条目生成向量嵌入
+
+    Args:
+        db: 数据库会话
+        entry_ids: 需要处理的知识条目ID，为None时处理全部条目
+        force: 是否忽略内容哈希，强制重新嵌入
+        batch_size: 每个事务处理的条目数
+
+    Returns:
+        导入统计
+    """
+    model = get_embedding_model()
+    stats = IngestionStats()
+    start = time.perf_counter()
+    for rows in _iter_entry_batches(db, entry_ids, batch_size or settings.KNOWLEDGE_INGEST_BATCH_SIZE):
+        _ingest_batch(db, rows, model, force, stats)
+        logger.info(f"知识条目嵌入进度: {stats.documents}个文档, 新嵌入{stats.chunks_embedded}个分块, 跳过{stats.chunks_skipped}个分块")
+    stats.elapsed = time.perf_counter() - start
+    logger.info(f"知识条目嵌入完成: {stats.documents}个文档, 耗时{stats.elapsed:.2f}秒, {stats.docs_per_sec}文档/秒")
+    return stats
+
+
+def _tag_ids(db: Session, names: Iterable[str]) -> Dict[str, int]:
+    """批量获取标签ID，不存在的标签自动创建"""
+    names = sorted({name.strip() for name in names if name and name.strip()})
+    if not names:
+        return {}
+    tag_ids = dict(db.execute(select(KnowledgeTag.name, KnowledgeTag.id).where(KnowledgeTag.name.in_(names))).all())
+    missing = [name for name in names if name not in tag_ids]
+    if missing:
+        created = db.execute(
+            insert(KnowledgeTag).returning(KnowledgeTag.name, KnowledgeTag.id, sort_by_parameter_order=True),
+            [{"name": name} for name in missing]
+        ).all()
+        tag_ids.update(dict(created))
+    return tag_ids
+
+
+def bulk_add_knowledge(db: Session, entries: Sequence[KnowledgeCreate], user_id: int, batch_size: Optional[int] = None) -> IngestionStats:
+    """
+    批量添加知识条目并生成向量嵌入
+
+    Args:
+        db: 数据库会话
+        entries: 知识条目列表
+        user_id: 创建者ID
+        batch_size: 每个事务处理的条目数
+
+    Returns:
+        导入统计，knowledge_ids 与输入顺序一致
+    """
+    batch_size = batch_size or settings.KNOWLEDGE_INGEST_BATCH_SIZE
+    start = time.perf_counter()
+    stats = IngestionStats()
+    model = get_embedding_model()
+    lexical_index = get_lexical_index(db)
+
+    for i in range(0, len(entries), batch_size):
+        batch = entries[i:i + batch_size]
+        tag_ids = _tag_ids(db, (tag for entry in batch for tag in entry.tags or []))
+        knowledge_ids = list(db.execute(
+            insert(KnowledgeEntry).returning(KnowledgeEntry.id, sort_by_parameter_order=True),
+            [
+                {"title": entry.title, "content": entry.content, "source": entry.source, "creator_id": user_id}
+                for entry in batch
+            ]
+        ).scalars())
+        links = {
+            (knowledge_id, tag_ids[tag.strip()])
+            for knowledge_id, entry in zip(knowledge_ids, batch)
+            for tag in entry.tags or []
+            if tag and tag.strip()
+        }
+        if links:
+            db.execute(insert(knowledge_tag), [{"knowledge_id": k, "tag_id": t} for k, t in links])
+        db.commit()
+
+        for knowledge_id, entry in zip(knowledge_ids, batch):
+            lexical_index.add_document(knowledge_id, entry.title, entry.content)
+        rows = db.execute(
+            select(KnowledgeEntry.id, KnowledgeEntry.title, KnowledgeEntry.content)
+            .where(KnowledgeEntry.id.in_(knowledge_ids))
+            .order_by(KnowledgeEntry.id)
+        ).all()
+        _ingest_batch(db, rows, model, False, stats)
+        stats.knowledge_ids.extend(knowledge_ids)
+
+    stats.elapsed = time.perf_counter() - start
+    logger.info(f"知识条目批量导入完成: {stats.documents}个文档, 耗时{stats.elapsed:.2f}秒, {stats.docs_per_sec}文档/秒")
+    return stats
+
+
+def _read_documents(path: str) -> List[KnowledgeCreate]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [KnowledgeCreate(**json.loads(line)) for line in f if line.strip()]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="知识条目批量嵌入导入")
+    parser.add_argument("--file", help="导入的文档文件（JSONL）")
+    parser.add_argument("--creator-id", type=int, help="导入文档的创建者ID")
+    parser.add_argument("--reindex", action="store_true", help="为已有的全部知识条目生成嵌入（跳过未变化的分块）")
+    parser.add_argument("--force", action="store_true", help="忽略内容哈希，全部重新嵌入")
+    parser.add_argument("--batch-size", type=int, default=None, help="每个事务处理的文档数")
+    args = parser.parse_args()
+
+    if not args.file and not args.reindex:
+        parser.error("需要指定 --file 或 --reindex")
+    if args.file and args.creator_id is None:
+        parser.error("导入文件时需要指定 --creator-id")
+
+    logging.basicConfig(level=logging.INFO)
+    with SessionLocal() as db:
+        if args.file:
+            stats = bulk_add_knowledge(db, _read_documents(args.file), args.creator_id, args.batch_size)
+        else:
+            stats = ingest_entries(db, force=args.force, batch_size=args.batch_size)
+
+    result = stats.to_dict()
+    result.pop("knowledge_ids")
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+知识库服务
+知识条目写入数据库的同时生成向量嵌入，并增量更新向量索引和关键词倒排索引；
+检索时融合向量检索和BM25关键词检索的结果
+"""
+
+import logging
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.orm import Session, selectinload
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.knowledge import KnowledgeEmbedding, KnowledgeEntry, KnowledgeTag, knowledge_tag
+from app.schemas.knowledge import KnowledgeCreate
+from app.services.knowledge_manager.embedding import get_embedding_model
+from app.services.knowledge_manager.lexical_index import get_lexical_index, highlight
+from app.services.knowledge_manager.ingestion import ingest_entries
+from app.services.knowledge_manager.vector_index import get_vector_index
+
+logger = logging.getLogger(__name__)
+
+# 搜索结果中内容摘要的长度
+SNIPPET_LENGTH = 200
+SEARCH_MODES = ("hybrid", "vector", "keyword")
+# 每路检索召回 top_k 的倍数参与融合
+FUSION_CANDIDATE_MULTIPLIER = 4
+# 有标签过滤时向量检索额外多召回的倍数
+VECTOR_FILTER_OVERSAMPLE = 10
+
+
+def _get_or_create_tags(db: Session, names: Optional[List[str]]) -> List[KnowledgeTag]:
+    """按名称获取标签，不存在的标签自动创建"""
+    names = list(dict.fromkeys(name.strip() for name in names or [] if name and name.strip()))
+    if not names:
+        return []
+    existing = {tag.name: tag for tag in db.query(KnowledgeTag).filter(KnowledgeTag.name.in_(names)).all()}
+    tags = []
+    for name in names:
+        tag = existing.get(name)
+        if tag is None:
+            tag = KnowledgeTag(name=name)
+            db.add(tag)
+        tags.append(tag)
+    return tags
+
+
+def add_knowledge(db: Session, knowledge_in: KnowledgeCreate, user_id: int) -> int:
+    """
+    添加知识条目，生成向量嵌入并加入向量索引和关键词索引
+
+    Args:
+        db: 数据库会话
+        knowledge_in: 知识条目
+        user_id: 创建者ID
+
+    Returns:
+        知识条目ID
+    """
+    entry = KnowledgeEntry(
+        title=knowledge_in.title,
+        content=knowledge_in.content,
+        source=knowledge_in.source,
+        creator_id=user_id,
+        tags=_get_or_create_tags(db, knowledge_in.tags)
+    )
+    db.add(entry)
+    db.commit()
+
+    # 提交后再写入索引，保证索引中的条目在数据库中一定存在；长文本按分块嵌入
+    get_lexical_index(db).add_document(entry.id, entry.title, entry.content)
+    ingest_entries(db, [entry.id])
+    logger.info(f"知识条目已添加: {entry.id}")
+    return entry.id
+
+
+def _resolve_tag_filter(db: Session, tags: Optional[List[str]]) -> Optional[Set[int]]:
+    """将标签过滤条件转换为允许的知识条目ID集合，未指定标签时返回None"""
+    if not tags:
+        return None
+    rows = db.execute(
+        select(knowledge_tag.c.knowledge_id)
+        .join(KnowledgeTag, KnowledgeTag.id == knowledge_tag.c.tag_id)
+        .where(KnowledgeTag.name.in_(tags))
+        .distinct()
+    ).all()
+    return {row.knowledge_id for row in rows}
+
+
+def _vector_candidates(db: Session, query: str, limit: int, allowed_ids: Optional[Set[int]]) -> List[int]:
+    """向量检索，返回按相似度排序的知识条目ID"""
+    index = get_vector_index(db)
+    index.refresh(db)
+    # 同一条目可能有多个向量，且标签过滤在召回之后进行，需要多取一些
+    oversample = VECTOR_FILTER_OVERSAMPLE if allowed_ids is not None else 2
+    hits = index.search(get_embedding_model().embed_query(query), limit * oversample)
+    if not hits:
+        return []
+    owners = dict(db.execute(
+        select(KnowledgeEmbedding.id, KnowledgeEmbedding.knowledge_id).where(KnowledgeEmbedding.id.in_([i for i, _ in hits]))
+    ).all())
+
+    ranked: List[int] = []
+    for embedding_id, _ in hits:
+        knowledge_id = owners.get(embedding_id)
+        if knowledge_id is None or knowledge_id in ranked:
+            continue
+        if allowed_ids is not None and knowledge_id not in allowed_ids:
+            continue
+        ranked.append(knowledge_id)
+    return ranked[:limit]
+
+
+def _keyword_candidates(db: Session, query: str, limit: int, allowed_ids: Optional[Set[int]]) -> List[int]:
+    """BM25关键词检索，返回按得分排序的知识条目ID"""
+    index = get_lexical_index(db)
+    index.refresh(db)
+    return [knowledge_id for knowledge_id, _ in index.search(query, limit, allowed_ids)]
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: Optional[int] = None) -> List[Tuple[int, float]]:
+    """
+    倒数排名融合：每个结果的得分为其在各排序列表中 1/(k+排名) 之和
+
+    Args:
+        rankings: 多个按相关度排序的ID列表
+        k: 平滑常数，默认取配置
+
+    Returns:
+        (ID, 融合得分) 列表，按得分降序
+    """
+    k = k or settings.KNOWLEDGE_RRF_K
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, 1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def search_knowledge(
+    db: Session,
+    query: str,
+    top_k: int = 5,
+    tags: Optional[List[str]] = None,
+    mode: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    检索知识库，默认同时使用向量检索和BM25关键词检索，并按倒数排名融合结果
+
+    Args:
+        db: 数据库会话
+        query: 查询文本
+        top_k: 返回数量
+        tags: 只返回带有任一指定标签的条目
+        mode: 检索模式，hybrid（混合）、vector（仅向量）或 keyword（仅关键词）
+
+    Returns:
+        按相关度降序排列的搜索结果，摘要中命中的词用 <em> 标记
+    """
+    mode = mode or settings.KNOWLEDGE_SEARCH_MODE
+    if mode not in SEARCH_MODES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"不支持的检索模式: {mode}"
+        )
+    allowed_ids = _resolve_tag_filter(db, tags)
+    if allowed_ids is not None and not allowed_ids:
+        return []
+
+    limit = top_k * FUSION_CANDIDATE_MULTIPLIER
+    rankings = []
+    if mode in ("hybrid", "vector"):
+        rankings.append(_vector_candidates(db, query, limit, allowed_ids))
+    if mode in ("hybrid", "keyword"):
+        rankings.append(_keyword_candidates(db, query, limit, allowed_ids))
+    fused = reciprocal_rank_fusion(rankings)[:top_k]
+    if not fused:
+        return []
+
+    entries = {
+        row.id: row for row in db.execute(
+            select(KnowledgeEntry.id, KnowledgeEntry.title, KnowledgeEntry.content)
+            .where(KnowledgeEntry.id.in_([knowledge_id for knowledge_id, _ in fused]))
+        ).all()
+    }
+    return [
+        {
+            "knowledge_id": knowledge_id,
+            "title": entries[knowledge_id].title,
+            "snippet": highlight(entries[knowledge_id].content, query, SNIPPET_LENGTH),
+            "score": score
+        }
+        for knowledge_id, score in fused
+        if knowledge_id in entries
+    ]
+
+
+def search_knowledge_for_agent(query: str, top_k: int = 3) -> str:
+    """
+    供Agent工具调用的知识库检索，返回可直接放入对话的文本
+
+    Args:
+        query: 查询文本
+        top_k: 返回数量
+
+    Returns:
+        检索结果文本
+    """
+    with SessionLocal() as db:
+        results = search_knowledge(db, query, top_k)
+    if not results:
+        return f"知识库中没有找到与'{query}'相关的信息"
+    lines = [f"知识库中关于'{query}'的信息:"]
+    for i, result in enumerate(results, 1):
+        lines.append(f"{i}. {result['title']}（相关度: {result['score']:.4f}）\n{result['snippet']}")
+    return "\n".join(lines)
+
+
+def get_knowledge_entry(db: Session, knowledge_id: int) -> Optional[KnowledgeEntry]:
+    """获取知识条目详情"""
+    return (
+        db.query(KnowledgeEntry)
+        .options(selectinload(KnowledgeEntry.tags))
+        .filter(KnowledgeEntry.id == knowledge_id)
+        .first()
+    )
@@ -0,0 +1,257 @@
+"""
+知识库关键词倒排索引
+中文按相邻字二元组切分（单字词保留单字），英文、数字和编号（如 SOP-001）整体作为词元，
+使用BM25打分，用于弥补向量检索对编号、人名等精确字面匹配的不足
+"""
+
+import html
+import logging
+import math
+import re
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.knowledge import KnowledgeEntry
+
+logger = logging.getLogger(__name__)
+
+# 英文单词、数字及带连接符的编号，或连续的中日韩字符
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*|[一-鿿぀-ヿ가-힯]+")
+_CJK_PATTERN = re.compile(r"[一-鿿぀-ヿ가-힯]")
+
+# BM25参数
+BM25_K1 = 1.5
+BM25_B = 0.75
+# 标题中的词元按该倍数计入词频
+TITLE_WEIGHT = 2
+# 出现在超过该比例文档中的词元在查询时忽略
+MAX_DOC_FREQ_RATIO = 0.5
+# 从数据库加载文档时每批的行数
+LOAD_BATCH_SIZE = 5000
+
+
+def tokenize(text: str) -> List[str]:
+    """将文本切分为词元"""
+    tokens: List[str] = []
+    for match in _TOKEN_PATTERN.findall((text or "").lower()):
+        if _CJK_PATTERN.match(match):
+            if len(match) == 1:
+                tokens.append(match)
+            else:
+                tokens.extend(match[i:i + 2] for i in range(len(match) - 1))
+        else:
+            tokens.append(match)
+            # 编号同时按各部分索引，查询 "001" 也能命中 "sop-001"
+            parts = re.split(r"[-_.]", match)
+            if len(parts) > 1:
+                tokens.extend(parts)
+    return tokens
+
+
+class _Postings:
+    """单个词元的倒排列表，追加写入，查询时按需转换为数组"""
+
+    __slots__ = ("doc_ids", "tfs", "doc_lens", "_arrays")
+
+    def __init__(self):
+        self.doc_ids: List[int] = []
+        self.tfs: List[int] = []
+        self.doc_lens: List[int] = []
+        self._arrays: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+
+    def append(self, doc_id: int, tf: int, doc_len: int) -> None:
+        self.doc_ids.append(doc_id)
+        self.tfs.append(tf)
+        self.doc_lens.append(doc_len)
+        self._arrays = None
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if self._arrays is None:
+            self._arrays = (
+                np.array(self.doc_ids, dtype=np.int64),
+                np.array(self.tfs, dtype=np.float32),
+                np.array(self.doc_lens, dtype=np.float32),
+            )
+        return self._arrays
+
+
+class BM25Index:
+    """BM25倒排索引，文档ID为知识条目ID"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings: Dict[str, _Postings] = {}
+        self._doc_ids: Set[int] = set()
+        self._total_len = 0
+        self._synced_id = 0  # 已从数据库同步到的最大知识条目ID
+        self._last_refresh = 0.0
+
+    @property
+    def size(self) -> int:
+        return len(self._doc_ids)
+
+    def add_document(self, doc_id: int, title: str, content: str) -> None:
+        """添加文档，已存在的文档忽略"""
+        counts: Dict[str, int] = {}
+        for token in tokenize(title):
+            counts[token] = counts.get(token, 0) + TITLE_WEIGHT
+        for token in tokenize(content):
+            counts[token] = counts.get(token, 0) + 1
+        doc_len = sum(counts.values())
+
+        with self._lock:
+            if doc_id in self._doc_ids:
+                return
+            self._doc_ids.add(doc_id)
+            self._total_len += doc_len
+            for token, tf in counts.items():
+                postings = self._postings.get(token)
+                if postings is None:
+                    postings = self._postings[token] = _Postings()
+                postings.append(doc_id, tf, doc_len)
+
+    def refresh(self, db: Session, force: bool = False) -> None:
+        """从数据库同步尚未索引的知识条目（包括其他进程写入的）"""
+        now = time.monotonic()
+        if not force and now - self._last_refresh < settings.KNOWLEDGE_INDEX_REFRESH_INTERVAL:
+            return
+        self._last_refresh = now
+        while True:
+            rows = db.execute(
+                select(KnowledgeEntry.id, KnowledgeEntry.title, KnowledgeEntry.content)
+                .where(KnowledgeEntry.id > self._synced_id)
+                .order_by(KnowledgeEntry.id)
+                .limit(LOAD_BATCH_SIZE)
+            ).all()
+            if not rows:
+                return
+            for row in rows:
+                self.add_document(row.id, row.title, row.content)
+            self._synced_id = rows[-1].id
+
+    def search(self, query: str, top_k: int, allowed_ids: Optional[Iterable[int]] = None) -> List[Tuple[int, float]]:
+        """
+        BM25检索
+
+        Args:
+            query: 查询文本
+            top_k: 返回数量
+            allowed_ids: 限定的文档ID范围（标签过滤），为None时不限定
+
+        Returns:
+            (知识条目ID, BM25得分) 列表，按得分降序
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            total_docs = len(self._doc_ids)
+            if not terms or not total_docs:
+                return []
+            avg_len = self._total_len / total_docs
+            term_arrays = [
+                self._postings[term].arrays() for term in terms
+                if term in self._postings and len(self._postings[term].doc_ids) <= max(total_docs * MAX_DOC_FREQ_RATIO, 1)
+            ]
+        if not term_arrays:
+            return []
+
+        allowed = np.fromiter(allowed_ids, dtype=np.int64) if allowed_ids is not None else None
+        all_ids, all_scores = [], []
+        for doc_ids, tfs, doc_lens in term_arrays:
+            idf = math.log(1 + (total_docs - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            scores = idf * tfs * (BM25_K1 + 1) / (tfs + BM25_K1 * (1 - BM25_B + BM25_B * doc_lens / avg_len))
+            if allowed is not None:
+                mask = np.isin(doc_ids, allowed)
+                doc_ids, scores = doc_ids[mask], scores[mask]
+            all_ids.append(doc_ids)
+            all_scores.append(scores)
+
+        ids = np.concatenate(all_ids)
+        if not len(ids):
+            return []
+        unique_ids, inverse = np.unique(ids, return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(all_scores))
+        if len(totals) > top_k:
+            top = np.argpartition(-totals, top_k)[:top_k]
+        else:
+            top = np.arange(len(totals))
+        top = top[np.argsort(-totals[top])]
+        return [(int(unique_ids[i]), float(totals[i])) for i in top]
+
+
+def _match_spans(text: str, terms: Iterable[str]) -> List[Tuple[int, int]]:
+    """查找查询词元在文本中的位置，合并重叠的区间"""
+    lowered = text.lower()
+    spans = []
+    for term in terms:
+        start = lowered.find(term)
+        while start != -1:
+            spans.append((start, start + len(term)))
+            start = lowered.find(term, start + 1)
+    spans.sort()
+    merged: List[Tuple[int, int]] = []
+    for start, end in spans:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def highlight(text: str, query: str, length: int = 200) -> str:
+    """
+    生成高亮摘要：截取命中词元最密集的片段，命中部分用 <em> 标记，其余内容做HTML转义
+
+    Args:
+        text: 原文
+        query: 查询文本
+        length: 摘要长度（字符数）
+
+    Returns:
+        摘要
+    """
+    spans = _match_spans(text, set(tokenize(query)))
+    if not spans:
+        return html.escape(text[:length])
+
+    # 以各命中位置之前留出少量上下文作为候选起点，取包含命中最多的窗口
+    context = length // 5
+    candidates = sorted({max(start - context, 0) for start, _ in spans[:100]})
+    window_start = max(candidates, key=lambda s: sum(1 for a, b in spans if a >= s and b <= s + length))
+    window_end = min(window_start + length, len(text))
+
+    parts = ["..." if window_start > 0 else ""]
+    cursor = window_start
+    for start, end in spans:
+        if end <= window_start or start >= window_end:
+            continue
+        start, end = max(start, window_start), min(end, window_end)
+        parts.append(html.escape(text[cursor:start]))
+        parts.append(f"<em>{html.escape(text[start:end])}</em>")
+        cursor = end
+    parts.append(html.escape(text[cursor:window_end]))
+    if window_end < len(text):
+        parts.append("...")
+    return "".join(parts)
+
+
+_index: Optional[BM25Index] = None
+_index_lock = threading.Lock()
+
+
+def get_lexical_index(db: Session) -> BM25Index:
+    """获取进程内共享的倒排索引，首次调用时从数据库构建"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = BM25Index()
+                index.refresh(db, force=True)
+                logger.info(f"知识库倒排索引构建完成: {index.size}个文档")
+                _index = index
+    return _index
@@ -0,0 +1,174 @@
+"""
+短期记忆服务
+每个任务的短期记忆存放在一个定长的Redis列表中（环形缓冲，超出上限时丢弃最早的记忆），
+每次写入都会刷新过期时间；即将过期的记忆由后台任务批量归档到 ShortTermMemory 表，
+Agent每一步写入记忆都不需要访问数据库
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+
+from app.core.config import settings
+from app.db.redis import get_async_redis, get_redis
+from app.db.session import SessionLocal
+from app.models.knowledge import ShortTermMemory
+
+logger = logging.getLogger(__name__)
+
+# 待归档的任务，分数为计划归档的时间戳
+FLUSH_SCHEDULE_KEY = "short_term_memory:flush_schedule"
+# 每次归档处理的最大任务数
+FLUSH_BATCH_SIZE = 100
+# 归档失败的连续次数，用于计算重试的退避时间
+FLUSH_ATTEMPTS_KEY = "short_term_memory:flush_attempts"
+
+
+def _memory_key(task_id: int) -> str:
+    return f"short_term_memory:{task_id}"
+
+
+def _flushed_key(task_id: Any) -> str:
+    # 记录该任务已归档到的最后一条记忆的时间，与记忆一同过期
+    return f"short_term_memory_flushed:{task_id}"
+
+
+def _flush_at(now: float) -> float:
+    """计算计划归档时间：在记忆过期前留出一定余量"""
+    margin = min(settings.SHORT_TERM_MEMORY_FLUSH_MARGIN, settings.SHORT_TERM_MEMORY_TTL // 2)
+    return now + settings.SHORT_TERM_MEMORY_TTL - margin
+
+
+def store_short_term_memory(task_id: int, content: str) -> str:
+    """
+    存储短期记忆，追加、截断、刷新过期时间和登记归档在一次往返中完成
+
+    Args:
+        task_id: 任务ID
+        content: 记忆内容
+
+    Returns:
+        记忆ID
+    """
+    memory_id = uuid.uuid4().hex
+    item = {"id": memory_id, "timestamp": datetime.utcnow().isoformat(), "content": content}
+    key = _memory_key(task_id)
+
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.rpush(key, json.dumps(item, ensure_ascii=False))
+    pipe.ltrim(key, -settings.SHORT_TERM_MEMORY_MAX_ITEMS, -1)
+    pipe.expire(key, settings.SHORT_TERM_MEMORY_TTL)
+    pipe.zadd(FLUSH_SCHEDULE_KEY, {str(task_id): _flush_at(time.time())})
+    pipe.execute()
+    return memory_id
+
+
+def get_short_term_memory(task_id: int, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    获取短期记忆，指定limit时只读取列表尾部的若干条
+
+    Args:
+        task_id: 任务ID
+        limit: 只返回最近的若干条
+
+    Returns:
+        按时间顺序排列的记忆列表
+    """
+    start = -limit if limit else 0
+    return [json.loads(item) for item in get_redis().lrange(_memory_key(task_id), start, -1)]
+
+
+def _archive(task_id: int, memories: List[Dict[str, Any]]) -> None:
+    """批量写入记忆归档"""
+    with SessionLocal() as db:
+        db.execute(
+            insert(ShortTermMemory),
+            [
+                {"task_id": task_id, "content": memory["content"], "timestamp": datetime.fromisoformat(memory["timestamp"])}
+                for memory in memories
+            ]
+        )
+        db.commit()
+
+
+async def flush_expiring_memories(now: Optional[float] = None) -> int:
+    """
+    将即将过期的短期记忆归档到数据库
+
+    通过从调度集合中移除任务来认领归档工作，多个进程同时运行时每个任务只会被归档一次；
+    归档后任务继续写入的记忆会重新登记，已归档的部分不会重复写入
+
+    Returns:
+        归档的记忆条数
+    """
+    client = get_async_redis()
+    now = now or time.time()
+    due = await client.zrangebyscore(FLUSH_SCHEDULE_KEY, 0, now, start=0, num=FLUSH_BATCH_SIZE)
+    archived = 0
+    for task_id in due:
+        if not await client.zrem(FLUSH_SCHEDULE_KEY, task_id):
+            continue  # 已被其他进程认领
+        pipe = client.pipeline(transaction=False)
+        pipe.lrange(_memory_key(task_id), 0, -1)
+        pipe.get(_flushed_key(task_id))
+        items, flushed_until = await pipe.execute()
+
+        memories = [json.loads(item) for item in items]
+        memories = [m for m in memories if not flushed_until or m["timestamp"] > flushed_until]
+        if not memories:
+            continue
+        try:
+            await asyncio.to_thread(_archive, int(task_id), memories)
+        except Exception as e:
+            delay = await _reschedule(client, task_id, now)
+            logger.error(f"短期记忆归档失败: 任务{task_id}, {delay:.0f}秒后重试, 错误: {str(e)}")
+            continue
+        pipe = client.pipeline(transaction=False)
+        pipe.set(_flushed_key(task_id), memories[-1]["timestamp"], ex=settings.SHORT_TERM_MEMORY_TTL)
+        pipe.hdel(FLUSH_ATTEMPTS_KEY, task_id)
+        await pipe.execute()
+        archived += len(memories)
+
+    if archived:
+        logger.info(f"已归档{archived}条短期记忆")
+    return archived
+
+
+async def _reschedule(client, task_id: str, now: float) -> float:
+    """
+    归档失败后重新登记任务，按连续失败次数指数退避；
+    同时把记忆的过期时间延长到重试之后，避免重试前记忆已过期丢失
+
+    Returns:
+        距离下次重试的秒数
+    """
+    attempts = await client.hincrby(FLUSH_ATTEMPTS_KEY, task_id, 1)
+    margin = min(settings.SHORT_TERM_MEMORY_FLUSH_MARGIN, settings.SHORT_TERM_MEMORY_TTL // 2)
+    delay = min(settings.SHORT_TERM_MEMORY_FLUSH_INTERVAL * 2 ** (attempts - 1), margin)
+    key = _memory_key(task_id)
+    keep = int(delay + margin)
+    pipe = client.pipeline(transaction=False)
+    pipe.zadd(FLUSH_SCHEDULE_KEY, {task_id: now + delay})
+    if await client.ttl(key) < keep:
+        pipe.expire(key, keep)
+    await pipe.execute()
+    return delay
+
+
+async def run_memory_flusher(interval: Optional[float] = None) -> None:
+    """后台循环归档即将过期的短期记忆，随应用启动"""
+    interval = interval or settings.SHORT_TERM_MEMORY_FLUSH_INTERVAL
+    while True:
+        try:
+            await flush_expiring_memories()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"短期记忆归档任务出错: {str(e)}")
+        await asyncio.sleep(interval)
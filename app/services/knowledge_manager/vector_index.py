@@ -0,0 +1,379 @@
+"""
+知识库向量索引
+基于FAISS，磁盘上的主索引只读加载，IVF索引以内存映射方式加载，供多个进程共享页缓存
+（FAISS只支持对IVF倒排列表做内存映射，Flat和HNSW索引会完整读入每个进程的内存）；
+新增的向量先写入内存中的增量索引，数量达到阈值后合并进主索引并原子替换索引文件；
+删除的向量从增量索引中直接移除，主索引中的记入墓碑文件，检索时跳过，合并时从主索引中清除。
+向量以 KnowledgeEmbedding 表为准，索引ID即嵌入记录的ID
+"""
+
+import fcntl
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.knowledge import KnowledgeEmbedding
+from app.services.knowledge_manager.embedding import get_embedding_model
+
+logger = logging.getLogger(__name__)
+
+# 从数据库流式读取向量时每批的行数
+LOAD_BATCH_SIZE = 10000
+# IVF每个聚类中心建议的最少训练样本数
+IVF_MIN_POINTS_PER_CENTROID = 39
+# IVF训练使用的最大样本数
+IVF_MAX_TRAINING_POINTS = 256 * 1024
+INDEX_TYPES = ("Flat", "IVF", "HNSW")
+# 支持内存映射加载的索引类型
+MMAP_INDEX_TYPES = ("IVF",)
+
+
+def decode_embedding(data: bytes, dtype: str = "float32") -> np.ndarray:
+    """将数据库中的二进制向量还原为float32数组"""
+    return np.frombuffer(data, dtype=dtype).astype(np.float32)
+
+
+def encode_embedding(vector: np.ndarray, dtype: Optional[str] = None) -> bytes:
+    """将向量按存储精度编码为连续的二进制数组，存入数据库"""
+    return np.ascontiguousarray(vector, dtype=dtype or settings.EMBEDDING_STORAGE_DTYPE).tobytes()
+
+
+class KnowledgeVectorIndex:
+    """知识库向量索引"""
+
+    def __init__(self, path: str, model_name: str, dim: int, index_type: Optional[str] = None):
+        self.path = path
+        self.meta_path = path + ".meta.json"
+        self.tombstone_path = path + ".tombstones"
+        self.model_name = model_name
+        self.dim = dim
+        self.index_type = index_type or settings.KNOWLEDGE_INDEX_TYPE
+        if self.index_type not in INDEX_TYPES:
+            raise ValueError(f"不支持的索引类型: {self.index_type}")
+
+        self._lock = threading.RLock()
+        self._base: Optional[faiss.Index] = None
+        self._base_mmap = False  # 主索引是否以内存映射方式加载
+        self._base_max_id = 0  # 主索引已包含的最大嵌入记录ID
+        self._synced_id = 0  # 已从数据库同步到的最大嵌入记录ID
+        self._delta = self._new_delta()
+        self._delta_ids = set()
+        self._tombstones = set()  # 主索引中已从数据库删除的嵌入记录ID
+        self._last_refresh = 0.0
+
+    def _new_delta(self) -> faiss.Index:
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(self.dim))
+
+    # ---- 数据库读取 ----
+
+    def _iter_embeddings(self, db: Session, after_id: int = 0) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """按ID顺序分批读取当前模型的向量，返回 (ID数组, 向量矩阵)"""
+        last_id = after_id
+        while True:
+            rows = db.execute(
+                select(KnowledgeEmbedding.id, KnowledgeEmbedding.embedding, KnowledgeEmbedding.dtype)
+                .where(KnowledgeEmbedding.model == self.model_name, KnowledgeEmbedding.id > last_id)
+                .order_by(KnowledgeEmbedding.id)
+                .limit(LOAD_BATCH_SIZE)
+            ).all()
+            if not rows:
+                return
+            ids = np.array([row.id for row in rows], dtype=np.int64)
+            vectors = np.stack([decode_embedding(row.embedding, row.dtype or "float32") for row in rows])
+            last_id = int(ids[-1])
+            yield ids, vectors
+
+    def _count_embeddings(self, db: Session) -> int:
+        return db.execute(
+            select(func.count()).select_from(KnowledgeEmbedding).where(KnowledgeEmbedding.model == self.model_name)
+        ).scalar_one()
+
+    # ---- 构建与持久化 ----
+
+    def _create_index(self, total: int) -> Tuple[faiss.Index, str]:
+        """根据配置和数据量创建空索引，数据量不足以训练IVF时退回精确检索"""
+        index_type = self.index_type
+        if index_type == "IVF":
+            nlist = min(settings.KNOWLEDGE_IVF_NLIST, int(4 * math.sqrt(max(total, 1))), total // IVF_MIN_POINTS_PER_CENTROID)
+            if nlist < 1:
+                index_type = "Flat"
+            else:
+                quantizer = faiss.IndexFlatIP(self.dim)
+                return faiss.IndexIVFFlat(quantizer, self.dim, nlist, faiss.METRIC_INNER_PRODUCT), index_type
+        if index_type == "HNSW":
+            index = faiss.IndexHNSWFlat(self.dim, settings.KNOWLEDGE_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = max(40, 2 * settings.KNOWLEDGE_HNSW_M)
+            return index, index_type
+        return faiss.IndexFlatIP(self.dim), "Flat"
+
+    def _train(self, db: Session, index: faiss.Index) -> None:
+        """使用数据库中的前若干条向量训练IVF索引"""
+        samples = []
+        collected = 0
+        for _, vectors in self._iter_embeddings(db):
+            samples.append(vectors)
+            collected += len(vectors)
+            if collected >= IVF_MAX_TRAINING_POINTS:
+                break
+        index.train(np.concatenate(samples)[:IVF_MAX_TRAINING_POINTS])
+
+    def _build(self, db: Session) -> Tuple[faiss.Index, int, str]:
+        """从数据库全量构建索引，返回 (索引, 最大嵌入记录ID, 实际索引类型)"""
+        total = self._count_embeddings(db)
+        inner, actual_type = self._create_index(total)
+        if not inner.is_trained:
+            self._train(db, inner)
+        index = faiss.IndexIDMap2(inner)
+
+        max_id = 0
+        for ids, vectors in self._iter_embeddings(db):
+            index.add_with_ids(vectors, ids)
+            max_id = int(ids[-1])
+        logger.info(f"知识库向量索引构建完成: {index.ntotal}条向量, 类型: {actual_type}")
+        return index, max_id, actual_type
+
+    def _read_meta(self) -> Optional[dict]:
+        if not (os.path.exists(self.path) and os.path.exists(self.meta_path)):
+            return None
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        # 模型、维度或索引类型变化后需要重建
+        if meta.get("model") != self.model_name or meta.get("dim") != self.dim or meta.get("configured_type") != self.index_type:
+            return None
+        return meta
+
+    def _write(self, index: faiss.Index, max_id: int, actual_type: str) -> None:
+        """写入临时文件后原子替换，读取中的进程不受影响"""
+        tmp_path = self.path + ".tmp"
+        faiss.write_index(index, tmp_path)
+        os.replace(tmp_path, self.path)
+        meta = {
+            "model": self.model_name,
+            "dim": self.dim,
+            "configured_type": self.index_type,
+            "index_type": actual_type,
+            "max_embedding_id": max_id,
+            "count": int(index.ntotal),
+        }
+        with open(self.meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(self.meta_path + ".tmp", self.meta_path)
+        # 新的主索引已不包含任何已删除的向量
+        if os.path.exists(self.tombstone_path):
+            os.remove(self.tombstone_path)
+
+    def _read_tombstones(self) -> set:
+        """读取墓碑文件中记录的已删除嵌入记录ID（各进程删除时追加写入）"""
+        if not os.path.exists(self.tombstone_path):
+            return set()
+        with open(self.tombstone_path, "r", encoding="utf-8") as f:
+            return {int(line) for line in f if line.strip()}
+
+    @contextmanager
+    def _file_lock(self):
+        """跨进程的索引文件锁，保证同一时间只有一个进程构建或合并索引"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path + ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_base(self, meta: dict) -> None:
+        """只读加载主索引（IVF索引使用内存映射），并清空已被主索引包含的增量"""
+        mmap = meta["index_type"] in MMAP_INDEX_TYPES
+        flags = faiss.IO_FLAG_READ_ONLY | (faiss.IO_FLAG_MMAP if mmap else 0)
+        index = faiss.read_index(self.path, flags)
+        self._apply_search_params(index)
+        with self._lock:
+            self._base = index
+            self._base_mmap = mmap
+            self._base_max_id = meta["max_embedding_id"]
+            self._tombstones = self._read_tombstones()
+            self._synced_id = max(self._synced_id, self._base_max_id)
+            stale = [i for i in self._delta_ids if i <= self._base_max_id]
+            if stale:
+                self._delta.remove_ids(np.array(stale, dtype=np.int64))
+                self._delta_ids.difference_update(stale)
+
+    @staticmethod
+    def _apply_search_params(index: faiss.Index) -> None:
+        inner = faiss.downcast_index(index.index) if hasattr(index, "id_map") else index
+        if isinstance(inner, faiss.IndexIVF):
+            inner.nprobe = settings.KNOWLEDGE_IVF_NPROBE
+        elif isinstance(inner, faiss.IndexHNSW):
+            inner.hnsw.efSearch = settings.KNOWLEDGE_HNSW_EF_SEARCH
+
+    def load(self, db: Session) -> None:
+        """加载磁盘上的主索引（不存在或配置变化时从数据库构建），并同步之后新增的向量"""
+        with self._file_lock():
+            meta = self._read_meta()
+            if meta is None:
+                index, max_id, actual_type = self._build(db)
+                self._write(index, max_id, actual_type)
+                meta = self._read_meta()
+        self._load_base(meta)
+        self.refresh(db, force=True)
+
+    def merge(self, db: Session) -> None:
+        """将数据库中主索引之后新增的向量合并进主索引，并从主索引中清除已删除的向量"""
+        with self._file_lock():
+            meta = self._read_meta()
+            tombstones = self._read_tombstones()
+            if meta is None or meta["index_type"] != self.index_type or (tombstones and meta["index_type"] == "HNSW"):
+                # 首次构建时数据量不足而退回精确检索的，数据量增长后按配置的类型重建；
+                # HNSW不支持删除向量，有已删除的向量时同样从数据库重建
+                index, max_id, actual_type = self._build(db)
+            else:
+                index = faiss.read_index(self.path)
+                max_id, actual_type = meta["max_embedding_id"], meta["index_type"]
+                if tombstones:
+                    index.remove_ids(np.array(sorted(tombstones), dtype=np.int64))
+                for ids, vectors in self._iter_embeddings(db, after_id=max_id):
+                    index.add_with_ids(vectors, ids)
+                    max_id = int(ids[-1])
+            self._write(index, max_id, actual_type)
+            meta = self._read_meta()
+        self._load_base(meta)
+        logger.info(f"知识库增量向量已合并进主索引: 共{meta['count']}条向量, 清除已删除的向量{len(tombstones)}条")
+
+    # ---- 增量更新 ----
+
+    def _add_delta(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        with self._lock:
+            mask = np.array([int(i) > self._base_max_id and int(i) not in self._delta_ids for i in ids], dtype=bool)
+            if mask.any():
+                self._delta.add_with_ids(np.ascontiguousarray(vectors[mask], dtype=np.float32), ids[mask])
+                self._delta_ids.update(int(i) for i in ids[mask])
+
+    def add(self, db: Session, ids: List[int], vectors: np.ndarray) -> None:
+        """
+        添加已写入数据库的向量
+
+        Args:
+            db: 数据库会话，增量达到阈值时用于合并
+            ids: 嵌入记录ID列表
+            vectors: 对应的向量矩阵
+        """
+        if not len(ids):
+            return
+        self._add_delta(np.asarray(ids, dtype=np.int64), np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dim))
+        if self._delta.ntotal >= settings.KNOWLEDGE_INDEX_MERGE_THRESHOLD:
+            self.merge(db)
+
+    def remove(self, db: Session, ids: List[int]) -> None:
+        """
+        移除已从数据库删除的向量：增量索引中的直接删除，主索引中的记入墓碑，
+        墓碑达到阈值时重写主索引
+
+        Args:
+            db: 数据库会话，墓碑达到阈值时用于合并
+            ids: 已删除的嵌入记录ID列表
+        """
+        if not len(ids):
+            return
+        with self._lock:
+            in_delta = [int(i) for i in ids if int(i) in self._delta_ids]
+            if in_delta:
+                self._delta.remove_ids(np.array(in_delta, dtype=np.int64))
+                self._delta_ids.difference_update(in_delta)
+            in_base = [int(i) for i in ids if int(i) <= self._base_max_id and int(i) not in self._tombstones]
+        if not in_base:
+            return
+        # 墓碑写入文件，其他进程刷新时读取，合并后随主索引一起清空
+        with self._file_lock():
+            with open(self.tombstone_path, "a", encoding="utf-8") as f:
+                f.write("".join(f"{i}\n" for i in in_base))
+        with self._lock:
+            self._tombstones.update(in_base)
+        if len(self._tombstones) >= settings.KNOWLEDGE_INDEX_TOMBSTONE_THRESHOLD:
+            self.merge(db)
+
+    def refresh(self, db: Session, force: bool = False) -> None:
+        """同步其他进程写入数据库但尚未进入索引的向量"""
+        now = time.monotonic()
+        if not force and now - self._last_refresh < settings.KNOWLEDGE_INDEX_REFRESH_INTERVAL:
+            return
+        self._last_refresh = now
+        tombstones = self._read_tombstones()
+        with self._lock:
+            self._tombstones.update(tombstones)
+        for ids, vectors in self._iter_embeddings(db, after_id=self._synced_id):
+            self._add_delta(ids, vectors)
+            self._synced_id = int(ids[-1])
+        if self._delta.ntotal >= settings.KNOWLEDGE_INDEX_MERGE_THRESHOLD:
+            self.merge(db)
+
+    # ---- 检索 ----
+
+    def search(self, vector: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+        """
+        检索与查询向量最相似的向量
+
+        Args:
+            vector: 已归一化的查询向量
+            top_k: 返回数量
+
+        Returns:
+            (嵌入记录ID, 相似度) 列表，按相似度降序
+        """
+        query = np.asarray(vector, dtype=np.float32).reshape(1, self.dim)
+        hits = {}
+        with self._lock:
+            base = self._base
+            tombstones = self._tombstones
+            if self._delta.ntotal:
+                scores, ids = self._delta.search(query, min(top_k, self._delta.ntotal))
+                hits.update({int(i): float(s) for i, s in zip(ids[0], scores[0]) if i >= 0})
+        if base is not None and base.ntotal:
+            # 多取墓碑数量的结果，跳过已删除的向量后仍能返回top_k条
+            scores, ids = base.search(query, min(top_k + len(tombstones), base.ntotal))
+            for i, s in zip(ids[0], scores[0]):
+                if i >= 0 and int(i) not in hits and int(i) not in tombstones:
+                    hits[int(i)] = float(s)
+        return sorted(hits.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+    def stats(self) -> dict:
+        """索引统计信息"""
+        with self._lock:
+            return {
+                "model": self.model_name,
+                "dim": self.dim,
+                "index_type": self.index_type,
+                "mmap": self._base_mmap,
+                "base_count": int(self._base.ntotal) if self._base is not None else 0,
+                "delta_count": int(self._delta.ntotal),
+                "tombstone_count": len(self._tombstones),
+                "max_embedding_id": max(self._synced_id, max(self._delta_ids, default=0)),
+            }
+
+
+_index: Optional[KnowledgeVectorIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_vector_index(db: Session) -> KnowledgeVectorIndex:
+    """获取进程内共享的向量索引，首次调用时加载"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                model = get_embedding_model()
+                index = KnowledgeVectorIndex(settings.KNOWLEDGE_INDEX_PATH, model.name, model.dim)
+                index.load(db)
+                _index = index
+    return _index
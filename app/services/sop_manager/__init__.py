@@ -0,0 +1,20 @@
+from app.services.sop_manager.sop_service import (
+    create_sop_template,
+    get_sop_templates,
+    get_sop_template,
+    update_sop_template,
+    get_compiled_template,
+    get_sop_template_for_agent,
+    start_sop_run,
+    get_sop_run,
+    get_sop_run_events,
+    cancel_sop_run,
+    get_approvals,
+    decide_approval,
+    aget_compiled_template,
+    astart_sop_run_batch,
+    aget_sop_run_batch
+)
+from app.services.sop_manager.dag import SOPTemplateError, StepGraph, StepNode, compile_steps
+from app.services.sop_manager.engine import SOPRunEngine, sop_engine, wake_run
+from app.services.sop_manager.template_cache import CompiledTemplate, TemplateCache, template_cache
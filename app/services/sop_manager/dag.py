@@ -0,0 +1,116 @@
+"""
+SOP步骤依赖图
+将模板中的步骤列表编译为有向无环图：每个步骤可以通过 depends_on 声明依赖的步骤序号，
+未声明时依赖前一个步骤（与原来的线性顺序一致），声明为空列表时可以立即开始
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+class SOPTemplateError(ValueError):
+    """SOP模板步骤配置不合法"""
+
+
+@dataclass(frozen=True)
+class StepNode:
+    """编译后的步骤"""
+    order: int
+    name: str
+    action: str
+    params: Dict[str, Any] = field(default_factory=dict)
+    assignee_role: Optional[str] = None
+    timeout: Optional[int] = None
+    depends_on: Tuple[int, ...] = ()
+    tool_id: Optional[int] = None  # invoke_tool步骤引用的工具ID，编译模板时解析
+
+
+@dataclass(frozen=True)
+class StepGraph:
+    """步骤依赖图"""
+    nodes: Dict[int, StepNode]
+    dependents: Dict[int, Tuple[int, ...]]
+    topological_order: Tuple[int, ...]
+
+    def ready(self, finished: Iterable[int], started: Iterable[int]) -> List[int]:
+        """依赖均已完成且尚未开始的步骤，按序号排列"""
+        finished, started = set(finished), set(started)
+        return [
+            order for order in self.topological_order
+            if order not in started and all(dep in finished for dep in self.nodes[order].depends_on)
+        ]
+
+
+def _field(step: Any, name: str, default: Any = None) -> Any:
+    if isinstance(step, dict):
+        return step.get(name, default)
+    return getattr(step, name, default)
+
+
+def compile_steps(steps: List[Any]) -> StepGraph:
+    """
+    编译步骤列表为依赖图
+
+    Args:
+        steps: 步骤列表（字典或SOPStepBase）
+
+    Returns:
+        步骤依赖图
+
+    Raises:
+        SOPTemplateError: 步骤序号重复、依赖不存在的步骤或存在循环依赖
+    """
+    if not steps:
+        raise SOPTemplateError("SOP模板至少需要一个步骤")
+
+    ordered = sorted(steps, key=lambda step: _field(step, "order"))
+    nodes: Dict[int, StepNode] = {}
+    previous: Optional[int] = None
+    for step in ordered:
+        order = _field(step, "order")
+        if order in nodes:
+            raise SOPTemplateError(f"步骤序号重复: {order}")
+        depends_on = _field(step, "depends_on")
+        if depends_on is None:
+            depends_on = [] if previous is None else [previous]
+        nodes[order] = StepNode(
+            order=order,
+            name=_field(step, "name"),
+            action=_field(step, "action"),
+            params=dict(_field(step, "params") or {}),
+            assignee_role=_field(step, "assignee_role"),
+            timeout=_field(step, "timeout"),
+            depends_on=tuple(sorted(set(depends_on)))
+        )
+        previous = order
+
+    dependents: Dict[int, List[int]] = {order: [] for order in nodes}
+    for node in nodes.values():
+        for dep in node.depends_on:
+            if dep == node.order:
+                raise SOPTemplateError(f"步骤{node.order}不能依赖自身")
+            if dep not in nodes:
+                raise SOPTemplateError(f"步骤{node.order}依赖的步骤{dep}不存在")
+            dependents[dep].append(node.order)
+
+    # 拓扑排序（Kahn算法），同一层内按序号排列，剩余未排序的步骤说明存在循环依赖
+    in_degree = {order: len(node.depends_on) for order, node in nodes.items()}
+    frontier = sorted(order for order, degree in in_degree.items() if degree == 0)
+    topological: List[int] = []
+    while frontier:
+        order = frontier.pop(0)
+        topological.append(order)
+        for child in dependents[order]:
+            in_degree[child] -= 1
+            if in_degree[child] == 0:
+                frontier.append(child)
+        frontier.sort()
+    if len(topological) != len(nodes):
+        cycle = sorted(order for order, degree in in_degree.items() if degree > 0)
+        raise SOPTemplateError(f"步骤存在循环依赖: {cycle}")
+
+    return StepGraph(
+        nodes=nodes,
+        dependents={order: tuple(children) for order, children in dependents.items()},
+        topological_order=tuple(topological)
+    )
@@ -0,0 +1,683 @@
+"""
+SOP执行引擎
+按步骤依赖图执行SOP流程：依赖均已完成的步骤并发执行（每个流程有并发上限），
+每个步骤单独计时，超时即失败；任一步骤失败时取消同一流程中仍在执行的步骤并跳过后续步骤。
+新建的流程处于 pending 状态，由引擎认领（pending -> running）后执行，多个进程同时运行时每个流程只会被执行一次；
+认领时写入租约，执行期间定期续约，进程崩溃后租约过期的流程由任一进程的扫描恢复为 pending 重新执行。
+人工审批步骤和需要审批的工具调用不会占用协程等待：创建审批记录（保存恢复所需的数据）后步骤进入 waiting，
+其余分支执行完后流程进入 waiting 并释放执行槽位；审批处理后流程恢复为 pending，
+通过Redis通知唤醒任一进程的引擎重新认领，已成功的步骤不再执行。
+批量启动的流程处于 queued 状态，引擎按 SOP_BATCH_ADMIT_RATE 和本进程的空闲容量逐步放行为 pending
+"""
+
+import asyncio
+import logging
+import re
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set
+
+from fastapi import HTTPException, status
+from sqlalchemy import or_, select, update
+
+from app.core.config import settings
+from app.db.redis import get_async_redis, get_redis
+from app.db.session import AsyncSessionLocal
+from app.models.sop import SOPRun, SOPStepExecution
+from app.models.tool import ToolApproval
+from app.services.sop_manager.dag import SOPTemplateError, StepNode
+from app.services.sop_manager.run_state import arecord
+from app.services.sop_manager.template_cache import template_cache, tool_ref
+from app.services.tool_manager import ainvoke_tool, await_tool_invocation, tool_registry
+
+logger = logging.getLogger(__name__)
+
+# 步骤参数中的占位符，如 {{context.customer_id}}、{{steps.2.city}}
+_PLACEHOLDER = re.compile(r"\{\{\s*([\w.]+)\s*\}\}")
+# 工具执行队列已满时重试前的最长等待时间（秒）
+MAX_RETRY_AFTER = 5.0
+# 步骤状态对应的事件类型
+STEP_EVENTS = {"running": "step_started", "success": "step_succeeded", "failed": "step_failed", "waiting": "step_waiting"}
+# 唤醒等待中流程的Redis频道，消息内容为流程ID
+SOP_WAKE_CHANNEL = "sop:wake"
+
+
+class StepFailed(Exception):
+    """步骤执行失败"""
+
+
+class StepSuspended(Exception):
+    """步骤等待审批，流程挂起"""
+
+    def __init__(self, approval_id: int):
+        super().__init__(f"等待审批: {approval_id}")
+        self.approval_id = approval_id
+
+
+def wake_run(run_id: str) -> None:
+    """
+    通知所有进程的引擎认领已恢复为pending的流程（同步版本，供接口调用）；
+    Redis不可用时只提交到本进程，其他进程由定期扫描补充
+    """
+    try:
+        get_redis().publish(SOP_WAKE_CHANNEL, run_id)
+    except Exception as e:
+        logger.warning(f"发布SOP流程唤醒通知失败: {run_id}, 错误: {str(e)}")
+        sop_engine.submit_threadsafe(run_id)
+
+
+def _lookup(path: str, scope: Dict[str, Any]) -> Any:
+    value: Any = scope
+    for part in path.split("."):
+        if isinstance(value, dict):
+            value = value.get(part)
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return None
+    return value
+
+
+def render_params(value: Any, scope: Dict[str, Any]) -> Any:
+    """
+    替换参数中的占位符：整个字符串就是一个占位符时替换为原值（保留类型），否则按字符串拼接
+    """
+    if isinstance(value, dict):
+        return {key: render_params(item, scope) for key, item in value.items()}
+    if isinstance(value, list):
+        return [render_params(item, scope) for item in value]
+    if not isinstance(value, str):
+        return value
+    match = _PLACEHOLDER.fullmatch(value.strip())
+    if match:
+        return _lookup(match.group(1), scope)
+    return _PLACEHOLDER.sub(lambda m: _format(_lookup(m.group(1), scope)), value)
+
+
+def _format(value: Any) -> str:
+    """占位符嵌入字符串时的文本，只有缺失的值替换为空字符串，0、False等照常输出"""
+    return "" if value is None else str(value)
+
+
+class SOPRunEngine:
+    """SOP执行引擎"""
+
+    def __init__(self, max_active_runs: Optional[int] = None, max_parallel_steps: Optional[int] = None):
+        self.max_active_runs = max_active_runs or settings.SOP_MAX_ACTIVE_RUNS
+        self.max_parallel_steps = max_parallel_steps or settings.SOP_RUN_MAX_PARALLEL_STEPS
+        self.worker_id = uuid.uuid4().hex  # 本进程引擎的标识，写入认领的流程
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._background: List[asyncio.Task] = []
+        self._runs: Dict[str, asyncio.Task] = {}
+        self._queued: Set[str] = set()  # 已在队列中等待认领的流程，避免重复排队
+        self._resubmit: Set[str] = set()  # 执行期间被再次提交的流程，结束后重新提交
+        self._completed = 0
+        self._failed = 0
+        self._suspended = 0
+
+    # ---- 生命周期 ----
+
+    async def start(self) -> None:
+        """启动引擎，随应用启动"""
+        if self._background:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_active_runs)
+        self._background = [
+            asyncio.create_task(self._dispatcher(), name="sop-dispatcher"),
+            asyncio.create_task(self._sweeper(), name="sop-sweeper"),
+            asyncio.create_task(self._heartbeat(), name="sop-heartbeat"),
+            asyncio.create_task(self._listener(), name="sop-wake-listener"),
+            asyncio.create_task(self._admitter(), name="sop-batch-admitter")
+        ]
+        logger.info(f"SOP执行引擎已启动: 最多{self.max_active_runs}个流程同时执行")
+
+    async def stop(self) -> None:
+        """停止引擎，正在执行的流程恢复为pending，由下次启动或其他进程继续执行"""
+        for task in self._background:
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+        self._background = []
+
+        run_ids = list(self._runs)
+        for task in self._runs.values():
+            task.cancel()
+        await asyncio.gather(*self._runs.values(), return_exceptions=True)
+        self._runs.clear()
+        if run_ids:
+            async with AsyncSessionLocal() as db:
+                released = (await db.execute(
+                    update(SOPRun)
+                    .where(SOPRun.id.in_(run_ids), SOPRun.status == "running", SOPRun.worker_id == self.worker_id)
+                    .values(status="pending", worker_id=None, lease_expires_at=None)
+                    .returning(SOPRun.id)
+                )).scalars().all()
+                for run_id in released:
+                    await arecord(db, run_id, "run_released", run_values={"status": "pending"})
+                await db.commit()
+            logger.warning(f"SOP执行引擎停止，{len(run_ids)}个流程将重新执行未完成的步骤")
+
+    # ---- 提交与取消 ----
+
+    def submit(self, run_id: str) -> None:
+        """提交待执行的流程（需在事件循环中调用）"""
+        if self._queue is None or run_id in self._queued:
+            return
+        if run_id in self._runs:
+            # 流程挂起前审批已处理时会被再次提交，等本次执行结束后再认领
+            self._resubmit.add(run_id)
+            return
+        self._queued.add(run_id)
+        self._queue.put_nowait(run_id)
+
+    def submit_threadsafe(self, run_id: str) -> None:
+        """从同步代码（线程池）中提交待执行的流程；引擎未启动时由定期扫描补充执行"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self.submit, run_id)
+
+    def cancel(self, run_id: str) -> None:
+        """取消本进程中正在执行的流程"""
+        task = self._runs.get(run_id)
+        if task is not None:
+            task.cancel()
+
+    def cancel_threadsafe(self, run_id: str) -> None:
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self.cancel, run_id)
+
+    # ---- 调度 ----
+
+    async def _dispatcher(self) -> None:
+        while True:
+            run_id = await self._queue.get()
+            await self._slots.acquire()
+            self._queued.discard(run_id)
+            try:
+                claimed = await self._claim(run_id)
+            except Exception as e:
+                # 数据库出错时放弃本次认领，流程仍为pending，由扫描任务重新提交
+                logger.error(f"认领SOP流程失败: {run_id}, 错误: {str(e)}")
+                claimed = False
+            if not claimed:
+                self._slots.release()
+                continue
+            task = asyncio.create_task(self._execute_run(run_id), name=f"sop-run-{run_id}")
+            self._runs[run_id] = task
+            task.add_done_callback(lambda _, run_id=run_id: self._on_run_done(run_id))
+
+    def _on_run_done(self, run_id: str) -> None:
+        self._runs.pop(run_id, None)
+        self._slots.release()
+        if run_id in self._resubmit:
+            self._resubmit.discard(run_id)
+            self.submit(run_id)
+
+    async def _sweeper(self) -> None:
+        """
+        定期提交数据库中仍为pending的流程（引擎未启动时创建的、其他进程停止时释放的），
+        并把租约已过期的running流程（执行它的进程已崩溃）恢复为pending
+        """
+        while True:
+            await asyncio.sleep(settings.SOP_PENDING_SWEEP_INTERVAL)
+            try:
+                async with AsyncSessionLocal() as db:
+                    expired = (await db.execute(
+                        update(SOPRun)
+                        .where(
+                            SOPRun.status == "running",
+                            or_(SOPRun.lease_expires_at < datetime.now(), SOPRun.lease_expires_at.is_(None))
+                        )
+                        .values(status="pending", worker_id=None, lease_expires_at=None)
+                        .returning(SOPRun.id)
+                    )).scalars().all()
+                    for run_id in expired:
+                        await arecord(db, run_id, "run_lease_expired", run_values={"status": "pending"})
+                    await db.commit()
+                    if expired:
+                        logger.warning(f"{len(expired)}个SOP流程的租约已过期，将重新执行未完成的步骤")
+                    result = await db.execute(
+                        select(SOPRun.id)
+                        .where(SOPRun.status == "pending")
+                        .order_by(SOPRun.started_at)
+                        .limit(self.max_active_runs)
+                    )
+                    for run_id in result.scalars():
+                        self.submit(run_id)
+            except Exception as e:
+                logger.error(f"扫描待执行的SOP流程失败: {str(e)}")
+
+    async def _heartbeat(self) -> None:
+        """定期为本进程执行中的流程续约；流程已不属于本进程（已取消或租约过期后被其他进程认领）时停止执行"""
+        while True:
+            await asyncio.sleep(settings.SOP_RUN_LEASE_SECONDS / 3)
+            run_ids = list(self._runs)
+            if not run_ids:
+                continue
+            try:
+                async with AsyncSessionLocal() as db:
+                    renewed = set((await db.execute(
+                        update(SOPRun)
+                        .where(SOPRun.id.in_(run_ids), SOPRun.status == "running", SOPRun.worker_id == self.worker_id)
+                        .values(lease_expires_at=self._lease_deadline())
+                        .returning(SOPRun.id)
+                    )).scalars().all())
+                    await db.commit()
+            except Exception as e:
+                logger.error(f"SOP流程续约失败: {str(e)}")
+                continue
+            for run_id in run_ids:
+                if run_id not in renewed:
+                    self.cancel(run_id)
+
+    @staticmethod
+    def _lease_deadline() -> datetime:
+        return datetime.now() + timedelta(seconds=settings.SOP_RUN_LEASE_SECONDS)
+
+    async def _listener(self) -> None:
+        """订阅唤醒通知，审批处理后立即认领流程，不必等待下一次扫描"""
+        while True:
+            pubsub = None
+            try:
+                pubsub = get_async_redis().pubsub()
+                await pubsub.subscribe(SOP_WAKE_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self.submit(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"订阅SOP流程唤醒通知失败: {str(e)}")
+                await asyncio.sleep(settings.SOP_PENDING_SWEEP_INTERVAL)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.close()
+                    except Exception:
+                        pass
+
+    async def _admitter(self, interval: float = 1.0) -> None:
+        """
+        放行批量启动的流程（queued -> pending）：每个周期最多放行 速率×周期 个，且不超过本进程的空闲容量；
+        多个进程同时放行时用 SKIP LOCKED 各取一部分；
+        速率小于每周期1个时，不足1个的额度累积到后续周期
+        """
+        allowance = 0.0
+        while True:
+            await asyncio.sleep(interval)
+            rate_budget = settings.SOP_BATCH_ADMIT_RATE * interval
+            # 额度最多累积一个周期的量（至少1个），空闲期间不会攒出突发
+            allowance = min(allowance + rate_budget, max(rate_budget, 1.0))
+            budget = min(int(allowance), self.max_active_runs - len(self._runs) - len(self._queued))
+            if budget <= 0:
+                continue
+            try:
+                async with AsyncSessionLocal() as db:
+                    queued = (
+                        select(SOPRun.id)
+                        .where(SOPRun.status == "queued")
+                        .order_by(SOPRun.started_at)
+                        .limit(budget)
+                        .with_for_update(skip_locked=True)
+                    )
+                    admitted = (await db.execute(
+                        update(SOPRun)
+                        .where(SOPRun.id.in_(queued))
+                        .values(status="pending")
+                        .returning(SOPRun.id)
+                    )).scalars().all()
+                    for run_id in admitted:
+                        await arecord(db, run_id, "run_admitted", run_values={"status": "pending"})
+                    await db.commit()
+                allowance -= len(admitted)
+                for run_id in admitted:
+                    self.submit(run_id)
+            except Exception as e:
+                logger.error(f"放行批量SOP流程失败: {str(e)}")
+
+    async def _claim(self, run_id: str) -> bool:
+        """认领流程：只有把状态从pending改为running的进程才能执行，同时写入本进程的租约"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(SOPRun)
+                .where(SOPRun.id == run_id, SOPRun.status == "pending")
+                .values(status="running", worker_id=self.worker_id, lease_expires_at=self._lease_deadline())
+            )
+            if result.rowcount != 1:
+                await db.rollback()
+                return False
+            await arecord(db, run_id, "run_started", run_values={"status": "running"})
+            await db.commit()
+            return True
+
+    # ---- 执行流程 ----
+
+    async def _execute_run(self, run_id: str) -> None:
+        try:
+            await self._execute_steps(run_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # 写入最终状态也失败时（如数据库不可用），流程保持running，租约过期后由扫描恢复
+            logger.error(f"SOP流程执行出错: {run_id}, 错误: {str(e)}")
+
+    async def _execute_steps(self, run_id: str) -> None:
+        try:
+            async with AsyncSessionLocal() as db:
+                run = await db.get(SOPRun, run_id)
+                # 按启动时的修订执行，模板在流程执行期间被修改不影响该流程
+                template = await template_cache.aget(db, run.template_id, run.template_revision)
+                if template is None:
+                    raise SOPTemplateError(f"SOP模板{run.template_id}的修订{run.template_revision}不存在")
+                # 重新执行时，已成功的步骤不再执行
+                succeeded = await db.execute(
+                    select(SOPStepExecution.step_order, SOPStepExecution.result)
+                    .where(SOPStepExecution.sop_run_id == run_id, SOPStepExecution.status == "success")
+                )
+                finished = {order: result for order, result in succeeded}
+                context = run.context or {}
+                user_id = run.initiator_id
+            graph = template.graph
+        except SOPTemplateError as e:
+            await self._finish_run(run_id, "failed", error=str(e))
+            return
+        except Exception as e:
+            logger.error(f"加载SOP流程失败: {run_id}, 错误: {str(e)}")
+            await self._finish_run(run_id, "failed", error=str(e))
+            return
+
+        semaphore = asyncio.Semaphore(self.max_parallel_steps)
+        inflight: Dict[asyncio.Task, int] = {}
+        started: Set[int] = set(finished)
+        suspended: Set[int] = set()
+        error: Optional[str] = None
+        try:
+            while True:
+                if not await self._is_running(run_id):
+                    break  # 已被取消
+                for order in graph.ready(finished, started):
+                    started.add(order)
+                    scope = {"context": context, "steps": {str(k): v for k, v in finished.items()}}
+                    task = asyncio.create_task(self._run_step(run_id, graph.nodes[order], scope, user_id, semaphore))
+                    inflight[task] = order
+                if not inflight:
+                    break
+                done, _ = await asyncio.wait(inflight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    order = inflight.pop(task)
+                    try:
+                        finished[order] = task.result()
+                    except StepSuspended:
+                        # 依赖该步骤的分支暂停，其余分支继续执行
+                        suspended.add(order)
+                    except StepFailed as e:
+                        error = error or f"步骤{order}失败: {str(e)}"
+                    except Exception as e:
+                        # 记录步骤状态失败等意外错误，同样使流程失败
+                        logger.error(f"SOP步骤执行出错: {run_id}/{order}, 错误: {str(e)}")
+                        error = error or f"步骤{order}出错: {str(e)}"
+                if error:
+                    break
+        except asyncio.CancelledError:
+            await self._cancel_steps(inflight)
+            raise
+        except Exception as e:
+            logger.error(f"SOP流程调度出错: {run_id}, 错误: {str(e)}")
+            error = error or f"流程执行出错: {str(e)}"
+        await self._cancel_steps(inflight)
+
+        if error:
+            self._failed += 1
+            await self._finish_run(run_id, "failed", finished=finished, error=error)
+        elif len(finished) == len(graph.nodes):
+            self._completed += 1
+            await self._finish_run(run_id, "completed", finished=finished)
+        elif suspended:
+            self._suspended += 1
+            await self._suspend_run(run_id, sorted(suspended))
+
+    @staticmethod
+    async def _cancel_steps(inflight: Dict[asyncio.Task, int]) -> None:
+        for task in inflight:
+            task.cancel()
+        await asyncio.gather(*inflight, return_exceptions=True)
+        inflight.clear()
+
+    @staticmethod
+    async def _is_running(run_id: str) -> bool:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(SOPRun.status).where(SOPRun.id == run_id))
+            return result.scalar_one_or_none() == "running"
+
+    async def _finish_run(
+        self,
+        run_id: str,
+        status_: str,
+        finished: Optional[Dict[int, Any]] = None,
+        error: Optional[str] = None
+    ) -> None:
+        """
+        写入流程的最终状态，未执行和等待审批的步骤标记为跳过，待处理的审批一并取消；
+        已被取消或已被其他进程接管的流程不覆盖
+        """
+        now = datetime.now()
+        result = {"steps": {str(order): value for order, value in (finished or {}).items()}}
+        if error:
+            result["error"] = error
+        run_values = {"status": status_, "finished_at": now, "result": result, "current_step": None}
+        async with AsyncSessionLocal() as db:
+            updated = await db.execute(
+                update(SOPRun)
+                .where(SOPRun.id == run_id, SOPRun.status == "running", SOPRun.worker_id == self.worker_id)
+                .values(**run_values, worker_id=None, lease_expires_at=None)
+            )
+            if updated.rowcount != 1:
+                await db.rollback()
+                return
+            skipped = (await db.execute(
+                update(SOPStepExecution)
+                .where(SOPStepExecution.sop_run_id == run_id, SOPStepExecution.status.in_(["pending", "running", "waiting"]))
+                .values(status="skipped", ended_at=now)
+                .returning(SOPStepExecution.step_order)
+            )).scalars().all()
+            await db.execute(
+                update(ToolApproval)
+                .where(ToolApproval.sop_run_id == run_id, ToolApproval.status == "pending")
+                .values(status="canceled", updated_at=now)
+            )
+            await arecord(
+                db, run_id, f"run_{status_}",
+                run_values=run_values,
+                step_values={order: {"status": "skipped", "ended_at": now} for order in skipped}
+            )
+            await db.commit()
+
+    async def _suspend_run(self, run_id: str, orders: List[int]) -> None:
+        """
+        挂起流程（running -> waiting），释放执行槽位；
+        挂起前审批已处理的，直接恢复为pending并重新提交，避免错过唤醒。
+        处理审批时先锁定流程行，这里的UPDATE同样需要该行锁，之后读取的审批状态一定包含已提交的处理结果
+        """
+        async with AsyncSessionLocal() as db:
+            updated = await db.execute(
+                update(SOPRun)
+                .where(SOPRun.id == run_id, SOPRun.status == "running", SOPRun.worker_id == self.worker_id)
+                .values(status="waiting", current_step=None, worker_id=None, lease_expires_at=None)
+            )
+            if updated.rowcount != 1:
+                await db.rollback()
+                return
+            decided = (await db.execute(
+                select(ToolApproval.id).where(
+                    ToolApproval.sop_run_id == run_id,
+                    ToolApproval.step_order.in_(orders),
+                    ToolApproval.status != "pending"
+                ).limit(1)
+            )).first()
+            if decided:
+                await db.execute(update(SOPRun).where(SOPRun.id == run_id).values(status="pending"))
+                await arecord(db, run_id, "run_released", run_values={"status": "pending", "current_step": None})
+            else:
+                await arecord(db, run_id, "run_waiting", run_values={"status": "waiting", "current_step": None}, payload={"steps": orders})
+            await db.commit()
+        if decided:
+            self.submit(run_id)
+
+    # ---- 执行步骤 ----
+
+    async def _run_step(self, run_id: str, node: StepNode, scope: Dict[str, Any], user_id: int, semaphore: asyncio.Semaphore) -> Any:
+        async with semaphore:
+            await self._update_step(run_id, node.order, status="running", started_at=datetime.now(), error=None)
+            timeout = node.timeout or settings.SOP_STEP_DEFAULT_TIMEOUT
+            try:
+                result = await asyncio.wait_for(self._perform(run_id, node, scope, user_id, timeout), timeout)
+            except StepSuspended as e:
+                await self._update_step(run_id, node.order, status="waiting", result={"approval_id": e.approval_id})
+                raise
+            except asyncio.TimeoutError:
+                await self._update_step(run_id, node.order, status="failed", ended_at=datetime.now(), error=f"步骤超时（{timeout}秒）")
+                raise StepFailed(f"超时（{timeout}秒）")
+            except StepFailed as e:
+                await self._update_step(run_id, node.order, status="failed", ended_at=datetime.now(), error=str(e))
+                raise
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"SOP步骤执行出错: {run_id}/{node.order}, 错误: {str(e)}")
+                await self._update_step(run_id, node.order, status="failed", ended_at=datetime.now(), error=str(e))
+                raise StepFailed(str(e))
+            stored = result if isinstance(result, dict) else {"value": result}
+            await self._update_step(run_id, node.order, status="success", ended_at=datetime.now(), result=stored)
+            return stored
+
+    async def _perform(self, run_id: str, node: StepNode, scope: Dict[str, Any], user_id: int, timeout: float) -> Any:
+        if node.action == "invoke_tool":
+            return await self._invoke_tool(run_id, node, scope, user_id, timeout)
+        if node.action == "manual_approval":
+            approval = await self._approval(run_id, node, user_id)
+            return {"approved": True, "approval_id": approval.id, "approver_id": approval.approver_id, "comment": approval.comment}
+        raise StepFailed(f"不支持的步骤类型: {node.action}")
+
+    @staticmethod
+    async def _approval(
+        run_id: str,
+        node: StepNode,
+        user_id: int,
+        tool_id: Optional[int] = None,
+        payload: Optional[Dict[str, Any]] = None
+    ) -> ToolApproval:
+        """
+        获取步骤的审批结果：尚未申请时创建审批记录，未处理时挂起步骤，被拒绝时步骤失败
+
+        Raises:
+            StepSuspended: 审批尚未处理
+            StepFailed: 审批被拒绝或已取消
+        """
+        async with AsyncSessionLocal() as db:
+            approval = (await db.execute(
+                select(ToolApproval)
+                .where(ToolApproval.sop_run_id == run_id, ToolApproval.step_order == node.order)
+                .order_by(ToolApproval.id.desc())
+                .limit(1)
+            )).scalar_one_or_none()
+            if approval is None:
+                approval = ToolApproval(
+                    tool_id=tool_id,
+                    requester_id=user_id,
+                    reason=node.params.get("reason") or node.name,
+                    status="pending",
+                    sop_run_id=run_id,
+                    step_order=node.order,
+                    assignee_role=node.assignee_role,
+                    payload=payload
+                )
+                db.add(approval)
+                await db.commit()
+                raise StepSuspended(approval.id)
+        if approval.status == "pending":
+            raise StepSuspended(approval.id)
+        if approval.status != "approved":
+            raise StepFailed(f"审批未通过: {approval.comment or approval.status}")
+        return approval
+
+    async def _invoke_tool(self, run_id: str, node: StepNode, scope: Dict[str, Any], user_id: int, timeout: float) -> Any:
+        """
+        调用工具步骤，params格式: {"tool": 工具名或ID, "arguments": {...}}，
+        arguments中可以引用上下文和已完成步骤的结果；
+        需要审批的工具先申请审批，审批通过后按申请时保存的参数调用
+        """
+        # 工具引用在编译模板时已解析为ID，这里只检查工具是否仍处于激活状态
+        tool = await tool_registry.aget_by_id(node.tool_id) if node.tool_id is not None else None
+        if tool is None:
+            raise StepFailed(f"工具 '{tool_ref(node.params)}' 不存在或未激活")
+        arguments = render_params(node.params.get("arguments", node.params.get("params", {})), scope)
+        if tool.requires_approval:
+            approval = await self._approval(run_id, node, user_id, tool_id=tool.id, payload={"arguments": arguments})
+            arguments = (approval.payload or {}).get("arguments", arguments)
+
+        async with AsyncSessionLocal() as db:
+            while True:
+                try:
+                    invocation = await ainvoke_tool(db=db, tool_id=tool.id, params=arguments, user_id=user_id)
+                    break
+                except HTTPException as e:
+                    if e.status_code != status.HTTP_429_TOO_MANY_REQUESTS:
+                        raise StepFailed(str(e.detail))
+                    # 工具执行队列已满时等待后重试，总耗时仍受步骤超时限制
+                    retry_after = float((e.headers or {}).get("Retry-After", 1))
+                    await asyncio.sleep(min(retry_after, MAX_RETRY_AFTER))
+            if invocation.status == "running":
+                invocation = await await_tool_invocation(db=db, invoke_id=invocation.invoke_id, timeout=timeout)
+        if invocation is None or invocation.status == "running":
+            raise asyncio.TimeoutError()
+        if invocation.status == "failed":
+            raise StepFailed(invocation.error or "工具调用失败")
+        output = invocation.output
+        if isinstance(output, dict) and "error" in output:
+            raise StepFailed(str(output["error"]))
+        return output
+
+    @staticmethod
+    async def _update_step(run_id: str, order: int, **values: Any) -> None:
+        """
+        更新步骤状态，同时追加事件并更新流程快照
+
+        与取消、结束流程相同，按 流程 -> 步骤 -> 快照 的顺序加锁，避免并发时死锁；
+        流程已不在执行（如刚被取消）时不再覆盖步骤状态
+        """
+        async with AsyncSessionLocal() as db:
+            run_status = (await db.execute(
+                select(SOPRun.status).where(SOPRun.id == run_id).with_for_update()
+            )).scalar_one_or_none()
+            if run_status != "running":
+                await db.rollback()
+                return
+            await db.execute(
+                update(SOPStepExecution)
+                .where(SOPStepExecution.sop_run_id == run_id, SOPStepExecution.step_order == order)
+                .values(**values)
+            )
+            run_values = None
+            if values.get("status") == "running":
+                run_values = {"current_step": order}
+                await db.execute(update(SOPRun).where(SOPRun.id == run_id).values(**run_values))
+            await arecord(db, run_id, STEP_EVENTS[values["status"]], run_values=run_values, step_values={order: values})
+            await db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """引擎统计信息"""
+        return {
+            "max_active_runs": self.max_active_runs,
+            "active_runs": len(self._runs),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "completed": self._completed,
+            "failed": self._failed,
+            "suspended": self._suspended
+        }
+
+
+# 进程内共享的SOP执行引擎
+sop_engine = SOPRunEngine()
@@ -0,0 +1,162 @@
+"""
+SOP流程状态的事件日志与快照
+流程和步骤的每次状态变化都追加一条事件（SOPRunEvent），并在同一事务中更新该流程的快照（SOPRunSnapshot）；
+快照保存了渲染流程状态所需的全部数据（各步骤状态、按状态的计数、最近的错误），
+查询流程状态只需按主键读取一行快照，与流程的步骤数无关
+"""
+
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Union
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models.sop import SOPRun, SOPRunEvent, SOPRunSnapshot
+
+def _json_value(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def initial_state(run: SOPRun, steps: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    构建新流程的快照内容
+
+    Args:
+        run: 流程
+        steps: 步骤列表，每项包含 step_order、step_name
+    """
+    return {
+        "id": run.id,
+        "template_id": run.template_id,
+        "template_revision": run.template_revision,
+        "initiator_id": run.initiator_id,
+        "status": run.status,
+        "current_step": run.current_step,
+        "context": run.context,
+        "started_at": _json_value(run.started_at),
+        "finished_at": None,
+        "result": None,
+        "steps": {
+            str(step["step_order"]): {
+                "step_order": step["step_order"],
+                "step_name": step["step_name"],
+                "status": "pending",
+                "started_at": None,
+                "ended_at": None,
+                "result": None,
+                "error": None,
+                "seq": 0
+            }
+            for step in steps
+        }
+    }
+
+
+def _apply(
+    snapshot: SOPRunSnapshot,
+    seq: int,
+    run_values: Optional[Dict[str, Any]],
+    step_values: Optional[Dict[int, Dict[str, Any]]]
+) -> None:
+    """将一次状态变化应用到快照"""
+    state = dict(snapshot.state)
+    steps = dict(state["steps"])
+    for order, values in (step_values or {}).items():
+        step = dict(steps[str(order)])
+        step.update({key: _json_value(value) for key, value in values.items()})
+        step["seq"] = seq
+        steps[str(order)] = step
+        if values.get("error"):
+            snapshot.last_error = values["error"]
+    state["steps"] = steps
+    state.update({key: _json_value(value) for key, value in (run_values or {}).items()})
+    if run_values and isinstance(run_values.get("result"), dict) and run_values["result"].get("error"):
+        snapshot.last_error = run_values["result"]["error"]
+
+    # 重新赋值JSON列，确保变化被检测到
+    snapshot.state = state
+    snapshot.status = state["status"]
+    snapshot.current_step = state["current_step"]
+    snapshot.step_counts = dict(Counter(step["status"] for step in steps.values()))
+    snapshot.last_seq = seq
+    snapshot.updated_at = datetime.now()
+
+
+def _event(run_id: str, seq: int, event_type: str, step_values: Optional[Dict[int, Dict[str, Any]]], payload: Optional[Dict[str, Any]]) -> SOPRunEvent:
+    orders = list(step_values or {})
+    return SOPRunEvent(
+        sop_run_id=run_id,
+        seq=seq,
+        type=event_type,
+        step_order=orders[0] if len(orders) == 1 else None,
+        payload=payload or ({"steps": orders} if len(orders) > 1 else None),
+        created_at=datetime.now()
+    )
+
+
+def create_snapshot(db: Union[Session, AsyncSession], run: SOPRun, steps: List[Dict[str, Any]]) -> SOPRunSnapshot:
+    """创建流程快照并记录创建事件，需与流程在同一事务中提交；只向会话添加对象，同步和异步会话均可使用"""
+    state = initial_state(run, steps)
+    snapshot = SOPRunSnapshot(
+        sop_run_id=run.id,
+        status=run.status,
+        current_step=None,
+        step_counts={"pending": len(steps)},
+        last_seq=1,
+        state=state,
+        updated_at=datetime.now()
+    )
+    db.add(snapshot)
+    db.add(_event(run.id, 1, "run_created", None, {"template_id": run.template_id}))
+    return snapshot
+
+
+def record(
+    db: Session,
+    run_id: str,
+    event_type: str,
+    run_values: Optional[Dict[str, Any]] = None,
+    step_values: Optional[Dict[int, Dict[str, Any]]] = None,
+    payload: Optional[Dict[str, Any]] = None
+) -> Optional[int]:
+    """
+    追加事件并更新快照（同步版本），由调用方提交事务
+
+    锁定快照行后分配事件序号，同一流程并发的状态变化按顺序写入
+
+    Returns:
+        事件序号，流程没有快照时返回None
+    """
+    snapshot = db.execute(
+        select(SOPRunSnapshot).where(SOPRunSnapshot.sop_run_id == run_id).with_for_update()
+    ).scalar_one_or_none()
+    if snapshot is None:
+        return None
+    seq = snapshot.last_seq + 1
+    _apply(snapshot, seq, run_values, step_values)
+    db.add(_event(run_id, seq, event_type, step_values, payload))
+    return seq
+
+
+async def arecord(
+    db: AsyncSession,
+    run_id: str,
+    event_type: str,
+    run_values: Optional[Dict[str, Any]] = None,
+    step_values: Optional[Dict[int, Dict[str, Any]]] = None,
+    payload: Optional[Dict[str, Any]] = None
+) -> Optional[int]:
+    """追加事件并更新快照（异步版本），由调用方提交事务"""
+    result = await db.execute(
+        select(SOPRunSnapshot).where(SOPRunSnapshot.sop_run_id == run_id).with_for_update()
+    )
+    snapshot = result.scalar_one_or_none()
+    if snapshot is None:
+        return None
+    seq = snapshot.last_seq + 1
+    _apply(snapshot, seq, run_values, step_values)
+    db.add(_event(run_id, seq, event_type, step_values, payload))
+    return seq
+
@@ -0,0 +1,456 @@
+from typing import Any, Dict, List, Optional
+import uuid
+from datetime import datetime
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from fastapi import HTTPException, status
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.schemas.sop import (
+    SOPTemplateCreate,
+    SOPTemplateUpdate,
+    SOPRunCreate,
+    SOPRunResponse,
+    SOPStepExecutionResponse,
+    SOPRunBatchResponse
+)
+from app.schemas.tool import ToolApprovalDecision
+from app.models.sop import SOPTemplate, SOPTemplateRevision, SOPRun, SOPRunBatch, SOPStepExecution, SOPRunEvent, SOPRunSnapshot
+from app.models.tool import ToolApproval
+from app.models.user import User
+from app.services.sop_manager.dag import SOPTemplateError
+from app.services.sop_manager.engine import sop_engine, wake_run
+from app.services.sop_manager.run_state import create_snapshot, record
+from app.services.sop_manager.template_cache import CompiledTemplate, link_steps, template_cache
+
+# 尚未结束的流程状态
+ACTIVE_RUN_STATUSES = ("queued", "pending", "running", "waiting")
+# 已结束的流程状态
+FINISHED_RUN_STATUSES = ("completed", "failed", "canceled")
+
+def create_sop_template(db: Session, template_in: SOPTemplateCreate, user_id: int) -> SOPTemplate:
+    """
+    创建SOP模板，保存前先编译步骤依赖图并解析工具引用，配置不合法时返回400
+    """
+    _validate_steps(template_in.steps)
+    template = SOPTemplate(
+        name=template_in.name,
+        description=template_in.description,
+        version=template_in.version or "1.0",
+        revision=1,
+        creator_id=user_id,
+        steps=[step.model_dump() for step in template_in.steps]
+    )
+    db.add(template)
+    db.flush()
+    db.add(SOPTemplateRevision(template_id=template.id, revision=1, steps=template.steps))
+    db.commit()
+    db.refresh(template)
+    return template
+
+def update_sop_template(db: Session, template_id: int, template_in: SOPTemplateUpdate) -> SOPTemplate:
+    """
+    修改SOP模板：修订号递增并保存新修订的步骤，已启动的流程仍按原修订执行
+    """
+    template = get_sop_template(db, template_id)
+    if not template:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="SOP模板不存在"
+        )
+    values = template_in.model_dump(exclude_unset=True, exclude_none=True)
+    if template_in.steps is not None:
+        _validate_steps(template_in.steps)
+        values["steps"] = [step.model_dump() for step in template_in.steps]
+    for field, value in values.items():
+        setattr(template, field, value)
+    template.revision = (template.revision or 1) + 1
+    db.add(SOPTemplateRevision(template_id=template.id, revision=template.revision, steps=template.steps))
+    db.commit()
+    db.refresh(template)
+    template_cache.invalidate(template_id)
+    return template
+
+def _validate_steps(steps: List[Any]) -> None:
+    try:
+        link_steps(steps)
+    except SOPTemplateError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+def get_sop_templates(db: Session, skip: int = 0, limit: int = 100) -> List[SOPTemplate]:
+    """
+    获取SOP模板列表
+    """
+    return db.query(SOPTemplate).order_by(SOPTemplate.id).offset(skip).limit(limit).all()
+
+def get_sop_template(db: Session, template_id: int) -> Optional[SOPTemplate]:
+    """
+    根据ID获取SOP模板
+    """
+    return db.query(SOPTemplate).filter(SOPTemplate.id == template_id).first()
+
+def get_compiled_template(db: Session, template_id: int) -> CompiledTemplate:
+    """
+    获取模板当前修订的编译结果，模板不存在时返回404，配置不合法时返回400
+    """
+    try:
+        template = template_cache.get(db, template_id)
+    except SOPTemplateError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"SOP模板配置错误: {str(e)}"
+        )
+    if template is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="SOP模板不存在"
+        )
+    return template
+
+async def aget_compiled_template(db: AsyncSession, template_id: int) -> CompiledTemplate:
+    """
+    获取模板当前修订的编译结果（异步版本）
+    """
+    try:
+        template = await template_cache.aget(db, template_id)
+    except SOPTemplateError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"SOP模板配置错误: {str(e)}"
+        )
+    if template is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="SOP模板不存在"
+        )
+    return template
+
+def start_sop_run(db: Session, run_in: SOPRunCreate, user_id: int) -> SOPRunResponse:
+    """
+    启动SOP流程：创建流程和各步骤的执行记录后交给执行引擎
+    """
+    template = get_compiled_template(db, run_in.template_id)
+    graph = template.graph
+
+    run_id = uuid.uuid4().hex
+    run = SOPRun(
+        id=run_id,
+        template_id=template.id,
+        template_revision=template.revision,
+        initiator_id=user_id,
+        status="pending",
+        context=run_in.context or {},
+        started_at=datetime.now()
+    )
+    steps = [
+        {"sop_run_id": run_id, "step_order": node.order, "step_name": node.name, "status": "pending"}
+        for node in graph.nodes.values()
+    ]
+    db.add(run)
+    db.flush()
+    db.execute(insert(SOPStepExecution), steps)
+    create_snapshot(db, run, steps)
+    db.commit()
+
+    sop_engine.submit_threadsafe(run_id)
+    return get_sop_run(db, run_id)
+
+def get_sop_template_for_agent(template_id: str) -> Dict[str, Any]:
+    """
+    供Agent工具调用的SOP模板查询，返回编译后的模板概要
+    """
+    try:
+        with SessionLocal() as db:
+            template = template_cache.get(db, int(template_id))
+    except ValueError as e:
+        # 模板ID不是整数或模板配置不合法（SOPTemplateError是ValueError的子类）
+        return {"id": template_id, "error": f"无法获取SOP模板: {str(e)}"}
+    if template is None:
+        return {"id": template_id, "error": "SOP模板不存在"}
+    return template.summary()
+
+def get_sop_run(db: Session, run_id: str, since: Optional[int] = None) -> Optional[SOPRunResponse]:
+    """
+    获取SOP流程执行状态，按主键读取一行快照
+
+    指定since时只返回事件序号since之后有变化的步骤
+    """
+    snapshot = db.query(SOPRunSnapshot).filter(SOPRunSnapshot.sop_run_id == run_id).first()
+    if not snapshot:
+        return _build_run_response(db, run_id)
+    state = snapshot.state
+    steps = sorted(state["steps"].values(), key=lambda step: step["step_order"])
+    if since is not None:
+        steps = [step for step in steps if step["seq"] > since]
+    return SOPRunResponse(
+        id=state["id"],
+        template_id=state["template_id"],
+        template_revision=state.get("template_revision"),
+        initiator_id=state["initiator_id"],
+        status=state["status"],
+        current_step=state["current_step"],
+        context=state["context"],
+        steps=steps,
+        started_at=state["started_at"],
+        finished_at=state["finished_at"],
+        result=state["result"],
+        seq=snapshot.last_seq,
+        step_counts=snapshot.step_counts,
+        last_error=snapshot.last_error
+    )
+
+def _build_run_response(db: Session, run_id: str) -> Optional[SOPRunResponse]:
+    """
+    从流程和步骤表构建流程状态，用于没有快照的流程
+    """
+    run = db.query(SOPRun).filter(SOPRun.id == run_id).first()
+    if not run:
+        return None
+    executions = (
+        db.query(SOPStepExecution)
+        .filter(SOPStepExecution.sop_run_id == run_id)
+        .order_by(SOPStepExecution.step_order)
+        .all()
+    )
+    return SOPRunResponse(
+        id=run.id,
+        template_id=run.template_id,
+        template_revision=run.template_revision,
+        initiator_id=run.initiator_id,
+        status=run.status,
+        current_step=run.current_step,
+        context=run.context,
+        steps=[SOPStepExecutionResponse.model_validate(execution) for execution in executions],
+        started_at=run.started_at,
+        finished_at=run.finished_at,
+        result=run.result
+    )
+
+def get_sop_run_events(db: Session, run_id: str, since: int = 0, limit: int = 500) -> List[SOPRunEvent]:
+    """
+    获取流程事件序号since之后的事件
+    """
+    return (
+        db.query(SOPRunEvent)
+        .filter(SOPRunEvent.sop_run_id == run_id, SOPRunEvent.seq > since)
+        .order_by(SOPRunEvent.seq)
+        .limit(limit)
+        .all()
+    )
+
+def cancel_sop_run(db: Session, run_id: str) -> bool:
+    """
+    取消SOP流程，已结束的流程无法取消
+    """
+    # 加锁顺序：流程 -> 步骤 -> 审批 -> 快照，与执行引擎一致
+    now = datetime.now()
+    run_values = {"status": "canceled", "finished_at": now, "current_step": None}
+    result = db.execute(
+        update(SOPRun)
+        .where(SOPRun.id == run_id, SOPRun.status.in_(ACTIVE_RUN_STATUSES))
+        .values(**run_values)
+    )
+    if result.rowcount != 1:
+        db.rollback()
+        return False
+    canceled = db.execute(
+        update(SOPStepExecution)
+        .where(SOPStepExecution.sop_run_id == run_id, SOPStepExecution.status.in_(["pending", "running", "waiting"]))
+        .values(status="canceled", ended_at=now)
+        .returning(SOPStepExecution.step_order)
+    ).scalars().all()
+    db.execute(
+        update(ToolApproval)
+        .where(ToolApproval.sop_run_id == run_id, ToolApproval.status == "pending")
+        .values(status="canceled", updated_at=now)
+    )
+    record(
+        db, run_id, "run_canceled",
+        run_values=run_values,
+        step_values={order: {"status": "canceled", "ended_at": now} for order in canceled}
+    )
+    db.commit()
+
+    # 流程在本进程执行时立即停止；在其他进程执行时，引擎在开始下一批步骤前发现流程已取消
+    sop_engine.cancel_threadsafe(run_id)
+    return True
+
+def get_approvals(
+    db: Session,
+    status_: Optional[str] = "pending",
+    sop_run_id: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100
+) -> List[ToolApproval]:
+    """
+    获取审批列表，可按状态和流程筛选
+    """
+    query = db.query(ToolApproval)
+    if status_:
+        query = query.filter(ToolApproval.status == status_)
+    if sop_run_id:
+        query = query.filter(ToolApproval.sop_run_id == sop_run_id)
+    return query.order_by(ToolApproval.id).offset(skip).limit(limit).all()
+
+def decide_approval(db: Session, approval_id: int, decision: ToolApprovalDecision, approver: User) -> ToolApproval:
+    """
+    处理审批；关联的SOP流程正在等待时恢复为pending并唤醒引擎，由任一进程认领后从审批步骤继续执行
+
+    申请人不能处理自己的审批；审批指定了负责角色时，只有拥有该角色的用户（或管理员）可以处理。
+    先锁定关联的流程再修改审批：引擎挂起流程时同样先锁定流程再读取审批状态，
+    两者串行执行，流程要么在挂起时看到审批已处理，要么在这里被恢复，不会错过唤醒
+    """
+    target = db.query(ToolApproval.sop_run_id, ToolApproval.requester_id, ToolApproval.assignee_role).filter(
+        ToolApproval.id == approval_id
+    ).first()
+    if not target:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="审批不存在"
+        )
+    if target.requester_id == approver.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="不能处理自己发起的审批"
+        )
+    if target.assignee_role and not approver.is_superuser and target.assignee_role not in {role.name for role in approver.roles}:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"需要{target.assignee_role}角色才能处理该审批"
+        )
+
+    sop_run_id = target.sop_run_id
+    if sop_run_id:
+        db.execute(select(SOPRun.id).where(SOPRun.id == sop_run_id).with_for_update())
+
+    now = datetime.now()
+    result = db.execute(
+        update(ToolApproval)
+        .where(ToolApproval.id == approval_id, ToolApproval.status == "pending")
+        .values(
+            status="approved" if decision.approved else "rejected",
+            approver_id=approver.id,
+            comment=decision.comment,
+            approved_at=now if decision.approved else None,
+            updated_at=now
+        )
+    )
+    if result.rowcount != 1:
+        db.rollback()
+        exists = db.query(ToolApproval.id).filter(ToolApproval.id == approval_id).first()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT if exists else status.HTTP_404_NOT_FOUND,
+            detail="审批已处理" if exists else "审批不存在"
+        )
+
+    approval = db.query(ToolApproval).filter(ToolApproval.id == approval_id).first()
+    resumed = False
+    if sop_run_id:
+        # 流程仍在执行（尚未挂起）时不修改，由引擎挂起时发现审批已处理
+        resumed = db.execute(
+            update(SOPRun).where(SOPRun.id == sop_run_id, SOPRun.status == "waiting").values(status="pending")
+        ).rowcount == 1
+        if resumed:
+            record(
+                db, sop_run_id, "run_resumed",
+                run_values={"status": "pending"},
+                payload={"approval_id": approval_id, "step_order": approval.step_order, "approved": decision.approved}
+            )
+    db.commit()
+    db.refresh(approval)
+
+    if resumed:
+        wake_run(sop_run_id)
+    return approval
+
+async def astart_sop_run_batch(
+    db: AsyncSession,
+    template_id: int,
+    contexts: List[Dict[str, Any]],
+    user_id: int
+) -> SOPRunBatchResponse:
+    """
+    批量启动SOP流程：模板只编译一次，批次、全部流程、快照和步骤执行记录在一个事务中批量写入；
+    流程处于queued状态，由执行引擎按放行速率和空闲容量逐步转为pending执行，避免瞬间压垮数据库和工具
+    """
+    if not contexts:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="至少需要一个流程上下文"
+        )
+    if len(contexts) > settings.SOP_BATCH_MAX_RUNS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"单次批量启动最多{settings.SOP_BATCH_MAX_RUNS}个流程"
+        )
+    template = await aget_compiled_template(db, template_id)
+    nodes = list(template.graph.nodes.values())
+    steps = [{"step_order": node.order, "step_name": node.name} for node in nodes]
+
+    now = datetime.now()
+    batch = SOPRunBatch(
+        id=uuid.uuid4().hex,
+        template_id=template.id,
+        template_revision=template.revision,
+        initiator_id=user_id,
+        total=len(contexts),
+        created_at=now
+    )
+    db.add(batch)
+    await db.flush()
+    runs = [
+        SOPRun(
+            id=uuid.uuid4().hex,
+            template_id=template.id,
+            template_revision=template.revision,
+            batch_id=batch.id,
+            initiator_id=user_id,
+            status="queued",
+            context=context,
+            started_at=now
+        )
+        for context in contexts
+    ]
+    db.add_all(runs)
+    await db.flush()
+    for run in runs:
+        create_snapshot(db, run, steps)
+    await db.execute(
+        insert(SOPStepExecution),
+        [
+            {"sop_run_id": run.id, "step_order": node.order, "step_name": node.name, "status": "pending"}
+            for run in runs for node in nodes
+        ]
+    )
+    await db.commit()
+    return _batch_response(batch, {"queued": len(runs)})
+
+async def aget_sop_run_batch(db: AsyncSession, batch_id: str) -> Optional[SOPRunBatchResponse]:
+    """
+    获取SOP流程批次的整体进度，按状态聚合批次中的流程
+    """
+    batch = await db.get(SOPRunBatch, batch_id)
+    if not batch:
+        return None
+    result = await db.execute(
+        select(SOPRun.status, func.count()).where(SOPRun.batch_id == batch_id).group_by(SOPRun.status)
+    )
+    return _batch_response(batch, {run_status: count for run_status, count in result.all()})
+
+def _batch_response(batch: SOPRunBatch, status_counts: Dict[str, int]) -> SOPRunBatchResponse:
+    finished = sum(status_counts.get(run_status, 0) for run_status in FINISHED_RUN_STATUSES)
+    return SOPRunBatchResponse(
+        id=batch.id,
+        template_id=batch.template_id,
+        template_revision=batch.template_revision,
+        total=batch.total,
+        created_at=batch.created_at,
+        status_counts=status_counts,
+        finished=finished,
+        progress=round(finished / batch.total, 4) if batch.total else 1.0
+    )
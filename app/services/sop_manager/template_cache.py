@@ -0,0 +1,210 @@
+"""
+已编译SOP模板缓存
+模板的每个修订（模板ID + 修订号）只编译一次：校验步骤、构建依赖图并把工具引用解析为工具ID，
+编译结果不可变，保存在进程内LRU中；启动流程、执行引擎和Agent查询模板时只需读取模板的修订号，
+命中缓存时不再读取和解析步骤JSON，也不再查找工具。模板修改时修订号递增，旧修订的缓存自然失效
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.sop import SOPTemplate, SOPTemplateRevision
+from app.services.sop_manager.dag import SOPTemplateError, StepGraph, compile_steps
+from app.services.tool_manager import RegisteredTool, tool_registry
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CompiledTemplate:
+    """编译后的模板修订"""
+    id: int
+    revision: int
+    name: str
+    description: Optional[str]
+    version: str
+    graph: StepGraph
+
+    def summary(self) -> Dict[str, Any]:
+        """模板概要，供Agent工具返回"""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "description": self.description,
+            "version": self.version,
+            "revision": self.revision,
+            "steps": [
+                {
+                    "order": node.order,
+                    "name": node.name,
+                    "action": node.action,
+                    "assignee_role": node.assignee_role,
+                    "depends_on": list(node.depends_on),
+                    "tool_id": node.tool_id
+                }
+                for node in (self.graph.nodes[order] for order in self.graph.topological_order)
+            ]
+        }
+
+
+def tool_ref(params: Dict[str, Any]) -> Any:
+    """invoke_tool步骤参数中的工具引用（工具名或ID）"""
+    return params.get("tool") or params.get("tool_name") or params.get("tool_id")
+
+
+def _tool_refs(graph: StepGraph) -> Dict[int, Any]:
+    return {order: tool_ref(node.params) for order, node in graph.nodes.items() if node.action == "invoke_tool"}
+
+
+def _link_tools(graph: StepGraph, resolved: Dict[int, Tuple[Any, Optional[RegisteredTool]]]) -> StepGraph:
+    """把解析出的工具ID写入步骤，引用不存在或未激活的工具时模板不合法"""
+    nodes = dict(graph.nodes)
+    for order, (ref, tool) in resolved.items():
+        if tool is None:
+            raise SOPTemplateError(f"步骤{order}引用的工具 '{ref}' 不存在或未激活")
+        nodes[order] = replace(nodes[order], tool_id=tool.id)
+    return StepGraph(nodes=nodes, dependents=graph.dependents, topological_order=graph.topological_order)
+
+
+def link_steps(steps: List[Any]) -> StepGraph:
+    """编译步骤并解析工具引用（同步版本）"""
+    graph = compile_steps(steps)
+    resolved = {
+        order: (ref, tool_registry.get_by_id(ref) if isinstance(ref, int) else tool_registry.get_by_name(str(ref)))
+        for order, ref in _tool_refs(graph).items()
+    }
+    return _link_tools(graph, resolved)
+
+
+async def alink_steps(steps: List[Any]) -> StepGraph:
+    """编译步骤并解析工具引用（异步版本）"""
+    graph = compile_steps(steps)
+    resolved = {}
+    for order, ref in _tool_refs(graph).items():
+        tool = await tool_registry.aget_by_id(ref) if isinstance(ref, int) else await tool_registry.aget_by_name(str(ref))
+        resolved[order] = (ref, tool)
+    return _link_tools(graph, resolved)
+
+
+def _compiled(template: SOPTemplate, revision: int, graph: StepGraph) -> CompiledTemplate:
+    return CompiledTemplate(
+        id=template.id,
+        revision=revision,
+        name=template.name,
+        description=template.description,
+        version=template.version,
+        graph=graph
+    )
+
+
+def _revision_steps_query(template_id: int, revision: int):
+    return select(SOPTemplateRevision.steps).where(
+        SOPTemplateRevision.template_id == template_id,
+        SOPTemplateRevision.revision == revision
+    )
+
+
+class TemplateCache:
+    """已编译模板的进程内LRU缓存，按 (模板ID, 修订号) 索引"""
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries or settings.SOP_TEMPLATE_CACHE_SIZE
+        self._data: "OrderedDict[Tuple[int, int], CompiledTemplate]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def _lookup(self, key: Tuple[int, int]) -> Optional[CompiledTemplate]:
+        with self._lock:
+            compiled = self._data.get(key)
+            if compiled is None:
+                self._misses += 1
+                return None
+            self._data.move_to_end(key)
+            self._hits += 1
+            return compiled
+
+    def _store(self, compiled: CompiledTemplate) -> CompiledTemplate:
+        with self._lock:
+            self._data[(compiled.id, compiled.revision)] = compiled
+            self._data.move_to_end((compiled.id, compiled.revision))
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+        return compiled
+
+    def get(self, db: Session, template_id: int, revision: Optional[int] = None) -> Optional[CompiledTemplate]:
+        """
+        获取已编译的模板（同步版本）
+
+        Args:
+            db: 数据库会话
+            template_id: 模板ID
+            revision: 修订号，为空时使用当前修订
+
+        Returns:
+            已编译的模板，模板或修订不存在时返回None
+
+        Raises:
+            SOPTemplateError: 模板步骤配置不合法
+        """
+        if revision is None:
+            revision = db.execute(select(SOPTemplate.revision).where(SOPTemplate.id == template_id)).scalar_one_or_none()
+            if revision is None:
+                return None
+        compiled = self._lookup((template_id, revision))
+        if compiled is not None:
+            return compiled
+
+        template = db.get(SOPTemplate, template_id)
+        if template is None:
+            return None
+        steps = template.steps if template.revision == revision else db.execute(
+            _revision_steps_query(template_id, revision)
+        ).scalar_one_or_none()
+        if steps is None:
+            return None
+        return self._store(_compiled(template, revision, link_steps(steps)))
+
+    async def aget(self, db: AsyncSession, template_id: int, revision: Optional[int] = None) -> Optional[CompiledTemplate]:
+        """获取已编译的模板（异步版本）"""
+        if revision is None:
+            result = await db.execute(select(SOPTemplate.revision).where(SOPTemplate.id == template_id))
+            revision = result.scalar_one_or_none()
+            if revision is None:
+                return None
+        compiled = self._lookup((template_id, revision))
+        if compiled is not None:
+            return compiled
+
+        template = await db.get(SOPTemplate, template_id)
+        if template is None:
+            return None
+        if template.revision == revision:
+            steps = template.steps
+        else:
+            steps = (await db.execute(_revision_steps_query(template_id, revision))).scalar_one_or_none()
+        if steps is None:
+            return None
+        return self._store(_compiled(template, revision, await alink_steps(steps)))
+
+    def invalidate(self, template_id: int) -> None:
+        """丢弃模板所有修订的缓存（修订号变化后旧缓存不会再命中，这里只是提前释放内存）"""
+        with self._lock:
+            for key in [key for key in self._data if key[0] == template_id]:
+                del self._data[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        return {"entries": len(self._data), "hits": self._hits, "misses": self._misses}
+
+
+# 进程内共享的已编译模板缓存
+template_cache = TemplateCache()
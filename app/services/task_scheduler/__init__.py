@@ -1,8 +1,10 @@
 # 任务调度器服务初始化文件
 from app.services.task_scheduler.service import TaskSchedulerService
+from app.services.task_scheduler.llm_registry import llm_registry, get_llm_client
 
 # 导出服务函数
 create_task = TaskSchedulerService.execute_task
 get_task = TaskSchedulerService.get_task_status
 get_tasks = TaskSchedulerService.list_tasks
-cancel_task = TaskSchedulerService.cancel_task 
\ No newline at end of file
+cancel_task = TaskSchedulerService.cancel_task
+get_llm_stats = llm_registry.stats
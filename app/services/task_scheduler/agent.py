@@ -8,29 +8,44 @@ from typing import Annotated, Literal, TypedDict, List, Dict, Any, Optional
 from enum import Enum
 
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, FunctionMessage
+from langchain_core.runnables import RunnableLambda
 from langchain_core.tools import tool, BaseTool
 from langchain_openai import ChatOpenAI
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import END, START, StateGraph
+from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode
 
+from app.services.knowledge_manager import search_knowledge_for_agent
+from app.services.sop_manager import get_sop_template_for_agent
+from app.services.task_scheduler.checkpointer import (
+    get_checkpointer,
+    thread_config,
+    resume_input,
+    aresume_input,
+    acompact_thread
+)
+from app.services.task_scheduler.context_window import build_prompt, manage_context
+from app.services.task_scheduler.events import new_run_metrics, stream_workflow
+from app.services.task_scheduler.llm_registry import get_llm_client
+
 # 定义Agent状态
 class AgentState(TypedDict):
     """Agent的状态定义"""
-    messages: List[Any]  # 消息历史
+    messages: Annotated[List[Any], add_messages]  # 消息历史，节点只返回新增消息
     task_id: Optional[str]  # 当前任务ID
     task_info: Optional[Dict[str, Any]]  # 任务相关信息
     tools_results: Optional[Dict[str, Any]]  # 工具调用结果
     memory: Optional[Dict[str, Any]]  # 记忆/上下文
     status: Optional[str]  # 任务状态
+    context_summary: Optional[str]  # 被移出上下文窗口的历史摘要
+    context_stats: Optional[Dict[str, Any]]  # 上下文窗口统计（节省的token数等）
 
 
 # 定义工具
 @tool
 def search_knowledge_base(query: str) -> str:
     """搜索知识库获取相关信息"""
-    # 这里是示例实现，实际应该连接到知识库服务
-    return f"知识库中关于'{query}'的信息: 这是一个示例回复"
+    return search_knowledge_for_agent(query)
 
 @tool
 def get_task_details(task_id: str) -> Dict[str, Any]:
@@ -53,17 +68,7 @@ def update_task_status(task_id: str, status: str) -> str:
 @tool
 def get_sop_template(sop_id: str) -> Dict[str, Any]:
     """获取SOP模板"""
-    # 这里是示例实现，实际应该从SOP管理服务获取模板
-    return {
-        "id": sop_id,
-        "name": "示例SOP",
-        "steps": [
-            {"order": 1, "description": "第一步: 分析任务需求"},
-            {"order": 2, "description": "第二步: 制定执行计划"},
-            {"order": 3, "description": "第三步: 执行任务"},
-            {"order": 4, "description": "第四步: 验证结果"},
-        ]
-    }
+    return get_sop_template_for_agent(sop_id)
 
 
 # 定义Agent工具集
@@ -79,31 +84,8 @@ tool_node = ToolNode(tools)
 
 # 创建LLM模型
 def get_llm():
-    """获取LLM模型实例"""
-    # 使用OpenAI包，但基础地址是硅基流动
-    from langchain_openai import ChatOpenAI
-    
-    # 检查是否配置了SiliconFlow API密钥
-    if os.getenv("SILICONFLOW_API_KEY"):
-        return ChatOpenAI(
-            api_key=os.getenv("SILICONFLOW_API_KEY"),
-            base_url="https://api.siliconflow.cn/v1",
-            model="black-forest-labs/FLUX.1-dev",  # 或其他可用模型
-            temperature=0.2
-        ).bind_tools(tools)
-    # 优先使用Anthropic模型，如果没有则使用OpenAI
-    elif os.getenv("ANTHROPIC_API_KEY"):
-        from langchain_anthropic import ChatAnthropic
-        return ChatAnthropic(
-            model="claude-3-sonnet-20240229",
-            temperature=0.2
-        ).bind_tools(tools)
-    else:
-        # 默认使用OpenAI
-        return ChatOpenAI(
-            model="gpt-4-turbo",
-            temperature=0.2
-        ).bind_tools(tools)
+    """获取LLM模型实例（复用进程内共享的客户端）"""
+    return get_llm_client(tools)
 
 # 定义Agent系统提示
 SYSTEM_PROMPT = """你是李府管家系统中的智能任务执行Agent。你的职责是:
@@ -125,18 +107,26 @@ SYSTEM_PROMPT = """你是李府管家系统中的智能任务执行Agent。你
 # 定义调用LLM的函数
 def call_model(state: AgentState):
     """调用LLM模型处理当前状态"""
-    messages = state.get('messages', [])
-    
-    # 如果是首次调用，添加系统提示
-    if not any(isinstance(msg, SystemMessage) for msg in messages):
-        messages = [SystemMessage(content=SYSTEM_PROMPT)] + messages
+    # 系统提示不写入状态，每次调用时固定放在最前面
+    messages = build_prompt(SYSTEM_PROMPT, state)
     
     # 调用LLM
     model = get_llm()
     response = model.invoke(messages)
     
-    # 返回更新后的消息列表
-    return {"messages": messages + [response]}
+    # 只返回新增消息，由reducer追加到历史中
+    return {"messages": [response]}
+
+async def acall_model(state: AgentState):
+    """调用LLM模型处理当前状态（异步版本，不阻塞事件循环）"""
+    messages = build_prompt(SYSTEM_PROMPT, state)
+    
+    # 调用LLM
+    model = get_llm()
+    response = await model.ainvoke(messages)
+    
+    # 只返回新增消息，由reducer追加到历史中
+    return {"messages": [response]}
 
 # 定义路由函数
 def should_continue(state: AgentState) -> Literal["tools", END]:
@@ -160,44 +150,83 @@ def create_agent_workflow():
     # 创建状态图
     workflow = StateGraph(AgentState)
     
-    # 添加节点
-    workflow.add_node("agent", call_model)
+    # 添加节点，同时提供同步和异步实现，invoke和ainvoke均可使用
+    workflow.add_node("context", manage_context)
+    workflow.add_node("agent", RunnableLambda(call_model, afunc=acall_model))
     workflow.add_node("tools", tool_node)
     
-    # 添加边
-    workflow.add_edge(START, "agent")
+    # 添加边，每次调用LLM前先经过上下文管理节点裁剪历史
+    workflow.add_edge(START, "context")
+    workflow.add_edge("context", "agent")
     workflow.add_conditional_edges(
         "agent",
         should_continue,
     )
-    workflow.add_edge("tools", "agent")
-    
-    # 初始化内存保存器
-    memory = MemorySaver()
+    workflow.add_edge("tools", "context")
     
-    # 编译工作流
-    return workflow.compile(checkpointer=memory)
+    # 使用可持久化的检查点保存器，进程崩溃后可以从最后完成的节点继续
+    return workflow.compile(checkpointer=get_checkpointer())
 
 # 创建Agent实例
 agent_workflow = create_agent_workflow()
 
-# 执行Agent
-def execute_task(task_id: str, task_description: str) -> Dict[str, Any]:
-    """执行指定任务"""
-    # 初始化状态
-    initial_state = {
+def _build_initial_state(task_id: str, task_description: str) -> Dict[str, Any]:
+    """构建Agent初始状态"""
+    return {
         "messages": [HumanMessage(content=f"请执行以下任务: {task_description}. 任务ID: {task_id}")],
         "task_id": task_id,
         "task_info": None,
         "tools_results": {},
         "memory": {},
-        "status": "started"
+        "status": "started",
+        "context_summary": None,
+        "context_stats": None
     }
+
+# 执行Agent
+def execute_task(task_id: str, task_description: str) -> Dict[str, Any]:
+    """执行指定任务"""
+    # 初始化状态
+    initial_state = _build_initial_state(task_id, task_description)
     
-    # 执行工作流
-    result = agent_workflow.invoke(initial_state)
+    # 执行工作流，以任务ID作为线程ID，存在未完成的检查点时从断点继续
+    config = thread_config(task_id)
+    result = agent_workflow.invoke(resume_input(agent_workflow, config, initial_state), config)
     
     # 更新任务状态为已完成
     update_task_status(task_id, "completed")
     
-    return result 
\ No newline at end of file
+    return result
+
+async def aexecute_task(task_id: str, task_description: str) -> Dict[str, Any]:
+    """异步执行指定任务，LLM和工具调用期间让出事件循环"""
+    initial_state = _build_initial_state(task_id, task_description)
+    
+    # 流式执行工作流并推送节点事件，工具节点在异步模式下并发执行工具调用
+    config = thread_config(task_id)
+    metrics = new_run_metrics()
+    result = await stream_workflow(agent_workflow, await aresume_input(agent_workflow, config, initial_state), config, task_id, metrics)
+    await acompact_thread(task_id)
+    
+    # 更新任务状态为已完成
+    await update_task_status.ainvoke({"task_id": task_id, "status": "completed"})
+    
+    response = _build_response(task_id, result)
+    response["metrics"] = metrics
+    return response
+
+def _build_response(task_id: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """将工作流最终状态转换为可序列化的响应"""
+    messages = result.get('messages', [])
+    return {
+        "task_id": task_id,
+        "status": "completed",
+        "messages": [
+            {
+                "role": "system" if isinstance(msg, SystemMessage) else "user" if isinstance(msg, HumanMessage) else "assistant" if isinstance(msg, AIMessage) else "function",
+                "content": msg.content if hasattr(msg, 'content') else str(msg)
+            }
+            for msg in messages
+        ],
+        "context_stats": result.get('context_stats')
+    }
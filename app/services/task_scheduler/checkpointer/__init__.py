@@ -0,0 +1,69 @@
+"""
+Agent工作流检查点子系统
+根据 CHECKPOINT_BACKEND 配置选择 sql / redis / memory 存储
+"""
+
+import asyncio
+from typing import Any, Dict
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.memory import MemorySaver
+
+from app.core.config import settings
+from app.services.task_scheduler.checkpointer.base import IncrementalCheckpointSaver
+
+_checkpointer = None
+
+def get_checkpointer():
+    """获取进程内共享的检查点保存器"""
+    global _checkpointer
+    if _checkpointer is None:
+        backend = settings.CHECKPOINT_BACKEND.lower()
+        if backend == "sql":
+            from app.services.task_scheduler.checkpointer.sql_saver import SQLCheckpointSaver
+            _checkpointer = SQLCheckpointSaver()
+        elif backend == "redis":
+            from app.services.task_scheduler.checkpointer.redis_saver import RedisCheckpointSaver
+            _checkpointer = RedisCheckpointSaver()
+        else:
+            _checkpointer = MemorySaver()
+    return _checkpointer
+
+def thread_config(task_id: str, **extra: Any) -> RunnableConfig:
+    """以任务ID作为线程ID构建工作流配置，使同一任务的多次执行共享检查点"""
+    config: Dict[str, Any] = {"configurable": {"thread_id": task_id}}
+    config.update(extra)
+    return config
+
+def _reset_thread(task_id: str) -> None:
+    """清除已执行完毕的线程状态，避免消息历史被reducer追加到新一次执行中"""
+    delete_thread = getattr(get_checkpointer(), "delete_thread", None)
+    if delete_thread:
+        delete_thread(task_id)
+
+async def aresume_input(workflow, config: RunnableConfig, initial_state: Dict[str, Any]):
+    """
+    决定工作流的输入：如果该线程存在未执行完的检查点，则从最后完成的节点继续执行（输入为None），
+    否则使用初始状态重新开始
+    """
+    snapshot = await workflow.aget_state(config)
+    if snapshot and snapshot.next:
+        return None
+    if snapshot and snapshot.values:
+        await asyncio.to_thread(_reset_thread, config["configurable"]["thread_id"])
+    return initial_state
+
+def resume_input(workflow, config: RunnableConfig, initial_state: Dict[str, Any]):
+    """aresume_input的同步版本"""
+    snapshot = workflow.get_state(config)
+    if snapshot and snapshot.next:
+        return None
+    if snapshot and snapshot.values:
+        _reset_thread(config["configurable"]["thread_id"])
+    return initial_state
+
+async def acompact_thread(task_id: str) -> None:
+    """任务完成后压缩其检查点，只保留最终状态"""
+    checkpointer = get_checkpointer()
+    if isinstance(checkpointer, IncrementalCheckpointSaver):
+        await checkpointer.acompact(task_id, keep_last=1)
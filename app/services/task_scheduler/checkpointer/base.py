@@ -0,0 +1,222 @@
+"""
+增量检查点保存器基类
+通道数据按 (通道, 版本) 单独存储，每一步只写入发生变化的通道；
+消息通道（只追加的对话历史）的版本只记录消息摘要列表，消息按条单独存储，每一步只写入新增的消息
+"""
+
+import asyncio
+import hashlib
+import random
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+)
+
+from app.core.config import settings
+
+# 通道为空时的占位序列化类型
+EMPTY_TYPE = "empty"
+# 消息通道的序列化类型，值为换行分隔的消息摘要列表
+MESSAGE_LIST_TYPE = "message_list"
+# 进程内最多记录多少个 (线程, 通道) 已写入的消息摘要
+MESSAGE_CACHE_SIZE = 1024
+
+# 消息行：(通道, 摘要, 序列化类型, 序列化数据)
+MessageRow = Tuple[str, str, str, Optional[bytes]]
+
+
+class IncrementalCheckpointSaver(BaseCheckpointSaver):
+    """
+    增量检查点保存器
+
+    子类实现同步的读写方法，异步方法统一放到线程池执行；
+    每写入若干个检查点后自动压缩该线程的历史检查点
+    """
+
+    def __init__(self, *, serde: Any = None, keep_last: Optional[int] = None, compact_every: Optional[int] = None):
+        super().__init__(serde=serde)
+        self.keep_last = keep_last or settings.CHECKPOINT_KEEP_LAST
+        self.compact_every = compact_every or settings.CHECKPOINT_COMPACT_EVERY
+        self._put_counts: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._count_lock = threading.Lock()
+        self.message_channels = {c.strip() for c in settings.CHECKPOINT_MESSAGE_CHANNELS.split(",") if c.strip()}
+        # (线程, 命名空间, 通道) -> 已写入存储的消息摘要，用于跳过已存在的消息
+        self._stored_messages: "OrderedDict[Tuple[str, str, str], set]" = OrderedDict()
+        self._message_lock = threading.Lock()
+
+    # ---- 子类需要实现的方法 ----
+
+    def compact(self, thread_id: str, checkpoint_ns: str = "", keep_last: Optional[int] = None) -> int:
+        """
+        压缩指定线程的检查点，只保留最近的若干个，并删除不再被引用的通道数据
+
+        Returns:
+            删除的检查点数量
+        """
+        raise NotImplementedError
+
+    def delete_thread(self, thread_id: str) -> None:
+        """删除指定线程的全部检查点"""
+        raise NotImplementedError
+
+    # ---- 公共逻辑 ----
+
+    def get_next_version(self, current: Optional[str], channel: Any = None) -> str:
+        """生成单调递增且可按字典序排序的通道版本号"""
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    def _split_checkpoint(
+        self, checkpoint: Checkpoint, new_versions: ChannelVersions, thread_id: str, checkpoint_ns: str
+    ) -> Tuple[Dict[str, Any], List[Tuple[str, str, str, Optional[bytes]]], List[MessageRow]]:
+        """
+        将检查点拆分为 不含通道数据的检查点、本步变化的通道数据 和 尚未写入的消息
+
+        消息通道的版本只保存消息摘要列表，完整消息按摘要单独存储，
+        已写入过的消息不会随每个版本重复写入
+        """
+        checkpoint_copy = checkpoint.copy()
+        values = checkpoint_copy.pop("channel_values", {}) or {}
+        blobs = []
+        messages: List[MessageRow] = []
+        for channel, version in new_versions.items():
+            if channel in self.message_channels and isinstance(values.get(channel), list):
+                digests, rows = self._split_messages(thread_id, checkpoint_ns, channel, values[channel])
+                blobs.append((channel, str(version), MESSAGE_LIST_TYPE, "\n".join(digests).encode()))
+                messages.extend(rows)
+                continue
+            if channel in values:
+                value_type, value = self.serde.dumps_typed(values[channel])
+            else:
+                value_type, value = EMPTY_TYPE, None
+            blobs.append((channel, str(version), value_type, value))
+        return checkpoint_copy, blobs, messages
+
+    def _split_messages(self, thread_id: str, checkpoint_ns: str, channel: str, items: List[Any]) -> Tuple[List[str], List[MessageRow]]:
+        """计算消息列表的摘要，返回摘要列表和本进程尚未写入过的消息"""
+        with self._message_lock:
+            stored = set(self._stored_messages.get((thread_id, checkpoint_ns, channel), ()))
+        digests, rows = [], []
+        for item in items:
+            value_type, value = self.serde.dumps_typed(item)
+            digest = hashlib.sha1(value_type.encode() + b"\x00" + (value or b"")).hexdigest()
+            digests.append(digest)
+            if digest not in stored:
+                stored.add(digest)
+                rows.append((channel, digest, value_type, value))
+        return digests, rows
+
+    def _remember_messages(self, thread_id: str, checkpoint_ns: str, rows: List[MessageRow]) -> None:
+        """记录已写入存储的消息摘要（写入成功后调用）"""
+        with self._message_lock:
+            for channel, digest, _, _ in rows:
+                key = (thread_id, checkpoint_ns, channel)
+                self._stored_messages.setdefault(key, set()).add(digest)
+                self._stored_messages.move_to_end(key)
+            while len(self._stored_messages) > MESSAGE_CACHE_SIZE:
+                self._stored_messages.popitem(last=False)
+
+    def _forget_messages(self, thread_id: str, checkpoint_ns: Optional[str] = None) -> None:
+        """丢弃线程已写入消息的记录（压缩或删除线程后调用，消息可能已被删除）"""
+        with self._message_lock:
+            for key in [key for key in self._stored_messages if key[0] == thread_id and checkpoint_ns in (None, key[1])]:
+                del self._stored_messages[key]
+
+    @staticmethod
+    def _message_digests(value: Optional[bytes]) -> List[str]:
+        """解析消息通道版本中保存的摘要列表"""
+        return value.decode().split("\n") if value else []
+
+    def _join_messages(self, channel: str, digests: List[str], rows: Dict[str, Tuple[str, Optional[bytes]]]) -> List[Any]:
+        """按摘要列表还原消息通道的完整消息列表"""
+        missing = [digest for digest in digests if digest not in rows]
+        if missing:
+            raise ValueError(f"检查点通道 {channel} 缺少 {len(missing)} 条消息")
+        return [self._load_value(*rows[digest]) for digest in digests]
+
+    def _load_value(self, value_type: str, value: Optional[bytes]) -> Any:
+        return self.serde.loads_typed((value_type, value))
+
+    def _after_put(self, thread_id: str, checkpoint_ns: str) -> None:
+        """按写入次数摊销触发压缩"""
+        with self._count_lock:
+            key = (thread_id, checkpoint_ns)
+            self._put_counts[key] += 1
+            should_compact = self._put_counts[key] % self.compact_every == 0
+        if should_compact:
+            self.compact(thread_id, checkpoint_ns)
+
+    @staticmethod
+    def _thread_config(thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> RunnableConfig:
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint_id,
+            }
+        }
+
+    # ---- 异步接口，放到线程池执行，避免阻塞事件循环 ----
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def acompact(self, thread_id: str, checkpoint_ns: str = "", keep_last: Optional[int] = None) -> int:
+        return await asyncio.to_thread(self.compact, thread_id, checkpoint_ns, keep_last)
+
+    @staticmethod
+    def _matches_filter(metadata: Dict[str, Any], filter: Optional[Dict[str, Any]]) -> bool:
+        if not filter:
+            return True
+        return all(metadata.get(k) == v for k, v in filter.items())
+
+    def _iter_limited(self, items: Iterator[CheckpointTuple], limit: Optional[int]) -> Iterator[CheckpointTuple]:
+        for count, item in enumerate(items):
+            if limit is not None and count >= limit:
+                return
+            yield item
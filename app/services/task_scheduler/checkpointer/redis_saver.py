@@ -0,0 +1,312 @@
+"""
+基于Redis的检查点保存器
+检查点、通道数据和待写入数据分别存储，所有键带过期时间
+"""
+
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+)
+
+from app.core.config import settings
+from app.db.redis import get_redis
+from app.services.task_scheduler.checkpointer.base import EMPTY_TYPE, MESSAGE_LIST_TYPE, IncrementalCheckpointSaver
+
+
+def _text(value: Any) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class RedisCheckpointSaver(IncrementalCheckpointSaver):
+    """Redis检查点保存器"""
+
+    def __init__(self, client=None, ttl: Optional[int] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.client = client or get_redis(decode_responses=False)
+        self.ttl = ttl or settings.CHECKPOINT_TTL
+
+    # ---- 键名 ----
+
+    @staticmethod
+    def _index_key(thread_id: str, checkpoint_ns: str) -> str:
+        # 有序集合，成员为检查点ID，分数相同时按字典序排序（检查点ID本身按时间有序）
+        return f"checkpoint_index:{thread_id}:{checkpoint_ns}"
+
+    @staticmethod
+    def _checkpoint_key(thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> str:
+        return f"checkpoint:{thread_id}:{checkpoint_ns}:{checkpoint_id}"
+
+    @staticmethod
+    def _blob_key(thread_id: str, checkpoint_ns: str, channel: str, version: str) -> str:
+        return f"checkpoint_blob:{thread_id}:{checkpoint_ns}:{channel}:{version}"
+
+    @staticmethod
+    def _messages_key(thread_id: str, checkpoint_ns: str, channel: str) -> str:
+        # 哈希，字段为消息摘要，值为序列化后的消息
+        return f"checkpoint_messages:{thread_id}:{checkpoint_ns}:{channel}"
+
+    @staticmethod
+    def _writes_key(thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> str:
+        return f"checkpoint_writes:{thread_id}:{checkpoint_ns}:{checkpoint_id}"
+
+    # ---- 读取 ----
+
+    def _load_tuple(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> Optional[CheckpointTuple]:
+        data = self.client.hgetall(self._checkpoint_key(thread_id, checkpoint_ns, checkpoint_id))
+        if not data:
+            return None
+        checkpoint = self._load_value(_text(data[b"type"]), data[b"checkpoint"])
+        metadata = self._load_value(_text(data[b"metadata_type"]), data[b"metadata"])
+        parent_id = _text(data.get(b"parent_id", b"")) or None
+
+        # 一次往返加载检查点引用的全部通道版本
+        versions = list(checkpoint.get("channel_versions", {}).items())
+        pipe = self.client.pipeline(transaction=False)
+        for channel, version in versions:
+            pipe.hmget(self._blob_key(thread_id, checkpoint_ns, channel, str(version)), "type", "value")
+        pipe.hgetall(self._writes_key(thread_id, checkpoint_ns, checkpoint_id))
+        results = pipe.execute()
+
+        channel_values: Dict[str, Any] = {}
+        message_lists: Dict[str, List[str]] = {}
+        for (channel, _), (value_type, value) in zip(versions, results[:-1]):
+            if value_type is None:
+                continue
+            if _text(value_type) == MESSAGE_LIST_TYPE:
+                message_lists[channel] = self._message_digests(value)
+            elif _text(value_type) != EMPTY_TYPE:
+                channel_values[channel] = self._load_value(_text(value_type), value)
+        channel_values.update(self._load_messages(thread_id, checkpoint_ns, message_lists))
+
+        pending_writes = []
+        raw_writes = results[-1] or {}
+        entries = []
+        for field, packed in raw_writes.items():
+            task_id, _, idx = _text(field).rpartition(":")
+            entries.append((task_id, int(idx), packed))
+        for task_id, _, packed in sorted(entries, key=lambda e: (e[0], e[1])):
+            channel, value_type, value = self._unpack_write(packed)
+            pending_writes.append((task_id, channel, self._load_value(value_type, value)))
+
+        return CheckpointTuple(
+            config=self._thread_config(thread_id, checkpoint_ns, checkpoint_id),
+            checkpoint={**checkpoint, "channel_values": channel_values},
+            metadata=metadata,
+            parent_config=self._thread_config(thread_id, checkpoint_ns, parent_id) if parent_id else None,
+            pending_writes=pending_writes,
+        )
+
+    def _load_messages(self, thread_id: str, checkpoint_ns: str, message_lists: Dict[str, List[str]]) -> Dict[str, List[Any]]:
+        """一次往返按摘要加载消息通道引用的全部消息，并按顺序还原消息列表"""
+        channels = [channel for channel, digests in message_lists.items() if digests]
+        pipe = self.client.pipeline(transaction=False)
+        for channel in channels:
+            pipe.hmget(self._messages_key(thread_id, checkpoint_ns, channel), *dict.fromkeys(message_lists[channel]))
+        results = dict(zip(channels, pipe.execute() if channels else []))
+
+        loaded: Dict[str, List[Any]] = {}
+        for channel, digests in message_lists.items():
+            rows = {}
+            for digest, packed in zip(dict.fromkeys(digests), results.get(channel, [])):
+                if packed is not None:
+                    value_type, _, value = packed.partition(b"\x00")
+                    rows[digest] = (value_type.decode(), value)
+            loaded[channel] = self._join_messages(channel, digests, rows)
+        return loaded
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        configurable = config["configurable"]
+        thread_id = configurable["thread_id"]
+        checkpoint_ns = configurable.get("checkpoint_ns", "")
+        checkpoint_id = configurable.get("checkpoint_id")
+        if not checkpoint_id:
+            latest = self.client.zrevrange(self._index_key(thread_id, checkpoint_ns), 0, 0)
+            if not latest:
+                return None
+            checkpoint_id = _text(latest[0])
+        return self._load_tuple(thread_id, checkpoint_ns, checkpoint_id)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        # Redis保存器只支持按线程列出检查点
+        if not config:
+            return iter([])
+        configurable = config["configurable"]
+        thread_id = configurable["thread_id"]
+        checkpoint_ns = configurable.get("checkpoint_ns", "")
+        if configurable.get("checkpoint_id"):
+            checkpoint_ids = [configurable["checkpoint_id"]]
+        else:
+            checkpoint_ids = [_text(c) for c in self.client.zrevrange(self._index_key(thread_id, checkpoint_ns), 0, -1)]
+        if before:
+            before_id = before["configurable"]["checkpoint_id"]
+            checkpoint_ids = [c for c in checkpoint_ids if c < before_id]
+
+        tuples = (self._load_tuple(thread_id, checkpoint_ns, c) for c in checkpoint_ids)
+        return iter(list(self._iter_limited(
+            (t for t in tuples if t is not None and self._matches_filter(t.metadata, filter)), limit
+        )))
+
+    # ---- 写入 ----
+
+    @staticmethod
+    def _pack_write(channel: str, value_type: str, value: bytes) -> bytes:
+        return b"\x00".join([channel.encode(), value_type.encode(), value or b""])
+
+    @staticmethod
+    def _unpack_write(packed: bytes) -> Tuple[str, str, bytes]:
+        channel, value_type, value = packed.split(b"\x00", 2)
+        return channel.decode(), value_type.decode(), value
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        configurable = config["configurable"]
+        thread_id = configurable["thread_id"]
+        checkpoint_ns = configurable.get("checkpoint_ns", "")
+        parent_checkpoint_id = configurable.get("checkpoint_id") or ""
+
+        checkpoint_copy, blobs, messages = self._split_checkpoint(checkpoint, new_versions, thread_id, checkpoint_ns)
+        checkpoint_type, checkpoint_bytes = self.serde.dumps_typed(checkpoint_copy)
+        metadata_type, metadata_bytes = self.serde.dumps_typed(dict(metadata))
+
+        index_key = self._index_key(thread_id, checkpoint_ns)
+        checkpoint_key = self._checkpoint_key(thread_id, checkpoint_ns, checkpoint["id"])
+
+        pipe = self.client.pipeline(transaction=True)
+        # 消息通道只写入新增的消息，消息哈希的过期时间随每个检查点刷新
+        for channel, digest, value_type, value in messages:
+            pipe.hsetnx(self._messages_key(thread_id, checkpoint_ns, channel), digest, b"\x00".join([value_type.encode(), value or b""]))
+        for channel in self.message_channels.intersection(checkpoint.get("channel_versions", {})):
+            pipe.expire(self._messages_key(thread_id, checkpoint_ns, channel), self.ttl)
+        # 只写入本步发生变化的通道
+        for channel, version, value_type, value in blobs:
+            blob_key = self._blob_key(thread_id, checkpoint_ns, channel, version)
+            pipe.hset(blob_key, mapping={"type": value_type, "value": value or b""})
+            pipe.expire(blob_key, self.ttl)
+        pipe.hset(checkpoint_key, mapping={
+            "type": checkpoint_type,
+            "checkpoint": checkpoint_bytes,
+            "metadata_type": metadata_type,
+            "metadata": metadata_bytes,
+            "parent_id": parent_checkpoint_id,
+        })
+        pipe.expire(checkpoint_key, self.ttl)
+        pipe.zadd(index_key, {checkpoint["id"]: 0})
+        pipe.expire(index_key, self.ttl)
+        pipe.execute()
+
+        self._remember_messages(thread_id, checkpoint_ns, messages)
+        self._after_put(thread_id, checkpoint_ns)
+        return self._thread_config(thread_id, checkpoint_ns, checkpoint["id"])
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        configurable = config["configurable"]
+        writes_key = self._writes_key(
+            configurable["thread_id"], configurable.get("checkpoint_ns", ""), configurable["checkpoint_id"]
+        )
+        pipe = self.client.pipeline(transaction=True)
+        for idx, (channel, value) in enumerate(writes):
+            value_type, value_bytes = self.serde.dumps_typed(value)
+            field = f"{task_id}:{WRITES_IDX_MAP.get(channel, idx)}"
+            packed = self._pack_write(channel, value_type, value_bytes)
+            # 特殊通道以最新写入为准，普通写入保持幂等
+            if channel in WRITES_IDX_MAP:
+                pipe.hset(writes_key, field, packed)
+            else:
+                pipe.hsetnx(writes_key, field, packed)
+        pipe.expire(writes_key, self.ttl)
+        pipe.execute()
+
+    # ---- 压缩 ----
+
+    def compact(self, thread_id: str, checkpoint_ns: str = "", keep_last: Optional[int] = None) -> int:
+        keep_last = keep_last or self.keep_last
+        index_key = self._index_key(thread_id, checkpoint_ns)
+        checkpoint_ids = [_text(c) for c in self.client.zrevrange(index_key, 0, -1)]
+        if len(checkpoint_ids) <= keep_last:
+            return 0
+        kept, removed = checkpoint_ids[:keep_last], checkpoint_ids[keep_last:]
+
+        # 收集保留的检查点引用的通道版本，其余通道数据可以删除
+        referenced = set()
+        message_blobs = set()
+        pipe = self.client.pipeline(transaction=False)
+        for checkpoint_id in kept:
+            pipe.hmget(self._checkpoint_key(thread_id, checkpoint_ns, checkpoint_id), "type", "checkpoint")
+        for value_type, value in pipe.execute():
+            if value_type is None:
+                continue
+            checkpoint = self._load_value(_text(value_type), value)
+            for channel, version in checkpoint.get("channel_versions", {}).items():
+                blob_key = self._blob_key(thread_id, checkpoint_ns, channel, str(version))
+                referenced.add(blob_key)
+                if channel in self.message_channels:
+                    message_blobs.add((channel, blob_key))
+
+        # 保留的消息通道版本引用的消息，其余消息可以删除
+        referenced_messages: Dict[str, set] = defaultdict(set)
+        message_blobs = list(message_blobs)
+        pipe = self.client.pipeline(transaction=False)
+        for _, blob_key in message_blobs:
+            pipe.hmget(blob_key, "type", "value")
+        for (channel, _), (value_type, value) in zip(message_blobs, pipe.execute() if message_blobs else []):
+            if value_type is not None and _text(value_type) == MESSAGE_LIST_TYPE:
+                referenced_messages[channel].update(self._message_digests(value))
+        stale_messages: Dict[str, List[bytes]] = {}
+        for channel in self.message_channels:
+            messages_key = self._messages_key(thread_id, checkpoint_ns, channel)
+            stale = [field for field in self.client.hkeys(messages_key) if _text(field) not in referenced_messages[channel]]
+            if stale:
+                stale_messages[messages_key] = stale
+
+        stale_blobs: List[str] = [
+            _text(key)
+            for key in self.client.scan_iter(match=self._blob_key(thread_id, checkpoint_ns, "*", "*"), count=500)
+            if _text(key) not in referenced
+        ]
+
+        pipe = self.client.pipeline(transaction=True)
+        for checkpoint_id in removed:
+            pipe.delete(self._checkpoint_key(thread_id, checkpoint_ns, checkpoint_id))
+            pipe.delete(self._writes_key(thread_id, checkpoint_ns, checkpoint_id))
+        if removed:
+            pipe.zrem(index_key, *removed)
+        if stale_blobs:
+            pipe.delete(*stale_blobs)
+        for key, fields in stale_messages.items():
+            pipe.hdel(key, *fields)
+        pipe.execute()
+        self._forget_messages(thread_id, checkpoint_ns)
+        return len(removed)
+
+    def delete_thread(self, thread_id: str) -> None:
+        keys = []
+        for pattern in ("checkpoint_index", "checkpoint", "checkpoint_blob", "checkpoint_messages", "checkpoint_writes"):
+            keys.extend(self.client.scan_iter(match=f"{pattern}:{thread_id}:*", count=500))
+        if keys:
+            self.client.delete(*keys)
+        self._forget_messages(thread_id)
@@ -0,0 +1,351 @@
+"""
+基于PostgreSQL的检查点保存器
+复用应用的 SessionLocal 连接池
+"""
+
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+)
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.db.session import SessionLocal
+from app.models.checkpoint import AgentCheckpoint, AgentCheckpointBlob, AgentCheckpointMessage, AgentCheckpointWrite
+from app.services.task_scheduler.checkpointer.base import EMPTY_TYPE, MESSAGE_LIST_TYPE, IncrementalCheckpointSaver
+
+
+class SQLCheckpointSaver(IncrementalCheckpointSaver):
+    """SQL检查点保存器"""
+
+    def __init__(self, session_factory=SessionLocal, **kwargs):
+        super().__init__(**kwargs)
+        self.session_factory = session_factory
+
+    def _load_tuple(self, db: Session, row: AgentCheckpoint) -> CheckpointTuple:
+        """根据检查点记录组装完整的检查点（加载通道数据和待写入数据）"""
+        checkpoint = self._load_value(row.checkpoint_type, row.checkpoint)
+        metadata = self._load_value(row.metadata_type, row.checkpoint_metadata)
+
+        # 按检查点引用的 (通道, 版本) 一次性加载通道数据
+        channel_values: Dict[str, Any] = {}
+        versions = [(channel, str(version)) for channel, version in checkpoint.get("channel_versions", {}).items()]
+        if versions:
+            blobs = db.execute(
+                select(AgentCheckpointBlob.channel, AgentCheckpointBlob.value_type, AgentCheckpointBlob.value).where(
+                    AgentCheckpointBlob.thread_id == row.thread_id,
+                    AgentCheckpointBlob.checkpoint_ns == row.checkpoint_ns,
+                    tuple_(AgentCheckpointBlob.channel, AgentCheckpointBlob.version).in_(versions),
+                )
+            ).all()
+            message_lists: Dict[str, List[str]] = {}
+            for channel, value_type, value in blobs:
+                if value_type == MESSAGE_LIST_TYPE:
+                    message_lists[channel] = self._message_digests(value)
+                elif value_type != EMPTY_TYPE:
+                    channel_values[channel] = self._load_value(value_type, value)
+            channel_values.update(self._load_messages(db, row.thread_id, row.checkpoint_ns, message_lists))
+
+        writes = db.execute(
+            select(AgentCheckpointWrite)
+            .where(
+                AgentCheckpointWrite.thread_id == row.thread_id,
+                AgentCheckpointWrite.checkpoint_ns == row.checkpoint_ns,
+                AgentCheckpointWrite.checkpoint_id == row.checkpoint_id,
+            )
+            .order_by(AgentCheckpointWrite.task_id, AgentCheckpointWrite.idx)
+        ).scalars().all()
+
+        return CheckpointTuple(
+            config=self._thread_config(row.thread_id, row.checkpoint_ns, row.checkpoint_id),
+            checkpoint={**checkpoint, "channel_values": channel_values},
+            metadata=metadata,
+            parent_config=(
+                self._thread_config(row.thread_id, row.checkpoint_ns, row.parent_checkpoint_id)
+                if row.parent_checkpoint_id
+                else None
+            ),
+            pending_writes=[
+                (write.task_id, write.channel, self._load_value(write.value_type, write.value))
+                for write in writes
+            ],
+        )
+
+    def _load_messages(self, db: Session, thread_id: str, checkpoint_ns: str, message_lists: Dict[str, List[str]]) -> Dict[str, List[Any]]:
+        """按摘要一次性加载消息通道引用的全部消息，并按顺序还原消息列表"""
+        digests = {digest for digest_list in message_lists.values() for digest in digest_list}
+        if not digests:
+            return {channel: [] for channel in message_lists}
+        rows: Dict[str, Dict[str, Tuple[str, Optional[bytes]]]] = {channel: {} for channel in message_lists}
+        for channel, digest, value_type, value in db.execute(
+            select(
+                AgentCheckpointMessage.channel, AgentCheckpointMessage.digest,
+                AgentCheckpointMessage.value_type, AgentCheckpointMessage.value,
+            ).where(
+                AgentCheckpointMessage.thread_id == thread_id,
+                AgentCheckpointMessage.checkpoint_ns == checkpoint_ns,
+                AgentCheckpointMessage.channel.in_(list(message_lists)),
+                AgentCheckpointMessage.digest.in_(list(digests)),
+            )
+        ).all():
+            rows[channel][digest] = (value_type, value)
+        return {
+            channel: self._join_messages(channel, digest_list, rows[channel])
+            for channel, digest_list in message_lists.items()
+        }
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        configurable = config["configurable"]
+        thread_id = configurable["thread_id"]
+        checkpoint_ns = configurable.get("checkpoint_ns", "")
+        checkpoint_id = configurable.get("checkpoint_id")
+
+        with self.session_factory() as db:
+            query = select(AgentCheckpoint).where(
+                AgentCheckpoint.thread_id == thread_id,
+                AgentCheckpoint.checkpoint_ns == checkpoint_ns,
+            )
+            if checkpoint_id:
+                query = query.where(AgentCheckpoint.checkpoint_id == checkpoint_id)
+            else:
+                query = query.order_by(AgentCheckpoint.checkpoint_id.desc()).limit(1)
+            row = db.execute(query).scalars().first()
+            if not row:
+                return None
+            return self._load_tuple(db, row)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        with self.session_factory() as db:
+            query = select(AgentCheckpoint)
+            if config:
+                configurable = config["configurable"]
+                query = query.where(AgentCheckpoint.thread_id == configurable["thread_id"])
+                if "checkpoint_ns" in configurable:
+                    query = query.where(AgentCheckpoint.checkpoint_ns == configurable["checkpoint_ns"])
+                if configurable.get("checkpoint_id"):
+                    query = query.where(AgentCheckpoint.checkpoint_id == configurable["checkpoint_id"])
+            if before:
+                query = query.where(AgentCheckpoint.checkpoint_id < before["configurable"]["checkpoint_id"])
+            query = query.order_by(AgentCheckpoint.checkpoint_id.desc())
+            if limit is not None and not filter:
+                query = query.limit(limit)
+
+            rows = db.execute(query).scalars().all()
+            tuples = (self._load_tuple(db, row) for row in rows)
+            items = [
+                item for item in self._iter_limited(
+                    (t for t in tuples if self._matches_filter(t.metadata, filter)), limit
+                )
+            ]
+        return iter(items)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        configurable = config["configurable"]
+        thread_id = configurable["thread_id"]
+        checkpoint_ns = configurable.get("checkpoint_ns", "")
+        parent_checkpoint_id = configurable.get("checkpoint_id")
+
+        checkpoint_copy, blobs, messages = self._split_checkpoint(checkpoint, new_versions, thread_id, checkpoint_ns)
+        checkpoint_type, checkpoint_bytes = self.serde.dumps_typed(checkpoint_copy)
+        metadata_type, metadata_bytes = self.serde.dumps_typed(dict(metadata))
+
+        with self.session_factory() as db:
+            # 消息通道只写入新增的消息，已存在的消息直接跳过
+            if messages:
+                db.execute(
+                    insert(AgentCheckpointMessage)
+                    .values([
+                        {
+                            "thread_id": thread_id,
+                            "checkpoint_ns": checkpoint_ns,
+                            "channel": channel,
+                            "digest": digest,
+                            "value_type": value_type,
+                            "value": value,
+                        }
+                        for channel, digest, value_type, value in messages
+                    ])
+                    .on_conflict_do_nothing(constraint="uq_agent_checkpoint_message")
+                )
+            # 只写入本步发生变化的通道，已存在的版本直接跳过
+            if blobs:
+                db.execute(
+                    insert(AgentCheckpointBlob)
+                    .values([
+                        {
+                            "thread_id": thread_id,
+                            "checkpoint_ns": checkpoint_ns,
+                            "channel": channel,
+                            "version": version,
+                            "value_type": value_type,
+                            "value": value,
+                        }
+                        for channel, version, value_type, value in blobs
+                    ])
+                    .on_conflict_do_nothing(constraint="uq_agent_checkpoint_blob")
+                )
+            # 元数据列名为metadata，这里直接按表的列名写入
+            db.execute(
+                insert(AgentCheckpoint.__table__)
+                .values({
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint["id"],
+                    "parent_checkpoint_id": parent_checkpoint_id,
+                    "checkpoint_type": checkpoint_type,
+                    "checkpoint": checkpoint_bytes,
+                    "metadata_type": metadata_type,
+                    "metadata": metadata_bytes,
+                })
+                .on_conflict_do_update(
+                    constraint="uq_agent_checkpoint",
+                    set_={
+                        "checkpoint_type": checkpoint_type,
+                        "checkpoint": checkpoint_bytes,
+                        "metadata_type": metadata_type,
+                        "metadata": metadata_bytes,
+                    },
+                )
+            )
+            db.commit()
+
+        self._remember_messages(thread_id, checkpoint_ns, messages)
+        self._after_put(thread_id, checkpoint_ns)
+        return self._thread_config(thread_id, checkpoint_ns, checkpoint["id"])
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        configurable = config["configurable"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            value_type, value_bytes = self.serde.dumps_typed(value)
+            rows.append({
+                "thread_id": configurable["thread_id"],
+                "checkpoint_ns": configurable.get("checkpoint_ns", ""),
+                "checkpoint_id": configurable["checkpoint_id"],
+                "task_id": task_id,
+                "task_path": task_path,
+                "idx": WRITES_IDX_MAP.get(channel, idx),
+                "channel": channel,
+                "value_type": value_type,
+                "value": value_bytes,
+            })
+        if not rows:
+            return
+
+        statement = insert(AgentCheckpointWrite).values(rows)
+        # 特殊通道（错误、中断等）以最新写入为准，普通写入保持幂等
+        if all(channel in WRITES_IDX_MAP for channel, _ in writes):
+            statement = statement.on_conflict_do_update(
+                constraint="uq_agent_checkpoint_write",
+                set_={
+                    "channel": statement.excluded.channel,
+                    "value_type": statement.excluded.value_type,
+                    "value": statement.excluded.value,
+                },
+            )
+        else:
+            statement = statement.on_conflict_do_nothing(constraint="uq_agent_checkpoint_write")
+
+        with self.session_factory() as db:
+            db.execute(statement)
+            db.commit()
+
+    def compact(self, thread_id: str, checkpoint_ns: str = "", keep_last: Optional[int] = None) -> int:
+        keep_last = keep_last or self.keep_last
+        with self.session_factory() as db:
+            rows = db.execute(
+                select(AgentCheckpoint.checkpoint_id, AgentCheckpoint.checkpoint_type, AgentCheckpoint.checkpoint)
+                .where(AgentCheckpoint.thread_id == thread_id, AgentCheckpoint.checkpoint_ns == checkpoint_ns)
+                .order_by(AgentCheckpoint.checkpoint_id.desc())
+            ).all()
+            if len(rows) <= keep_last:
+                return 0
+
+            kept, removed = rows[:keep_last], [row.checkpoint_id for row in rows[keep_last:]]
+
+            # 收集保留的检查点仍在引用的通道版本
+            referenced = set()
+            for row in kept:
+                checkpoint = self._load_value(row.checkpoint_type, row.checkpoint)
+                referenced.update((channel, str(version)) for channel, version in checkpoint.get("channel_versions", {}).items())
+
+            db.execute(
+                delete(AgentCheckpointWrite).where(
+                    AgentCheckpointWrite.thread_id == thread_id,
+                    AgentCheckpointWrite.checkpoint_ns == checkpoint_ns,
+                    AgentCheckpointWrite.checkpoint_id.in_(removed),
+                )
+            )
+            db.execute(
+                delete(AgentCheckpoint).where(
+                    AgentCheckpoint.thread_id == thread_id,
+                    AgentCheckpoint.checkpoint_ns == checkpoint_ns,
+                    AgentCheckpoint.checkpoint_id.in_(removed),
+                )
+            )
+            blob_query = delete(AgentCheckpointBlob).where(
+                AgentCheckpointBlob.thread_id == thread_id,
+                AgentCheckpointBlob.checkpoint_ns == checkpoint_ns,
+            )
+            if referenced:
+                blob_query = blob_query.where(
+                    tuple_(AgentCheckpointBlob.channel, AgentCheckpointBlob.version).not_in(list(referenced))
+                )
+            db.execute(blob_query)
+
+            # 删除保留的消息通道版本不再引用的消息
+            referenced_messages = set()
+            if referenced:
+                for channel, value in db.execute(
+                    select(AgentCheckpointBlob.channel, AgentCheckpointBlob.value).where(
+                        AgentCheckpointBlob.thread_id == thread_id,
+                        AgentCheckpointBlob.checkpoint_ns == checkpoint_ns,
+                        AgentCheckpointBlob.value_type == MESSAGE_LIST_TYPE,
+                    )
+                ).all():
+                    referenced_messages.update((channel, digest) for digest in self._message_digests(value))
+            message_query = delete(AgentCheckpointMessage).where(
+                AgentCheckpointMessage.thread_id == thread_id,
+                AgentCheckpointMessage.checkpoint_ns == checkpoint_ns,
+            )
+            if referenced_messages:
+                message_query = message_query.where(
+                    tuple_(AgentCheckpointMessage.channel, AgentCheckpointMessage.digest).not_in(list(referenced_messages))
+                )
+            db.execute(message_query)
+            db.commit()
+        self._forget_messages(thread_id, checkpoint_ns)
+        return len(removed)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self.session_factory() as db:
+            for model in (AgentCheckpointWrite, AgentCheckpointMessage, AgentCheckpointBlob, AgentCheckpoint):
+                db.execute(delete(model).where(model.thread_id == thread_id))
+            db.commit()
+        self._forget_messages(thread_id)
@@ -0,0 +1,161 @@
+"""
+Agent上下文窗口管理
+按token预算裁剪消息历史：固定保留系统提示、任务描述和执行计划，
+超出预算时将最早的对话轮次压缩为摘要并从状态中移除
+"""
+
+import json
+import logging
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage, SystemMessage, ToolMessage
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 摘要中每条被移除消息保留的最大字符数
+SUMMARY_LINE_CHARS = 200
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    """获取tiktoken编码器，无法加载时退回按字符估算"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"无法加载tiktoken编码器，使用字符数估算token: {str(e)}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """计算文本的token数"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        # 中文约1字1token，英文约4字符1token，这里取偏保守的估算
+        return len(text) // 2 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _message_text(msg: Any) -> str:
+    content = getattr(msg, "content", msg)
+    if not isinstance(content, str):
+        content = json.dumps(content, ensure_ascii=False, default=str)
+    tool_calls = getattr(msg, "tool_calls", None)
+    if tool_calls:
+        content += json.dumps(tool_calls, ensure_ascii=False, default=str)
+    return content
+
+
+def count_message_tokens(msg: Any) -> int:
+    """计算单条消息的token数（含少量角色开销）"""
+    return count_tokens(_message_text(msg)) + 4
+
+
+def _role(msg: Any) -> str:
+    if isinstance(msg, SystemMessage):
+        return "system"
+    if isinstance(msg, HumanMessage):
+        return "user"
+    if isinstance(msg, AIMessage):
+        return "assistant"
+    if isinstance(msg, ToolMessage):
+        return "tool"
+    return "function"
+
+
+def _group_turns(messages: List[Any]) -> List[List[Any]]:
+    """将消息按轮次分组，带工具调用的AI消息与其工具结果必须一起保留或移除"""
+    turns: List[List[Any]] = []
+    for msg in messages:
+        if isinstance(msg, ToolMessage) and turns:
+            turns[-1].append(msg)
+        else:
+            turns.append([msg])
+    return turns
+
+
+def render_pinned_context(plan: Optional[List[Dict[str, Any]]], summary: Optional[str]) -> Optional[SystemMessage]:
+    """渲染固定保留的执行计划和历史摘要"""
+    sections = []
+    if plan:
+        sections.append("当前执行计划:\n" + "\n".join(step.get("description", "") for step in plan))
+    if summary:
+        sections.append("此前执行过程摘要:\n" + summary)
+    if not sections:
+        return None
+    return SystemMessage(content="\n\n".join(sections))
+
+
+def build_prompt(system_prompt: str, state: Dict[str, Any]) -> List[Any]:
+    """构建发送给LLM的消息：系统提示 + 固定上下文 + 当前窗口内的消息"""
+    prompt = [SystemMessage(content=system_prompt)]
+    pinned = render_pinned_context(state.get("plan"), state.get("context_summary"))
+    if pinned is not None:
+        prompt.append(pinned)
+    return prompt + list(state.get("messages", []))
+
+
+def manage_context(state: Dict[str, Any], token_budget: Optional[int] = None) -> Dict[str, Any]:
+    """
+    上下文管理节点：消息总token超出预算时，移除最早的对话轮次并更新摘要
+
+    Args:
+        state: Agent状态
+        token_budget: token预算，默认取配置
+
+    Returns:
+        状态更新
+    """
+    token_budget = token_budget or settings.AGENT_CONTEXT_TOKEN_BUDGET
+    messages = list(state.get("messages", []))
+    summary = state.get("context_summary") or ""
+    stats = dict(state.get("context_stats") or {"tokens_saved": 0, "evicted_messages": 0, "compactions": 0})
+
+    token_counts = [count_message_tokens(m) for m in messages]
+    plan_tokens = count_tokens(_message_text(render_pinned_context(state.get("plan"), None))) if state.get("plan") else 0
+    total = sum(token_counts) + count_tokens(summary) + plan_tokens
+    stats["context_tokens"] = total
+    if total <= token_budget or len(messages) <= 2:
+        return {"context_stats": stats}
+
+    # 第一条用户消息是任务描述，固定保留
+    pinned_index = next((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), None)
+    candidates = [m for i, m in enumerate(messages) if i != pinned_index]
+    tokens_by_id = {id(m): t for m, t in zip(messages, token_counts)}
+    turns = _group_turns(candidates)
+
+    evicted: List[Any] = []
+    # 至少保留最近一轮，保证Agent能看到最新的工具结果或回复
+    while len(turns) > 1 and total > token_budget:
+        turn = turns.pop(0)
+        evicted.extend(turn)
+        total -= sum(tokens_by_id[id(m)] for m in turn)
+
+    if not evicted:
+        return {"context_stats": stats}
+
+    # 提取式摘要，不额外调用LLM；摘要本身也受预算约束，只保留最近的部分
+    lines = summary.split("\n") if summary else []
+    lines.extend(f"[{_role(m)}] {_message_text(m)[:SUMMARY_LINE_CHARS]}" for m in evicted)
+    summary_budget = max(token_budget // 4, 1)
+    while len(lines) > 1 and count_tokens("\n".join(lines)) > summary_budget:
+        lines.pop(0)
+    new_summary = "\n".join(lines)
+
+    evicted_tokens = sum(tokens_by_id[id(m)] for m in evicted)
+    stats["tokens_saved"] += max(evicted_tokens - (count_tokens(new_summary) - count_tokens(summary)), 0)
+    stats["evicted_messages"] += len(evicted)
+    stats["compactions"] += 1
+    stats["context_tokens"] = total - count_tokens(summary) + count_tokens(new_summary)
+
+    logger.info(f"上下文超出预算，移除{len(evicted)}条消息，累计节省{stats['tokens_saved']}个token")
+    return {
+        "messages": [RemoveMessage(id=m.id) for m in evicted if getattr(m, "id", None)],
+        "context_summary": new_summary,
+        "context_stats": stats
+    }
@@ -0,0 +1,198 @@
+"""
+Agent执行事件流
+从LangGraph的 astream_events 中提取节点级事件（计划、工具调用、反思、token增量），
+通过Redis发布/订阅分发给所有订阅该任务的客户端，同时维护任务状态快照
+"""
+
+import json
+import logging
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Optional
+
+from langchain_core.runnables import RunnableConfig
+
+from app.core.config import settings
+from app.db.redis import get_async_redis
+
+logger = logging.getLogger(__name__)
+
+# 终止事件，订阅方收到后结束推送
+TERMINAL_EVENTS = {"completed", "failed", "cancelled"}
+
+# 工具输出在事件中保留的最大字符数
+MAX_EVENT_TEXT = 2000
+
+# LangGraph默认的最大执行步数（未在配置中指定recursion_limit时）
+DEFAULT_RECURSION_LIMIT = 25
+
+
+def _channel(task_id: str) -> str:
+    return f"task_events:{task_id}"
+
+
+def _status_key(task_id: str) -> str:
+    return f"task_status:{task_id}"
+
+
+def _truncate(value: Any) -> Any:
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+    return text if len(text) <= MAX_EVENT_TEXT else text[:MAX_EVENT_TEXT] + "..."
+
+
+async def publish_event(task_id: str, event_type: str, data: Optional[Dict[str, Any]] = None, status: Optional[str] = None) -> None:
+    """
+    发布任务事件
+
+    Args:
+        task_id: 任务ID
+        event_type: 事件类型
+        data: 事件数据
+        status: 需要同时写入状态快照的任务状态，token增量等高频事件不更新快照
+    """
+    event = {
+        "type": event_type,
+        "task_id": task_id,
+        "data": data or {},
+        "timestamp": datetime.now().isoformat()
+    }
+    try:
+        client = get_async_redis()
+        pipe = client.pipeline(transaction=False)
+        pipe.publish(_channel(task_id), json.dumps(event, ensure_ascii=False, default=str))
+        if event_type != "token":
+            mapping = {"last_event": event_type, "updated_at": event["timestamp"]}
+            if status:
+                mapping["status"] = status
+            for field in ("step", "progress"):
+                if field in (data or {}):
+                    mapping[field] = data[field]
+            pipe.hset(_status_key(task_id), mapping=mapping)
+            pipe.expire(_status_key(task_id), settings.TASK_EVENT_TTL)
+        await pipe.execute()
+    except Exception as e:
+        # 事件推送失败不影响任务执行
+        logger.warning(f"任务事件发布失败: {task_id}, 事件: {event_type}, 错误: {str(e)}")
+
+
+async def get_status_snapshot(task_id: str) -> Dict[str, Any]:
+    """读取任务状态快照"""
+    client = get_async_redis()
+    return await client.hgetall(_status_key(task_id))
+
+
+async def subscribe_events(task_id: str, heartbeat: float = 15.0) -> AsyncIterator[Optional[Dict[str, Any]]]:
+    """
+    订阅任务事件
+
+    先推送当前状态快照，再持续推送新事件，直到收到终止事件；
+    超过heartbeat秒没有事件时产出None，供调用方发送心跳
+
+    Args:
+        task_id: 任务ID
+        heartbeat: 心跳间隔（秒）
+    """
+    client = get_async_redis()
+    pubsub = client.pubsub()
+    # 先订阅再读快照，避免两者之间的事件丢失
+    await pubsub.subscribe(_channel(task_id))
+    try:
+        snapshot = await get_status_snapshot(task_id)
+        if snapshot:
+            yield {"type": "snapshot", "task_id": task_id, "data": snapshot, "timestamp": snapshot.get("updated_at")}
+            if snapshot.get("status") in TERMINAL_EVENTS:
+                return
+
+        while True:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=heartbeat)
+            if message is None:
+                yield None
+                continue
+            event = json.loads(message["data"])
+            yield event
+            if event.get("type") in TERMINAL_EVENTS:
+                return
+    finally:
+        await pubsub.unsubscribe(_channel(task_id))
+        await pubsub.close()
+
+
+def new_run_metrics() -> Dict[str, int]:
+    """创建一次Agent执行的统计指标"""
+    return {
+        "steps": 0,
+        "tool_calls": 0,
+        "llm_calls": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "total_tokens": 0
+    }
+
+
+def _record_usage(metrics: Dict[str, int], output: Any) -> None:
+    """累计LLM调用的token用量"""
+    metrics["llm_calls"] += 1
+    usage = getattr(output, "usage_metadata", None) or {}
+    metrics["prompt_tokens"] += usage.get("input_tokens", 0)
+    metrics["completion_tokens"] += usage.get("output_tokens", 0)
+    metrics["total_tokens"] += usage.get("total_tokens", 0)
+
+
+async def stream_workflow(
+    workflow,
+    graph_input: Optional[Dict[str, Any]],
+    config: RunnableConfig,
+    task_id: str,
+    metrics: Optional[Dict[str, int]] = None
+) -> Dict[str, Any]:
+    """
+    流式执行工作流并发布节点级事件
+
+    Args:
+        workflow: 已编译的LangGraph工作流
+        graph_input: 工作流输入，为None时从检查点继续
+        config: 工作流配置（包含thread_id）
+        task_id: 任务ID
+        metrics: 执行统计（步骤数、工具调用数、token用量），传入时在执行过程中累计
+
+    Returns:
+        工作流最终状态
+    """
+    metrics = metrics if metrics is not None else new_run_metrics()
+    step = 0
+    # 工作流最多执行recursion_limit步，按已执行步数估算进度，任务结束前不超过99
+    step_budget = config.get("recursion_limit") or DEFAULT_RECURSION_LIMIT
+    async for event in workflow.astream_events(graph_input, config, version="v2"):
+        kind = event["event"]
+        name = event.get("name")
+        node = event.get("metadata", {}).get("langgraph_node")
+
+        if kind == "on_chat_model_stream":
+            content = getattr(event["data"].get("chunk"), "content", None)
+            if content:
+                await publish_event(task_id, "token", {"node": node, "content": content})
+        elif kind == "on_chat_model_end":
+            _record_usage(metrics, event["data"].get("output"))
+        elif kind == "on_tool_start":
+            metrics["tool_calls"] += 1
+            await publish_event(task_id, "tool_called", {"tool": name, "input": _truncate(event["data"].get("input"))})
+        elif kind == "on_tool_end":
+            output = event["data"].get("output")
+            await publish_event(task_id, "tool_result", {"tool": name, "output": _truncate(getattr(output, "content", output))})
+        elif kind == "on_chain_start" and node and name == node:
+            step += 1
+            metrics["steps"] = step
+            progress = min(99, step * 100 // step_budget)
+            await publish_event(task_id, "node_started", {"node": node, "step": step, "progress": progress}, status="in_progress")
+        elif kind == "on_chain_end" and node and name == node:
+            output = event["data"].get("output") or {}
+            if node == "plan" and isinstance(output, dict):
+                await publish_event(task_id, "plan_created", {"plan": output.get("plan"), "step": step})
+            elif node == "reflect" and isinstance(output, dict):
+                reflections = output.get("reflections") or []
+                await publish_event(task_id, "reflection", {"reflection": reflections[-1] if reflections else None, "step": step})
+            else:
+                await publish_event(task_id, "node_finished", {"node": node, "step": step})
+
+    # 最终状态从检查点读取
+    snapshot = await workflow.aget_state(config)
+    return snapshot.values
@@ -0,0 +1,228 @@
+"""
+LLM客户端注册表
+在进程内按 提供方/模型/温度/工具集 缓存并复用已绑定工具的LLM客户端，
+所有客户端共享带连接池的HTTP客户端，避免每个Agent步骤重复建连。
+异步连接绑定事件循环（Celery Worker中每个任务使用独立的事件循环），
+因此客户端按事件循环分别缓存，与 app/db/redis.py 的做法一致；
+短生命周期的事件循环（如 asyncio.run）结束前需调用 arelease_scope 关闭其连接池
+"""
+
+import asyncio
+import os
+import threading
+import time
+import weakref
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+from app.core.config import settings
+
+SILICONFLOW_BASE_URL = "https://api.siliconflow.cn/v1"
+
+
+@dataclass(frozen=True)
+class LLMConfig:
+    """LLM客户端配置，同时作为注册表的缓存键"""
+    provider: str  # siliconflow, anthropic, openai
+    model: str
+    temperature: float
+    base_url: Optional[str] = None
+
+
+def resolve_llm_config(temperature: float = 0.2) -> LLMConfig:
+    """根据环境变量决定使用的LLM提供方和模型"""
+    # 检查是否配置了SiliconFlow API密钥
+    if os.getenv("SILICONFLOW_API_KEY"):
+        return LLMConfig(
+            provider="siliconflow",
+            model="black-forest-labs/FLUX.1-dev",  # 或其他可用模型
+            temperature=temperature,
+            base_url=SILICONFLOW_BASE_URL
+        )
+    # 优先使用Anthropic模型，如果没有则使用OpenAI
+    if os.getenv("ANTHROPIC_API_KEY"):
+        return LLMConfig(
+            provider="anthropic",
+            model="claude-3-sonnet-20240229",
+            temperature=temperature
+        )
+    # 默认使用OpenAI
+    return LLMConfig(
+        provider="openai",
+        model="gpt-4-turbo",
+        temperature=temperature
+    )
+
+
+def _toolset_key(tools: Optional[Sequence[Any]]) -> Tuple[str, ...]:
+    """工具集的缓存键，按工具名排序后保证顺序无关"""
+    if not tools:
+        return ()
+    return tuple(sorted(getattr(t, "name", str(t)) for t in tools))
+
+
+@dataclass
+class _LoopScope:
+    """绑定到同一事件循环的客户端"""
+    base_clients: Dict[LLMConfig, Any] = field(default_factory=dict)
+    bound_clients: Dict[Tuple[LLMConfig, Tuple[str, ...]], Any] = field(default_factory=dict)
+    http_async_client: Optional[httpx.AsyncClient] = None
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class LLMClientRegistry:
+    """进程级LLM客户端注册表"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 按事件循环缓存，事件循环被回收后对应的客户端随之释放；不在事件循环中（同步调用）时使用默认作用域
+        self._loop_scopes: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopScope]" = weakref.WeakKeyDictionary()
+        self._default_scope = _LoopScope()
+        self._http_client: Optional[httpx.Client] = None
+        self._hits = 0
+        self._misses = 0
+        self._constructions = 0
+        self._construction_time = 0.0
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=settings.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY
+        )
+
+    def _scope(self) -> _LoopScope:
+        """当前事件循环的客户端作用域（调用方需持有锁）"""
+        loop = _running_loop()
+        if loop is None:
+            return self._default_scope
+        scope = self._loop_scopes.get(loop)
+        if scope is None:
+            scope = self._loop_scopes[loop] = _LoopScope()
+        return scope
+
+    def _scopes(self) -> List[_LoopScope]:
+        return [self._default_scope, *self._loop_scopes.values()]
+
+    def _get_http_clients(self, scope: _LoopScope) -> Tuple[httpx.Client, httpx.AsyncClient]:
+        """获取共享的HTTP客户端：同步客户端进程内共享，异步客户端按事件循环共享（调用方需持有锁）"""
+        if self._http_client is None:
+            self._http_client = httpx.Client(limits=self._limits(), timeout=settings.LLM_TIMEOUT)
+        if scope.http_async_client is None:
+            scope.http_async_client = httpx.AsyncClient(limits=self._limits(), timeout=settings.LLM_TIMEOUT)
+        return self._http_client, scope.http_async_client
+
+    def _build(self, config: LLMConfig, scope: _LoopScope) -> Any:
+        """构建未绑定工具的基础客户端（调用方需持有锁）"""
+        if config.provider == "anthropic":
+            from langchain_anthropic import ChatAnthropic
+            return ChatAnthropic(
+                model=config.model,
+                temperature=config.temperature,
+                timeout=settings.LLM_TIMEOUT
+            )
+
+        # 使用OpenAI包，硅基流动同样兼容OpenAI协议
+        from langchain_openai import ChatOpenAI
+        http_client, http_async_client = self._get_http_clients(scope)
+        kwargs: Dict[str, Any] = {
+            "model": config.model,
+            "temperature": config.temperature,
+            "http_client": http_client,
+            "http_async_client": http_async_client,
+            # 流式输出时同样返回token用量，用于统计Agent的消耗
+            "stream_usage": True
+        }
+        if config.provider == "siliconflow":
+            kwargs["api_key"] = os.getenv("SILICONFLOW_API_KEY")
+            kwargs["base_url"] = config.base_url
+        return ChatOpenAI(**kwargs)
+
+    def get(self, tools: Optional[Sequence[Any]] = None, config: Optional[LLMConfig] = None) -> Any:
+        """
+        获取绑定了指定工具集的LLM客户端，在事件循环中调用时返回绑定该事件循环的客户端
+
+        Args:
+            tools: 需要绑定的工具列表
+            config: LLM配置，默认根据环境变量解析
+
+        Returns:
+            可复用的LLM客户端
+        """
+        config = config or resolve_llm_config()
+        key = (config, _toolset_key(tools))
+
+        with self._lock:
+            scope = self._scope()
+            client = scope.bound_clients.get(key)
+            if client is not None:
+                self._hits += 1
+                return client
+
+            self._misses += 1
+            start = time.perf_counter()
+            base_client = scope.base_clients.get(config)
+            if base_client is None:
+                base_client = self._build(config, scope)
+                scope.base_clients[config] = base_client
+            client = base_client.bind_tools(list(tools)) if tools else base_client
+            self._constructions += 1
+            self._construction_time += time.perf_counter() - start
+            scope.bound_clients[key] = client
+            return client
+
+    async def arelease_scope(self) -> None:
+        """
+        释放当前事件循环缓存的客户端并关闭其异步HTTP连接池
+
+        需在事件循环关闭前调用，否则保持的长连接不会关闭，
+        且连接持有事件循环的引用，作用域也无法随事件循环回收
+        """
+        loop = _running_loop()
+        if loop is None:
+            return
+        with self._lock:
+            scope = self._loop_scopes.pop(loop, None)
+        if scope is not None and scope.http_async_client is not None:
+            await scope.http_async_client.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中/未命中次数和客户端构建耗时"""
+        with self._lock:
+            scopes = self._scopes()
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "constructions": self._constructions,
+                "construction_time": self._construction_time,
+                "cached_clients": sum(len(scope.bound_clients) for scope in scopes),
+                "event_loops": len(self._loop_scopes),
+                "providers": sorted({c.provider for scope in scopes for c in scope.base_clients})
+            }
+
+    def clear(self) -> None:
+        """清空缓存并关闭共享的HTTP连接池"""
+        with self._lock:
+            self._loop_scopes.clear()
+            self._default_scope = _LoopScope()
+            if self._http_client is not None:
+                self._http_client.close()
+                self._http_client = None
+            # 异步客户端在事件循环外无法await关闭，交由垃圾回收释放
+
+
+# 进程级共享注册表
+llm_registry = LLMClientRegistry()
+
+
+def get_llm_client(tools: Optional[List[Any]] = None, temperature: float = 0.2) -> Any:
+    """从共享注册表获取绑定工具的LLM客户端"""
+    return llm_registry.get(tools, resolve_llm_config(temperature))
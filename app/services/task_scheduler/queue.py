@@ -0,0 +1,119 @@
+"""
+Agent任务分布式队列
+基于Celery/Redis，将Agent执行从API进程转移到可水平扩展的Worker池
+
+启动Worker:
+    celery -A app.services.task_scheduler.queue worker -Q agent.high,agent.default,agent.low
+"""
+
+import asyncio
+from typing import Any, Dict, Optional
+
+from celery import Celery, signals
+from kombu import Queue
+
+from app.core.config import settings
+
+# 优先级队列，兼容中文和英文的优先级取值
+HIGH_QUEUE = "agent.high"
+DEFAULT_QUEUE = "agent.default"
+LOW_QUEUE = "agent.low"
+
+PRIORITY_QUEUES = {
+    "高": HIGH_QUEUE,
+    "high": HIGH_QUEUE,
+    "中": DEFAULT_QUEUE,
+    "medium": DEFAULT_QUEUE,
+    "低": LOW_QUEUE,
+    "low": LOW_QUEUE,
+}
+
+# 同一队列内的消息优先级（Redis broker中数值越小越优先）
+QUEUE_PRIORITIES = {
+    HIGH_QUEUE: 0,
+    DEFAULT_QUEUE: 5,
+    LOW_QUEUE: 9,
+}
+
+celery_app = Celery(
+    "lifu_butler",
+    broker="memory://" if settings.CELERY_TASK_ALWAYS_EAGER else settings.CELERY_BROKER_URL,
+    backend="cache+memory://" if settings.CELERY_TASK_ALWAYS_EAGER else settings.CELERY_RESULT_BACKEND,
+)
+
+celery_app.conf.update(
+    task_serializer="json",
+    result_serializer="json",
+    accept_content=["json"],
+    task_queues=(Queue(HIGH_QUEUE), Queue(DEFAULT_QUEUE), Queue(LOW_QUEUE)),
+    task_default_queue=DEFAULT_QUEUE,
+    # Worker按队列顺序优先消费高优先级队列
+    broker_transport_options={"queue_order_strategy": "priority", "priority_steps": list(range(10))},
+    # 每个Worker的并发上限，且一次只预取一个任务，避免长任务占住短任务
+    worker_concurrency=settings.AGENT_WORKER_CONCURRENCY,
+    worker_prefetch_multiplier=1,
+    # 执行完成后再确认，Worker崩溃时任务会重新投递
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    task_track_started=True,
+    task_time_limit=settings.AGENT_TASK_TIME_LIMIT,
+    result_expires=settings.CELERY_RESULT_EXPIRES,
+    result_extended=True,
+    # 测试时可用内存broker并同步执行
+    task_always_eager=settings.CELERY_TASK_ALWAYS_EAGER,
+    task_eager_propagates=False,
+    task_store_eager_result=True,
+)
+
+
+def resolve_queue(priority: Optional[str]) -> str:
+    """根据任务优先级选择队列"""
+    if not priority:
+        return DEFAULT_QUEUE
+    return PRIORITY_QUEUES.get(priority.strip().lower(), DEFAULT_QUEUE)
+
+
+@celery_app.task(
+    bind=True,
+    name="agent.run",
+    autoretry_for=(Exception,),
+    retry_backoff=True,
+    retry_backoff_max=settings.AGENT_TASK_RETRY_BACKOFF_MAX,
+    retry_jitter=True,
+    max_retries=settings.AGENT_TASK_MAX_RETRIES,
+)
+def run_agent_task(
+    self,
+    task_id: str,
+    task_description: str,
+    use_reflection: bool = False,
+    use_siliconflow: bool = False
+) -> Dict[str, Any]:
+    """在Worker中执行Agent任务，失败时按指数退避重试"""
+    return asyncio.run(_run_agent(
+        task_id,
+        task_description,
+        use_reflection=use_reflection,
+        use_siliconflow=use_siliconflow,
+        attempt=self.request.retries + 1
+    ))
+
+
+async def _run_agent(task_id: str, task_description: str, **kwargs: Any) -> Dict[str, Any]:
+    """执行Agent任务，结束时释放绑定本次事件循环的LLM客户端（每个任务使用独立的事件循环）"""
+    # 延迟导入，避免Worker启动时的循环依赖
+    from app.services.task_scheduler.llm_registry import llm_registry
+    from app.services.task_scheduler.service import TaskSchedulerService
+
+    try:
+        return await TaskSchedulerService.run_agent(task_id, task_description, **kwargs)
+    finally:
+        await llm_registry.arelease_scope()
+
+
+@signals.task_failure.connect(sender=run_agent_task)
+def _on_agent_task_failure(sender=None, task_id=None, exception=None, **kwargs):
+    """重试次数耗尽后推送终止事件"""
+    from app.services.task_scheduler.events import publish_event
+
+    asyncio.run(publish_event(task_id, "failed", {"error": str(exception)}, status="failed"))
@@ -8,16 +8,30 @@ from typing import Annotated, Literal, TypedDict, List, Dict, Any, Optional, Tup
 from enum import Enum
 
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, FunctionMessage
+from langchain_core.runnables import RunnableLambda
 from langchain_core.tools import tool, BaseTool
 from langchain_openai import ChatOpenAI
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import END, START, StateGraph
+from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode
 
+from app.services.knowledge_manager import search_knowledge_for_agent
+from app.services.sop_manager import get_sop_template_for_agent
+from app.services.task_scheduler.checkpointer import (
+    get_checkpointer,
+    thread_config,
+    resume_input,
+    aresume_input,
+    acompact_thread
+)
+from app.services.task_scheduler.context_window import build_prompt, manage_context
+from app.services.task_scheduler.events import new_run_metrics, stream_workflow
+from app.services.task_scheduler.llm_registry import get_llm_client
+
 # 定义Agent状态
 class ReflectionAgentState(TypedDict):
     """反思Agent的状态定义"""
-    messages: List[Any]  # 消息历史
+    messages: Annotated[List[Any], add_messages]  # 消息历史，节点只返回新增消息
     task_id: Optional[str]  # 当前任务ID
     task_info: Optional[Dict[str, Any]]  # 任务相关信息
     tools_results: Optional[Dict[str, Any]]  # 工具调用结果
@@ -26,14 +40,15 @@ class ReflectionAgentState(TypedDict):
     reflections: Optional[List[Dict[str, Any]]]  # 反思记录
     attempts: Optional[int]  # 尝试次数
     plan: Optional[List[Dict[str, Any]]]  # 执行计划
+    context_summary: Optional[str]  # 被移出上下文窗口的历史摘要
+    context_stats: Optional[Dict[str, Any]]  # 上下文窗口统计（节省的token数等）
 
 
 # 定义工具
 @tool
 def search_knowledge_base(query: str) -> str:
     """搜索知识库获取相关信息"""
-    # 这里是示例实现，实际应该连接到知识库服务
-    return f"知识库中关于'{query}'的信息: 这是一个示例回复"
+    return search_knowledge_for_agent(query)
 
 @tool
 def get_task_details(task_id: str) -> Dict[str, Any]:
@@ -56,17 +71,7 @@ def update_task_status(task_id: str, status: str) -> str:
 @tool
 def get_sop_template(sop_id: str) -> Dict[str, Any]:
     """获取SOP模板"""
-    # 这里是示例实现，实际应该从SOP管理服务获取模板
-    return {
-        "id": sop_id,
-        "name": "示例SOP",
-        "steps": [
-            {"order": 1, "description": "第一步: 分析任务需求"},
-            {"order": 2, "description": "第二步: 制定执行计划"},
-            {"order": 3, "description": "第三步: 执行任务"},
-            {"order": 4, "description": "第四步: 验证结果"},
-        ]
-    }
+    return get_sop_template_for_agent(sop_id)
 
 @tool
 def save_to_knowledge_base(key: str, content: str) -> str:
@@ -89,31 +94,8 @@ tool_node = ToolNode(tools)
 
 # 创建LLM模型
 def get_llm():
-    """获取LLM模型实例"""
-    # 使用OpenAI包，但基础地址是硅基流动
-    from langchain_openai import ChatOpenAI
-    
-    # 检查是否配置了SiliconFlow API密钥
-    if os.getenv("SILICONFLOW_API_KEY"):
-        return ChatOpenAI(
-            api_key=os.getenv("SILICONFLOW_API_KEY"),
-            base_url="https://api.siliconflow.cn/v1",
-            model="black-forest-labs/FLUX.1-dev",  # 或其他可用模型
-            temperature=0.2
-        ).bind_tools(tools)
-    # 优先使用Anthropic模型，如果没有则使用OpenAI
-    elif os.getenv("ANTHROPIC_API_KEY"):
-        from langchain_anthropic import ChatAnthropic
-        return ChatAnthropic(
-            model="claude-3-sonnet-20240229",
-            temperature=0.2
-        ).bind_tools(tools)
-    else:
-        # 默认使用OpenAI
-        return ChatOpenAI(
-            model="gpt-4-turbo",
-            temperature=0.2
-        ).bind_tools(tools)
+    """获取LLM模型实例（复用进程内共享的客户端）"""
+    return get_llm_client(tools)
 
 # 定义Agent系统提示
 SYSTEM_PROMPT = """你是李府管家系统中的智能任务执行Agent，具有反思和自我修正能力。你的职责是:
@@ -162,30 +144,64 @@ PLANNING_PROMPT = """请根据任务需求，制定详细的执行计划。计
 # 定义调用LLM的函数
 def call_model(state: ReflectionAgentState):
     """调用LLM模型处理当前状态"""
-    messages = state.get('messages', [])
-    
-    # 如果是首次调用，添加系统提示
-    if not any(isinstance(msg, SystemMessage) for msg in messages):
-        messages = [SystemMessage(content=SYSTEM_PROMPT)] + messages
+    # 系统提示和执行计划不写入消息历史，每次调用时固定放在最前面
+    messages = build_prompt(SYSTEM_PROMPT, state)
     
     # 调用LLM
     model = get_llm()
     response = model.invoke(messages)
     
-    # 返回更新后的消息列表
-    return {"messages": messages + [response]}
+    # 只返回新增消息，由reducer追加到历史中
+    return {"messages": [response]}
+
+async def acall_model(state: ReflectionAgentState):
+    """调用LLM模型处理当前状态（异步版本）"""
+    messages = build_prompt(SYSTEM_PROMPT, state)
+    
+    # 调用LLM
+    model = get_llm()
+    response = await model.ainvoke(messages)
+    
+    # 只返回新增消息，由reducer追加到历史中
+    return {"messages": [response]}
 
 # 定义制定计划的函数
 def create_plan(state: ReflectionAgentState):
     """制定执行计划"""
-    messages = state.get('messages', [])
+    messages = build_prompt(SYSTEM_PROMPT, state)
     task_id = state.get('task_id')
     
     # 获取任务详情
     task_info = get_task_details(task_id)
+    plan_prompt = _build_plan_prompt(task_id, task_info)
+    
+    # 添加计划提示消息
+    plan_messages = messages + [HumanMessage(content=plan_prompt)]
     
-    # 创建计划提示
-    plan_prompt = f"""
+    # 调用LLM生成计划
+    model = get_llm()
+    plan_response = model.invoke(plan_messages)
+    
+    return _plan_update(plan_prompt, plan_response, task_info)
+
+async def acreate_plan(state: ReflectionAgentState):
+    """制定执行计划（异步版本）"""
+    messages = build_prompt(SYSTEM_PROMPT, state)
+    task_id = state.get('task_id')
+    
+    # 获取任务详情
+    task_info = await get_task_details.ainvoke({"task_id": task_id})
+    plan_prompt = _build_plan_prompt(task_id, task_info)
+    
+    # 调用LLM生成计划
+    model = get_llm()
+    plan_response = await model.ainvoke(messages + [HumanMessage(content=plan_prompt)])
+    
+    return _plan_update(plan_prompt, plan_response, task_info)
+
+def _build_plan_prompt(task_id: str, task_info: Dict[str, Any]) -> str:
+    """创建计划提示"""
+    return f"""
 {PLANNING_PROMPT}
 
 任务信息:
@@ -195,14 +211,9 @@ ID: {task_id}
 优先级: {task_info.get('priority')}
 截止日期: {task_info.get('deadline')}
     """
-    
-    # 添加计划提示消息
-    plan_messages = messages + [HumanMessage(content=plan_prompt)]
-    
-    # 调用LLM生成计划
-    model = get_llm()
-    plan_response = model.invoke(plan_messages)
-    
+
+def _plan_update(plan_prompt: str, plan_response: Any, task_info: Dict[str, Any]) -> Dict[str, Any]:
+    """解析计划并生成状态更新"""
     # 解析计划
     plan = [
         {"step": i+1, "description": f"步骤{i+1}: {step}", "status": "pending"}
@@ -212,7 +223,7 @@ ID: {task_id}
     
     # 更新状态
     return {
-        "messages": messages + [HumanMessage(content=plan_prompt), plan_response],
+        "messages": [HumanMessage(content=plan_prompt), plan_response],
         "plan": plan,
         "task_info": task_info
     }
@@ -220,7 +231,7 @@ ID: {task_id}
 # 定义反思函数
 def reflect(state: ReflectionAgentState):
     """对执行过程进行反思"""
-    messages = state.get('messages', [])
+    messages = build_prompt(SYSTEM_PROMPT, state)
     reflections = state.get('reflections', [])
     attempts = state.get('attempts', 0)
     
@@ -231,6 +242,22 @@ def reflect(state: ReflectionAgentState):
     model = get_llm()
     reflection_response = model.invoke(reflection_messages)
     
+    return _reflection_update(reflections, attempts, reflection_response)
+
+async def areflect(state: ReflectionAgentState):
+    """对执行过程进行反思（异步版本）"""
+    messages = build_prompt(SYSTEM_PROMPT, state)
+    reflections = state.get('reflections', [])
+    attempts = state.get('attempts', 0)
+    
+    # 调用LLM进行反思
+    model = get_llm()
+    reflection_response = await model.ainvoke(messages + [HumanMessage(content=REFLECTION_PROMPT)])
+    
+    return _reflection_update(reflections, attempts, reflection_response)
+
+def _reflection_update(reflections: List[Dict[str, Any]], attempts: int, reflection_response: Any) -> Dict[str, Any]:
+    """记录反思并生成状态更新"""
     # 记录反思
     reflection = {
         "attempt": attempts + 1,
@@ -240,7 +267,7 @@ def reflect(state: ReflectionAgentState):
     
     # 更新状态
     return {
-        "messages": messages + [HumanMessage(content=REFLECTION_PROMPT), reflection_response],
+        "messages": [HumanMessage(content=REFLECTION_PROMPT), reflection_response],
         "reflections": reflections + [reflection],
         "attempts": attempts + 1
     }
@@ -312,22 +339,24 @@ def create_reflection_agent_workflow():
     # 创建状态图
     workflow = StateGraph(ReflectionAgentState)
     
-    # 添加节点
-    workflow.add_node("agent", call_model)
+    # 添加节点，同时提供同步和异步实现，invoke和ainvoke均可使用
+    workflow.add_node("context", manage_context)
+    workflow.add_node("agent", RunnableLambda(call_model, afunc=acall_model))
     workflow.add_node("tools", tool_node)
-    workflow.add_node("plan", create_plan)
-    workflow.add_node("reflect", reflect)
+    workflow.add_node("plan", RunnableLambda(create_plan, afunc=acreate_plan))
+    workflow.add_node("reflect", RunnableLambda(reflect, afunc=areflect))
     
-    # 添加边
+    # 添加边，每次调用Agent前先经过上下文管理节点裁剪历史
     workflow.add_edge(START, "plan")
-    workflow.add_edge("plan", "agent")
+    workflow.add_edge("plan", "context")
+    workflow.add_edge("context", "agent")
     
     # 添加条件边
     workflow.add_conditional_edges(
         "agent",
         route_next_step,
         {
-            "agent": "agent",
+            "agent": "context",
             "tools": "tools",
             "plan": "plan",
             "reflect": "reflect",
@@ -335,33 +364,28 @@ def create_reflection_agent_workflow():
         }
     )
     
-    workflow.add_edge("tools", "agent")
-    workflow.add_edge("reflect", "agent")
+    workflow.add_edge("tools", "context")
+    workflow.add_edge("reflect", "context")
     
     # 添加完成检查
     workflow.add_conditional_edges(
         "reflect",
         is_task_complete,
         {
-            "agent": "agent",
+            "agent": "context",
             END: END
         }
     )
     
-    # 初始化内存保存器
-    memory = MemorySaver()
-    
-    # 编译工作流
-    return workflow.compile(checkpointer=memory)
+    # 使用可持久化的检查点保存器，进程崩溃后可以从最后完成的节点继续
+    return workflow.compile(checkpointer=get_checkpointer())
 
 # 创建Agent实例
 reflection_agent_workflow = create_reflection_agent_workflow()
 
-# 执行Agent
-def execute_task_with_reflection(task_id: str, task_description: str) -> Dict[str, Any]:
-    """使用支持反思的Agent执行任务"""
-    # 初始化状态
-    initial_state = {
+def _build_initial_state(task_id: str, task_description: str) -> Dict[str, Any]:
+    """构建反思Agent初始状态"""
+    return {
         "messages": [HumanMessage(content=f"请执行以下任务: {task_description}. 任务ID: {task_id}")],
         "task_id": task_id,
         "task_info": None,
@@ -370,15 +394,45 @@ def execute_task_with_reflection(task_id: str, task_description: str) -> Dict[st
         "status": "started",
         "reflections": [],
         "attempts": 0,
-        "plan": None
+        "plan": None,
+        "context_summary": None,
+        "context_stats": None
     }
+
+# 执行Agent
+def execute_task_with_reflection(task_id: str, task_description: str) -> Dict[str, Any]:
+    """使用支持反思的Agent执行任务"""
+    # 初始化状态
+    initial_state = _build_initial_state(task_id, task_description)
     
-    # 执行工作流
-    result = reflection_agent_workflow.invoke(initial_state)
+    # 执行工作流，以任务ID作为线程ID，存在未完成的检查点时从断点继续
+    config = thread_config(task_id)
+    result = reflection_agent_workflow.invoke(resume_input(reflection_agent_workflow, config, initial_state), config)
     
     # 更新任务状态为已完成
     update_task_status(task_id, "completed")
     
+    return _build_response(task_id, result)
+
+async def aexecute_task_with_reflection(task_id: str, task_description: str) -> Dict[str, Any]:
+    """使用支持反思的Agent异步执行任务，不阻塞事件循环"""
+    initial_state = _build_initial_state(task_id, task_description)
+    
+    # 流式执行工作流并推送节点事件，存在未完成的检查点时从断点继续
+    config = thread_config(task_id)
+    metrics = new_run_metrics()
+    result = await stream_workflow(reflection_agent_workflow, await aresume_input(reflection_agent_workflow, config, initial_state), config, task_id, metrics)
+    await acompact_thread(task_id)
+    
+    # 更新任务状态为已完成
+    await update_task_status.ainvoke({"task_id": task_id, "status": "completed"})
+    
+    response = _build_response(task_id, result)
+    response["metrics"] = metrics
+    return response
+
+def _build_response(task_id: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """将工作流最终状态转换为响应"""
     # 提取执行结果
     messages = result.get('messages', [])
     reflections = result.get('reflections', [])
@@ -396,7 +450,8 @@ def execute_task_with_reflection(task_id: str, task_description: str) -> Dict[st
         ],
         "reflections": reflections,
         "plan": result.get('plan'),
-        "attempts": result.get('attempts', 0)
+        "attempts": result.get('attempts', 0),
+        "context_stats": result.get('context_stats')
     }
     
     return response 
\ No newline at end of file
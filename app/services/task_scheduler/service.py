@@ -4,70 +4,114 @@
 """
 
 from typing import Dict, List, Any, Optional
+import asyncio
 import logging
+import time
 from datetime import datetime
 import os
 
-from .agent import execute_task
-from .reflection_agent import execute_task_with_reflection
+from celery.result import AsyncResult
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.task import Task
+
+from .agent import aexecute_task
+from .reflection_agent import aexecute_task_with_reflection
+from .queue import celery_app, run_agent_task, resolve_queue, QUEUE_PRIORITIES
+from .events import publish_event, get_status_snapshot, subscribe_events
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
+# Celery任务状态到系统任务状态的映射
+TASK_STATE_MAP = {
+    "PENDING": "pending",
+    "RECEIVED": "pending",
+    "STARTED": "in_progress",
+    "RETRY": "retrying",
+    "SUCCESS": "completed",
+    "FAILURE": "failed",
+    "REVOKED": "cancelled",
+}
+
 class TaskSchedulerService:
     """任务调度器服务"""
     
     @staticmethod
-    async def execute_task(task_id: str, task_description: str, use_reflection: bool = False, use_siliconflow: bool = False) -> Dict[str, Any]:
+    async def run_agent(task_id: str, task_description: str, use_reflection: bool = False, use_siliconflow: bool = False, attempt: int = 1) -> Dict[str, Any]:
         """
-        执行指定任务
+        执行Agent并返回结果，出错时抛出异常，供队列Worker重试
         
         Args:
             task_id: 任务ID
             task_description: 任务描述
             use_reflection: 是否使用支持反思的Agent
             use_siliconflow: 是否使用硅基流动模型
+            attempt: 当前第几次尝试
             
         Returns:
             执行结果
         """
-        logger.info(f"开始执行任务: {task_id}, 使用反思Agent: {use_reflection}, 使用硅基流动模型: {use_siliconflow}")
+        logger.info(f"开始执行任务: {task_id}, 使用反思Agent: {use_reflection}, 使用硅基流动模型: {use_siliconflow}, 第{attempt}次尝试")
+        # 记录任务开始时间
+        start_time = datetime.now()
+        agent_type = "siliconflow" if use_siliconflow else ("reflection" if use_reflection else "standard")
+        await publish_event(task_id, "started", {"agent_type": agent_type, "attempt": attempt}, status="in_progress")
+        
+        # 根据参数选择Agent执行任务，全程使用异步执行，不阻塞事件循环
         try:
-            # 记录任务开始时间
-            start_time = datetime.now()
-            
-            # 根据参数选择Agent执行任务
             if use_siliconflow:
                 # 设置环境变量
                 os.environ["SILICONFLOW_API_KEY"] = os.getenv("SILICONFLOW_API_KEY", "")
-                result = execute_task(task_id, task_description)
-                agent_type = "siliconflow"
+                result = await aexecute_task(task_id, task_description)
             elif use_reflection:
-                result = execute_task_with_reflection(task_id, task_description)
-                agent_type = "reflection"
+                result = await aexecute_task_with_reflection(task_id, task_description)
             else:
-                result = execute_task(task_id, task_description)
-                agent_type = "standard"
-            
-            # 记录任务结束时间
-            end_time = datetime.now()
-            execution_time = (end_time - start_time).total_seconds()
-            
-            # 构建响应
-            response = {
-                "task_id": task_id,
-                "status": "completed",
-                "execution_time": execution_time,
-                "result": result,
-                "timestamp": datetime.now().isoformat(),
-                "agent_type": agent_type
-            }
-            
-            logger.info(f"任务执行完成: {task_id}, 耗时: {execution_time}秒")
-            return response
+                result = await aexecute_task(task_id, task_description)
+        except Exception as e:
+            # 非终止事件，队列重试后会继续推送
+            await publish_event(task_id, "error", {"error": str(e), "attempt": attempt})
+            raise
+        
+        # 记录任务结束时间
+        end_time = datetime.now()
+        execution_time = (end_time - start_time).total_seconds()
+        
+        logger.info(f"任务执行完成: {task_id}, 耗时: {execution_time}秒")
+        await publish_event(task_id, "completed", {"execution_time": execution_time}, status="completed")
+        
+        # 构建响应
+        return {
+            "task_id": task_id,
+            "status": "completed",
+            "execution_time": execution_time,
+            "result": result,
+            "timestamp": datetime.now().isoformat(),
+            "agent_type": agent_type,
+            "attempts": attempt
+        }
+    
+    @staticmethod
+    async def execute_task(task_id: str, task_description: str, use_reflection: bool = False, use_siliconflow: bool = False) -> Dict[str, Any]:
+        """
+        在当前进程内执行指定任务
+        
+        Args:
+            task_id: 任务ID
+            task_description: 任务描述
+            use_reflection: 是否使用支持反思的Agent
+            use_siliconflow: 是否使用硅基流动模型
             
+        Returns:
+            执行结果
+        """
+        try:
+            return await TaskSchedulerService.run_agent(task_id, task_description, use_reflection, use_siliconflow)
         except Exception as e:
             logger.error(f"任务执行失败: {task_id}, 错误: {str(e)}")
+            await publish_event(task_id, "failed", {"error": str(e)}, status="failed")
             # 返回错误信息
             return {
                 "task_id": task_id,
@@ -77,6 +121,50 @@ class TaskSchedulerService:
                 "agent_type": "siliconflow" if use_siliconflow else ("reflection" if use_reflection else "standard")
             }
     
+    @staticmethod
+    async def enqueue_task(task_id: str, task_description: str, use_reflection: bool = False, use_siliconflow: bool = False, priority: Optional[str] = None) -> Dict[str, Any]:
+        """
+        将任务投递到分布式Worker队列
+        
+        Args:
+            task_id: 任务ID，同时作为队列中的任务ID，用于查询状态和取消
+            task_description: 任务描述
+            use_reflection: 是否使用支持反思的Agent
+            use_siliconflow: 是否使用硅基流动模型
+            priority: 显式指定的优先级（高/中/低），为空时使用任务记录（Task.priority）的优先级，决定投递的队列
+            
+        Returns:
+            投递信息
+        """
+        if priority is None:
+            priority = await TaskSchedulerService._task_priority(task_id)
+        queue = resolve_queue(priority)
+        # 投递操作涉及网络IO（eager模式下会直接执行），放到线程中避免阻塞事件循环
+        await asyncio.to_thread(
+            run_agent_task.apply_async,
+            args=(task_id, task_description),
+            kwargs={"use_reflection": use_reflection, "use_siliconflow": use_siliconflow},
+            task_id=task_id,
+            queue=queue,
+            priority=QUEUE_PRIORITIES[queue]
+        )
+        logger.info(f"任务已投递: {task_id}, 队列: {queue}")
+        return {
+            "task_id": task_id,
+            "status": "queued",
+            "queue": queue,
+            "timestamp": datetime.now().isoformat()
+        }
+    
+    @staticmethod
+    async def _task_priority(task_id: str) -> Optional[str]:
+        """读取任务记录的优先级，任务ID不是任务记录的ID或记录不存在时返回None"""
+        if not task_id.isdigit():
+            return None
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(Task.priority).where(Task.id == int(task_id)))
+            return result.scalar_one_or_none()
+
     @staticmethod
     async def get_task_status(task_id: str) -> Dict[str, Any]:
         """
@@ -88,14 +176,38 @@ class TaskSchedulerService:
         Returns:
             任务状态信息
         """
-        # 这里应该从数据库或缓存中获取任务状态
-        # 当前为示例实现
-        return {
+        # 优先读取执行过程中推送的状态快照，其次读取Celery结果存储
+        snapshot = await get_status_snapshot(task_id)
+        result = AsyncResult(task_id, app=celery_app)
+        state = await asyncio.to_thread(lambda: result.state)
+        status = snapshot.get("status") or TASK_STATE_MAP.get(state, state.lower())
+        response = {
             "task_id": task_id,
-            "status": "in_progress",
-            "progress": 50,
+            "status": status,
+            "progress": 100 if status in ("completed", "failed", "cancelled") else int(snapshot.get("progress", 0)),
+            "step": int(snapshot.get("step", 0)),
+            "last_event": snapshot.get("last_event"),
             "timestamp": datetime.now().isoformat()
         }
+        if status == "completed":
+            response["result"] = result.result
+        elif status in ("failed", "retrying"):
+            response["error"] = str(result.result)
+        return response
+    
+    @staticmethod
+    def stream_events(task_id: str, heartbeat: float = 15.0):
+        """
+        订阅任务执行事件流
+        
+        Args:
+            task_id: 任务ID
+            heartbeat: 心跳间隔（秒），无事件时产出None
+            
+        Returns:
+            异步事件迭代器
+        """
+        return subscribe_events(task_id, heartbeat=heartbeat)
     
     @staticmethod
     async def list_tasks(status: Optional[str] = None, limit: int = 10) -> List[Dict[str, Any]]:
@@ -109,16 +221,22 @@ class TaskSchedulerService:
         Returns:
             任务列表
         """
-        # 这里应该从数据库中查询任务列表
-        # 当前为示例实现
+        query = select(Task).order_by(Task.created_at.desc()).limit(limit)
+        if status:
+            query = query.where(Task.status == status)
+        # 使用异步会话查询，不阻塞事件循环
+        async with AsyncSessionLocal() as db:
+            tasks = (await db.execute(query)).scalars().all()
         return [
             {
-                "task_id": f"task_{i}",
-                "title": f"示例任务 {i}",
-                "status": "completed" if i % 3 == 0 else "in_progress" if i % 3 == 1 else "pending",
-                "created_at": datetime.now().isoformat()
+                "task_id": str(task.id),
+                "title": task.title,
+                "status": task.status,
+                "priority": task.priority,
+                "progress": task.progress,
+                "created_at": task.created_at.isoformat() if task.created_at else None
             }
-            for i in range(limit)
+            for task in tasks
         ]
     
     @staticmethod
@@ -132,8 +250,9 @@ class TaskSchedulerService:
         Returns:
             操作结果
         """
-        # 这里应该实现任务取消逻辑
-        # 当前为示例实现
+        # 撤销队列中的任务，已在执行的任务将被终止
+        await asyncio.to_thread(celery_app.control.revoke, task_id, terminate=True)
+        await publish_event(task_id, "cancelled", status="cancelled")
         return {
             "task_id": task_id,
             "status": "cancelled",
@@ -141,73 +260,122 @@ class TaskSchedulerService:
         }
         
     @staticmethod
-    async def compare_agents(task_id: str, task_description: str, use_siliconflow: bool = False) -> Dict[str, Any]:
+    async def _run_compared_agent(task_id: str, agent_name: str, task_description: str, use_reflection: bool, use_siliconflow: bool, timeout: float) -> Dict[str, Any]:
         """
-        比较不同Agent的执行效果
+        在超时限制内执行参与比较的单个Agent，并提取统计指标
+        
+        Returns:
+            单个Agent的比较结果，失败或超时时包含错误信息
+        """
+        agent_task_id = f"{task_id}_{agent_name}"
+        start = time.perf_counter()
+        try:
+            # 超时后wait_for会取消Agent的执行
+            run = await asyncio.wait_for(
+                TaskSchedulerService.run_agent(agent_task_id, task_description, use_reflection, use_siliconflow),
+                timeout=timeout
+            )
+            status, error, result = "completed", None, run["result"]
+        except asyncio.TimeoutError:
+            status, error, result = "timeout", f"执行超过{timeout}秒", None
+            await publish_event(agent_task_id, "failed", {"error": error}, status="failed")
+        except Exception as e:
+            status, error, result = "failed", str(e), None
+            await publish_event(agent_task_id, "failed", {"error": error}, status="failed")
+        latency = time.perf_counter() - start
+        
+        metrics = (result or {}).get("metrics") or {}
+        logger.info(f"比较Agent执行结束: {agent_task_id}, 状态: {status}, 耗时: {latency:.2f}秒")
+        return {
+            "task_id": agent_task_id,
+            "agent_type": agent_name,
+            "status": status,
+            "latency": round(latency, 3),
+            "prompt_tokens": metrics.get("prompt_tokens", 0),
+            "completion_tokens": metrics.get("completion_tokens", 0),
+            "total_tokens": metrics.get("total_tokens", 0),
+            "tool_calls": metrics.get("tool_calls", 0),
+            "steps": metrics.get("steps", 0),
+            "llm_calls": metrics.get("llm_calls", 0),
+            "error": error,
+            "result": result
+        }
+    
+    @staticmethod
+    def _build_comparison_report(agents: List[Dict[str, Any]], total_time: float) -> Dict[str, Any]:
+        """根据各Agent的结果生成比较报告"""
+        completed = [a for a in agents if a["status"] == "completed"]
+        sequential_time = sum(a["latency"] for a in agents)
+        return {
+            "agents": [{k: v for k, v in a.items() if k != "result"} for a in agents],
+            "fastest_agent": min(completed, key=lambda a: a["latency"])["agent_type"] if completed else None,
+            "cheapest_agent": min(completed, key=lambda a: a["total_tokens"])["agent_type"] if completed else None,
+            "fewest_steps_agent": min(completed, key=lambda a: a["steps"])["agent_type"] if completed else None,
+            "completed_count": len(completed),
+            "total_time": round(total_time, 3),
+            # 串行执行所需时间与实际并发耗时之比
+            "sequential_time": round(sequential_time, 3),
+            "speedup": round(sequential_time / total_time, 2) if total_time > 0 else None
+        }
+    
+    @staticmethod
+    async def compare_agents(task_id: str, task_description: str, use_siliconflow: bool = False, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        比较不同Agent的执行效果，各Agent并发执行，总耗时取决于最慢的Agent
         
         Args:
             task_id: 任务ID
             task_description: 任务描述
             use_siliconflow: 是否包含硅基流动模型
+            timeout: 单个Agent的超时时间（秒），默认取配置
             
         Returns:
-            比较结果
+            比较结果，包含各Agent的执行结果和结构化比较报告
         """
         logger.info(f"开始比较不同Agent执行任务: {task_id}, 包含硅基流动模型: {use_siliconflow}")
+        timeout = timeout or settings.AGENT_COMPARISON_TIMEOUT
+        # (名称, 是否使用反思Agent, 是否使用硅基流动模型)
+        candidates = [("standard", False, False), ("reflection", True, False)]
+        if use_siliconflow:
+            candidates.append(("siliconflow", False, True))
+        
+        await publish_event(task_id, "started", {"agents": [c[0] for c in candidates]}, status="in_progress")
+        start = time.perf_counter()
         try:
-            # 记录开始时间
-            start_time = datetime.now()
-            
-            # 使用标准Agent执行任务
-            standard_result = await TaskSchedulerService.execute_task(
-                f"{task_id}_standard", 
-                task_description,
-                use_reflection=False,
-                use_siliconflow=False
-            )
-            
-            # 使用反思Agent执行任务
-            reflection_result = await TaskSchedulerService.execute_task(
-                f"{task_id}_reflection", 
-                task_description,
-                use_reflection=True,
-                use_siliconflow=False
-            )
-            
-            # 如果需要，使用硅基流动模型执行任务
-            siliconflow_result = None
-            if use_siliconflow:
-                siliconflow_result = await TaskSchedulerService.execute_task(
-                    f"{task_id}_siliconflow", 
-                    task_description,
-                    use_reflection=False,
-                    use_siliconflow=True
-                )
-            
-            # 记录结束时间
-            end_time = datetime.now()
-            total_time = (end_time - start_time).total_seconds()
-            
-            # 构建比较结果
-            comparison = {
-                "task_id": task_id,
-                "task_description": task_description,
-                "standard_agent": standard_result,
-                "reflection_agent": reflection_result,
-                "siliconflow_agent": siliconflow_result,
-                "total_time": total_time,
-                "timestamp": datetime.now().isoformat(),
-                "includes_siliconflow": use_siliconflow
-            }
-            
-            logger.info(f"Agent比较完成: {task_id}, 总耗时: {total_time}秒")
-            return comparison
-            
+            # 并发执行各Agent；比较本身被取消时，gather会一并取消所有未完成的Agent
+            agents = await asyncio.gather(*(
+                TaskSchedulerService._run_compared_agent(task_id, name, task_description, use_reflection, siliconflow, timeout)
+                for name, use_reflection, siliconflow in candidates
+            ))
+        except asyncio.CancelledError:
+            logger.warning(f"Agent比较已取消: {task_id}")
+            await publish_event(task_id, "cancelled", status="cancelled")
+            raise
         except Exception as e:
             logger.error(f"Agent比较失败: {task_id}, 错误: {str(e)}")
+            await publish_event(task_id, "failed", {"error": str(e)}, status="failed")
             return {
                 "task_id": task_id,
                 "status": "failed",
                 "error": str(e),
                 "timestamp": datetime.now().isoformat()
-            } 
\ No newline at end of file
+            }
+        total_time = time.perf_counter() - start
+        
+        by_name = {agent["agent_type"]: agent for agent in agents}
+        report = TaskSchedulerService._build_comparison_report(agents, total_time)
+        comparison = {
+            "task_id": task_id,
+            "task_description": task_description,
+            "standard_agent": by_name["standard"],
+            "reflection_agent": by_name["reflection"],
+            "siliconflow_agent": by_name.get("siliconflow"),
+            "total_time": total_time,
+            "report": report,
+            "timestamp": datetime.now().isoformat(),
+            "includes_siliconflow": use_siliconflow
+        }
+        
+        logger.info(f"Agent比较完成: {task_id}, 总耗时: {total_time:.2f}秒, 串行耗时: {report['sequential_time']}秒")
+        await publish_event(task_id, "completed", {"report": report}, status="completed")
+        return comparison
@@ -1,7 +1,23 @@
 from app.services.tool_manager.tool_service import (
     register_tool,
     get_tools,
-    invoke_tool,
     get_tool_invocation,
-    get_tool_by_id
-) 
\ No newline at end of file
+    get_tool_by_id,
+    aregister_tool,
+    aupdate_tool,
+    aget_tools,
+    aget_tool_by_id,
+    aget_tool_by_name,
+    ainvoke_tool,
+    aget_tool_invocation,
+    await_tool_invocation,
+    await_tool_invocations,
+    ainvoke_tools_batch,
+    encode_page_cursor,
+    decode_page_cursor
+)
+from app.services.tool_manager.executor import ToolExecutor, ToolJob, tool_executor
+from app.services.tool_manager.http_pool import ToolHttpPool, tool_http_pool
+from app.services.tool_manager.result_cache import ToolResultCache, tool_result_cache
+from app.services.tool_manager.registry import MCPListing, RegisteredTool, ToolRegistry, tool_registry
+from app.services.tool_manager.validation import coerce_params, validate_params
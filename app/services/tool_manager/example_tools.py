@@ -9,6 +9,7 @@ WEATHER_TOOL = {
     "type": "api",
     "endpoint": "https://api.example.com/weather",
     "description": "查询指定城市的天气信息",
+    "cache_ttl": 600,  # 天气数据变化较慢，相同查询缓存10分钟
     "auth_type": "apiKey",
     "auth_info": {
         "type": "apikey",
@@ -68,6 +69,7 @@ DATABASE_QUERY_TOOL = {
     "type": "script",
     "endpoint": "db_query.py",
     "description": "执行SQL查询并返回结果",
+    "cache_ttl": 60,
     "auth_type": "None",
     "input_schema": {
         "type": "object",
@@ -0,0 +1,267 @@
+"""
+工具执行引擎
+工具调用先进入有界队列，由固定数量的Worker执行；同一工具的并发数单独限制，
+每个调用使用独立的数据库会话写入结果；队列已满时拒绝新的调用（429），避免突发流量耗尽内存或数据库连接。
+启用了结果缓存的工具，参数相同的并发调用只执行一次，其余调用等待并共享该结果
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import case, update
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.tool import ToolInvocation
+from app.services.tool_manager.result_cache import is_cacheable, tool_result_cache
+
+logger = logging.getLogger(__name__)
+
+# 平均执行耗时的平滑系数
+DURATION_EMA_ALPHA = 0.2
+
+
+@dataclass
+class ToolJob:
+    """一次工具调用任务，只保存执行所需的数据，不持有数据库对象"""
+    invocation_id: int
+    invoke_id: str
+    tool_id: int
+    tool_name: str
+    tool_type: str
+    endpoint: str
+    auth_info: Optional[Dict[str, Any]]
+    params: Dict[str, Any]
+    timeout: Optional[float] = None
+    cache_key: Optional[str] = None  # 启用结果缓存时的缓存键
+    cache_ttl: Optional[int] = None
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class ToolExecutor:
+    """工具执行引擎"""
+
+    def __init__(self, workers: Optional[int] = None, max_pending: Optional[int] = None, per_tool_concurrency: Optional[int] = None):
+        self.workers = workers or settings.TOOL_WORKER_COUNT
+        self.max_pending = max_pending or settings.TOOL_QUEUE_MAXSIZE
+        self.per_tool_concurrency = per_tool_concurrency or settings.TOOL_PER_TOOL_CONCURRENCY
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._semaphores: Dict[int, asyncio.Semaphore] = {}
+        # 所属工具已达到并发上限而暂缓执行的任务，按工具排队
+        self._deferred: Dict[int, Deque[ToolJob]] = defaultdict(deque)
+        # 正在执行的可缓存调用（按缓存键），值为等待共享其结果的相同调用
+        self._inflight: Dict[str, List[ToolJob]] = {}
+        # 等待调用完成的请求（按调用ID），调用完成后唤醒
+        self._watchers: Dict[str, List[asyncio.Future]] = defaultdict(list)
+        self._pending = 0  # 已接收但尚未完成的任务数（排队 + 暂缓 + 执行中）
+        self._running = 0
+        self._avg_duration = 1.0
+        self._completed = 0
+        self._rejected = 0
+        self._coalesced = 0
+
+    # ---- 生命周期 ----
+
+    async def start(self) -> None:
+        """启动Worker，随应用启动"""
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._workers = [asyncio.create_task(self._worker(), name=f"tool-worker-{i}") for i in range(self.workers)]
+        logger.info(f"工具执行引擎已启动: {self.workers}个Worker, 队列上限{self.max_pending}")
+
+    async def stop(self) -> None:
+        """停止Worker，尚未开始执行的调用标记为失败"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+        abandoned = []
+        while self._queue is not None and not self._queue.empty():
+            abandoned.append(self._queue.get_nowait().invocation_id)
+        for jobs in list(self._deferred.values()) + list(self._inflight.values()):
+            abandoned.extend(job.invocation_id for job in jobs)
+        self._deferred.clear()
+        self._inflight.clear()
+        if abandoned:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(ToolInvocation)
+                    .where(ToolInvocation.id.in_(abandoned))
+                    .values(status="failed", error="服务关闭，调用未执行", finished_at=datetime.now())
+                )
+                await db.commit()
+            logger.warning(f"工具执行引擎停止，{len(abandoned)}个调用未执行")
+
+    # ---- 提交 ----
+
+    def retry_after(self) -> int:
+        """根据积压数量和平均耗时估算需要等待的秒数"""
+        return max(1, math.ceil(self._pending * self._avg_duration / max(self.workers, 1)))
+
+    def check_capacity(self, count: int = 1) -> None:
+        """
+        检查是否还能接收count个新的调用，队列已满时抛出429
+
+        在创建调用记录之前调用，避免被拒绝的调用留下记录
+        """
+        if self._queue is None:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="工具执行引擎未启动"
+            )
+        if self._pending + count > self.max_pending:
+            self._rejected += count
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="工具调用过多，请稍后重试",
+                headers={"Retry-After": str(self.retry_after())}
+            )
+
+    def submit(self, job: ToolJob) -> None:
+        """提交调用任务（需在事件循环中调用）"""
+        self.check_capacity()
+        self._pending += 1
+        self._queue.put_nowait(job)
+
+    # ---- 执行 ----
+
+    def _semaphore(self, tool_id: int) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(tool_id)
+        if semaphore is None:
+            semaphore = self._semaphores[tool_id] = asyncio.Semaphore(self.per_tool_concurrency)
+        return semaphore
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                # 相同参数的调用正在执行时，等待共享其结果，不占用Worker
+                if job.cache_key:
+                    followers = self._inflight.get(job.cache_key)
+                    if followers is not None:
+                        followers.append(job)
+                        self._coalesced += 1
+                        continue
+                    self._inflight[job.cache_key] = []
+                # 该工具已达到并发上限时暂缓，Worker继续处理其他工具的调用，避免队头阻塞
+                if self._semaphore(job.tool_id).locked():
+                    self._deferred[job.tool_id].append(job)
+                    continue
+                while job is not None:
+                    await self._run(job)
+                    deferred = self._deferred.get(job.tool_id)
+                    job = deferred.popleft() if deferred else None
+            finally:
+                self._queue.task_done()
+
+    async def _execute(self, job: ToolJob) -> Tuple[Any, Optional[str], bool]:
+        """执行调用，返回 (结果, 错误信息, 是否命中缓存)"""
+        # 延迟导入，避免与tool_service循环引用
+        from app.services.tool_manager.tool_service import _execute_tool
+
+        if job.cache_key:
+            # 排队期间其他进程可能已写入缓存
+            cached = await tool_result_cache.get(job.cache_key)
+            if cached is not None:
+                return cached, None, True
+        async with self._semaphore(job.tool_id):
+            result, error = await _execute_tool(job.tool_type, job.endpoint, job.auth_info, job.params, job.timeout)
+        if job.cache_key and is_cacheable(result, error):
+            await tool_result_cache.set(job.cache_key, result, job.cache_ttl)
+        return result, error, False
+
+    async def _run(self, job: ToolJob) -> None:
+        start = time.monotonic()
+        self._running += 1
+        followers: List[ToolJob] = []
+        try:
+            try:
+                result, error, cache_hit = await self._execute(job)
+            except Exception as e:
+                result, error, cache_hit = None, str(e), False
+            if job.cache_key:
+                followers = self._inflight.pop(job.cache_key, [])
+            await self._save_result(job.invocation_id, [f.invocation_id for f in followers], result, error, cache_hit)
+        except Exception as e:
+            logger.error(f"工具调用处理失败: {job.invoke_id}, 错误: {str(e)}")
+        finally:
+            # 写入失败时同样唤醒等待方，由其读取数据库中的状态
+            self._notify([job.invoke_id] + [f.invoke_id for f in followers])
+            self._running -= 1
+            self._pending -= 1 + len(followers)
+            self._completed += 1 + len(followers)
+            duration = time.monotonic() - start
+            self._avg_duration += DURATION_EMA_ALPHA * (duration - self._avg_duration)
+
+    @staticmethod
+    async def _save_result(invocation_id: int, follower_ids: List[int], result: Any, error: Optional[str], cache_hit: bool = False) -> None:
+        """
+        使用独立的会话在一条语句中写入调用及共享其结果的相同调用的结果，
+        共享结果的调用没有访问工具后端，同样记为命中缓存
+        """
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(ToolInvocation)
+                .where(ToolInvocation.id.in_([invocation_id, *follower_ids]))
+                .values(
+                    status="success" if not error else "failed",
+                    output=result,
+                    error=error,
+                    cache_hit=case((ToolInvocation.id == invocation_id, cache_hit), else_=True) if follower_ids else cache_hit,
+                    finished_at=datetime.now()
+                )
+            )
+            await db.commit()
+
+    # ---- 等待完成 ----
+
+    def watch(self, invoke_id: str) -> asyncio.Future:
+        """登记等待指定调用完成，调用结果写入数据库后Future被设置"""
+        future = asyncio.get_running_loop().create_future()
+        self._watchers[invoke_id].append(future)
+        return future
+
+    def unwatch(self, invoke_id: str, future: asyncio.Future) -> None:
+        """取消等待"""
+        futures = self._watchers.get(invoke_id)
+        if futures and future in futures:
+            futures.remove(future)
+            if not futures:
+                del self._watchers[invoke_id]
+
+    def _notify(self, invoke_ids: List[str]) -> None:
+        for invoke_id in invoke_ids:
+            for future in self._watchers.pop(invoke_id, []):
+                if not future.done():
+                    future.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        """执行引擎统计信息"""
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self._pending,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "deferred": sum(len(jobs) for jobs in self._deferred.values()),
+            "running": self._running,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "coalesced": self._coalesced,
+            "watchers": sum(len(futures) for futures in self._watchers.values()),
+            "avg_duration": round(self._avg_duration, 3)
+        }
+
+
+# 进程内共享的执行引擎
+tool_executor = ToolExecutor()
@@ -0,0 +1,167 @@
+"""
+API类型工具的HTTP连接池
+按目标主机（scheme://host:port）复用长连接的AsyncClient，随应用启动创建、关闭时释放；
+可选启用HTTP/2（需要安装h2），通过httpx的trace扩展统计新建连接与连接复用次数
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+@dataclass
+class HostStats:
+    """单个主机的连接统计"""
+    requests: int = 0
+    new_connections: int = 0
+    failures: int = 0
+
+    @property
+    def reused(self) -> int:
+        return max(self.requests - self.new_connections, 0)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "reused_connections": self.reused,
+            "reuse_ratio": round(self.reused / self.requests, 4) if self.requests else 0.0,
+            "failures": self.failures
+        }
+
+
+def _host_key(url: str) -> Tuple[str, str, int]:
+    parts = urlsplit(url)
+    scheme = parts.scheme or "http"
+    return scheme, parts.hostname or "", parts.port or _DEFAULT_PORTS.get(scheme, 80)
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class ToolHttpPool:
+    """按主机划分的HTTP客户端池"""
+
+    def __init__(self):
+        self._clients: Dict[Tuple[str, str, int], httpx.AsyncClient] = {}
+        self._stats: Dict[Tuple[str, str, int], HostStats] = {}
+        self._lock = asyncio.Lock()
+        self._http2 = False
+        self._started = False
+        self._closed = False  # stop()之后不再按需创建客户端，直到再次start()
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=settings.TOOL_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.TOOL_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.TOOL_HTTP_KEEPALIVE_EXPIRY
+        )
+
+    async def start(self) -> None:
+        """启动连接池，随应用启动"""
+        if self._started:
+            return
+        self._http2 = settings.TOOL_HTTP2_ENABLED and _http2_available()
+        if settings.TOOL_HTTP2_ENABLED and not self._http2:
+            logger.warning("未安装h2，工具HTTP客户端回退到HTTP/1.1")
+        self._closed = False
+        self._started = True
+
+    async def stop(self) -> None:
+        """关闭所有客户端，释放连接"""
+        async with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+            self._started = False
+            self._closed = True
+        await asyncio.gather(*(client.aclose() for client in clients), return_exceptions=True)
+
+    async def _client(self, key: Tuple[str, str, int]) -> httpx.AsyncClient:
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        async with self._lock:
+            if self._closed:
+                raise RuntimeError("工具HTTP连接池已关闭")
+            client = self._clients.get(key)
+            if client is None:
+                client = httpx.AsyncClient(
+                    http2=self._http2,
+                    limits=self._limits(),
+                    timeout=settings.TOOL_HTTP_TIMEOUT
+                )
+                self._clients[key] = client
+                self._stats.setdefault(key, HostStats())
+        return client
+
+    async def post(self, url: str, json: Any = None, headers: Optional[Dict[str, str]] = None, timeout: Optional[float] = None) -> httpx.Response:
+        """
+        使用目标主机对应的客户端发送POST请求
+
+        Args:
+            url: 请求地址
+            json: 请求体
+            headers: 请求头
+            timeout: 超时时间（秒），为None时使用默认值
+
+        Returns:
+            响应
+
+        Raises:
+            RuntimeError: 连接池已关闭
+        """
+        if self._closed:
+            raise RuntimeError("工具HTTP连接池已关闭")
+        if not self._started:
+            # 未随应用启动（如脚本中直接调用）时按需启动
+            await self.start()
+        key = _host_key(url)
+        client = await self._client(key)
+        stats = self._stats[key]
+
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            # 只有新建连接时才会触发connect_tcp事件，复用连接时不会
+            if event_name == "connection.connect_tcp.complete":
+                stats.new_connections += 1
+
+        stats.requests += 1
+        try:
+            return await client.post(
+                url,
+                json=json,
+                headers=headers,
+                timeout=timeout or settings.TOOL_HTTP_TIMEOUT,
+                extensions={"trace": trace}
+            )
+        except httpx.HTTPError:
+            stats.failures += 1
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        """连接池统计信息"""
+        hosts = {f"{scheme}://{host}:{port}": stats.as_dict() for (scheme, host, port), stats in self._stats.items()}
+        total = HostStats(
+            requests=sum(s.requests for s in self._stats.values()),
+            new_connections=sum(s.new_connections for s in self._stats.values()),
+            failures=sum(s.failures for s in self._stats.values())
+        )
+        return {"http2": self._http2, "clients": len(self._clients), "total": total.as_dict(), "hosts": hosts}
+
+
+# 进程内共享的连接池
+tool_http_pool = ToolHttpPool()
@@ -0,0 +1,264 @@
+"""
+进程内工具注册表
+一次性加载所有激活的工具，按ID和名称建立索引并预编译输入参数的JSON Schema校验器，
+工具调用和MCP接口查找工具时不再访问数据库；
+工具定义变化时递增Redis中的版本号，各进程发现版本号变化后重新加载
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from jsonschema import Draft7Validator
+from jsonschema.exceptions import SchemaError
+from jsonschema.validators import validator_for
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.db.redis import get_async_redis, get_redis
+from app.db.session import AsyncSessionLocal, SessionLocal
+from app.models.tool import Tool
+
+logger = logging.getLogger(__name__)
+
+# 工具定义的全局版本号，任何进程修改工具后递增
+REGISTRY_VERSION_KEY = "tool_registry:version"
+
+# 已编译的校验器，按 (工具ID, 工具版本) 缓存，注册表重新加载时未变化的工具不重复编译
+_validators: Dict[Tuple[int, int], Tuple[str, Any]] = {}
+
+
+@dataclass(frozen=True)
+class RegisteredTool:
+    """注册表中的工具，只保存调用所需的字段，不绑定数据库会话"""
+    id: int
+    name: str
+    type: str
+    endpoint: Optional[str]
+    description: Optional[str]
+    auth_info: Optional[Dict[str, Any]]
+    required_role: Optional[str]
+    status: str
+    timeout: Optional[float]
+    cache_ttl: Optional[int]
+    requires_approval: bool
+    version: int
+    input_schema: Optional[Dict[str, Any]]
+    capabilities: Optional[List[str]]
+    validator: Any = None  # 预编译的输入参数校验器，未定义input_schema时为None
+
+
+@dataclass(frozen=True)
+class MCPListing:
+    """预先序列化的MCP工具列表，每个注册表版本计算一次"""
+    ids: List[int]  # 工具ID，升序，用于按游标定位
+    fragments: List[bytes]  # 与ids对应的单个工具定义的JSON
+    digest: str  # 整个列表内容的摘要，用于生成ETag
+
+
+def _build_mcp_listing(tools: Tuple[RegisteredTool, ...]) -> MCPListing:
+    ids, fragments = [], []
+    for tool in tools:
+        # 没有输入模式的工具不对MCP客户端公开
+        if not tool.input_schema:
+            continue
+        ids.append(tool.id)
+        fragments.append(json.dumps({
+            "name": tool.name,
+            "description": tool.description,
+            "capabilities": tool.capabilities,
+            "inputSchema": tool.input_schema
+        }, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+    digest = hashlib.sha256(b"\n".join(fragments)).hexdigest()[:16]
+    return MCPListing(ids=ids, fragments=fragments, digest=digest)
+
+
+def compile_validator(schema: Optional[Dict[str, Any]]) -> Any:
+    """预编译JSON Schema校验器，schema本身不合法时返回None"""
+    if not schema:
+        return None
+    cls = validator_for(schema, default=Draft7Validator)
+    try:
+        cls.check_schema(schema)
+    except SchemaError as e:
+        logger.warning(f"工具输入参数的JSON Schema不合法: {e.message}")
+        return None
+    return cls(schema)
+
+
+def _cached_validator(tool: Tool) -> Any:
+    key = (tool.id, tool.version or 1)
+    schema_json = json.dumps(tool.input_schema, sort_keys=True, default=str)
+    cached = _validators.get(key)
+    # 同一版本的schema被直接修改时同样重新编译
+    if cached is None or cached[0] != schema_json:
+        cached = _validators[key] = (schema_json, compile_validator(tool.input_schema))
+    return cached[1]
+
+
+def _to_registered(tool: Tool) -> RegisteredTool:
+    return RegisteredTool(
+        id=tool.id,
+        name=tool.name,
+        type=tool.type,
+        endpoint=tool.endpoint,
+        description=tool.description,
+        auth_info=tool.auth_info,
+        required_role=tool.required_role,
+        status=tool.status,
+        timeout=tool.timeout,
+        cache_ttl=tool.cache_ttl,
+        requires_approval=bool(tool.requires_approval),
+        version=tool.version or 1,
+        input_schema=tool.input_schema,
+        capabilities=tool.capabilities,
+        validator=_cached_validator(tool)
+    )
+
+
+def _active_tools_query():
+    return select(Tool).where(Tool.status == "active").order_by(Tool.id)
+
+
+class ToolRegistry:
+    """进程内工具注册表"""
+
+    def __init__(self):
+        self._by_id: Dict[int, RegisteredTool] = {}
+        self._by_name: Dict[str, RegisteredTool] = {}
+        self._tools: Tuple[RegisteredTool, ...] = ()
+        self._mcp_listing = _build_mcp_listing(())
+        self._version: Optional[int] = None  # 已加载的版本号，None表示尚未加载
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._async_lock: Optional[asyncio.Lock] = None
+        self._reloads = 0
+
+    @property
+    def version(self) -> int:
+        """已加载的注册表版本号"""
+        return self._version or 0
+
+    # ---- 加载 ----
+
+    def _install(self, tools: List[Tool], version: int) -> None:
+        registered = tuple(_to_registered(tool) for tool in tools)
+        # 整体替换索引，读取方不需要加锁
+        self._by_id = {tool.id: tool for tool in registered}
+        self._by_name = {tool.name: tool for tool in registered}
+        self._tools = registered
+        self._mcp_listing = _build_mcp_listing(registered)
+        self._version = version
+        self._reloads += 1
+        logger.info(f"工具注册表已加载: {len(registered)}个工具, 版本{version}")
+
+    def _needs_check(self) -> bool:
+        return self._version is None or time.monotonic() - self._checked_at >= settings.TOOL_REGISTRY_CHECK_INTERVAL
+
+    @staticmethod
+    def _parse_version(raw: Optional[str]) -> int:
+        return int(raw) if raw else 0
+
+    def refresh(self, force: bool = False) -> None:
+        """检查全局版本号，变化时从数据库重新加载（同步版本）"""
+        if not force and not self._needs_check():
+            return
+        with self._lock:
+            if not force and not self._needs_check():
+                return
+            try:
+                remote = self._parse_version(get_redis().get(REGISTRY_VERSION_KEY))
+            except Exception as e:
+                # Redis不可用时每个检查周期都重新加载，退化为定时刷新
+                logger.warning(f"读取工具注册表版本失败: {str(e)}")
+                remote = -1
+            if force or remote != self._version or remote < 0:
+                with SessionLocal() as db:
+                    self._install(list(db.execute(_active_tools_query()).scalars()), remote)
+            self._checked_at = time.monotonic()
+
+    async def arefresh(self, force: bool = False) -> None:
+        """检查全局版本号，变化时从数据库重新加载（异步版本）"""
+        if not force and not self._needs_check():
+            return
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        async with self._async_lock:
+            if not force and not self._needs_check():
+                return
+            try:
+                remote = self._parse_version(await get_async_redis().get(REGISTRY_VERSION_KEY))
+            except Exception as e:
+                logger.warning(f"读取工具注册表版本失败: {str(e)}")
+                remote = -1
+            if force or remote != self._version or remote < 0:
+                async with AsyncSessionLocal() as db:
+                    result = await db.execute(_active_tools_query())
+                    self._install(list(result.scalars()), remote)
+            self._checked_at = time.monotonic()
+
+    # ---- 失效 ----
+
+    def invalidate(self) -> None:
+        """工具定义变化后调用：递增全局版本号，本进程下次访问时重新加载"""
+        try:
+            get_redis().incr(REGISTRY_VERSION_KEY)
+        except Exception as e:
+            logger.warning(f"递增工具注册表版本失败: {str(e)}")
+        self._checked_at = 0.0
+        self._version = None
+
+    async def ainvalidate(self) -> None:
+        """工具定义变化后调用（异步版本）"""
+        try:
+            await get_async_redis().incr(REGISTRY_VERSION_KEY)
+        except Exception as e:
+            logger.warning(f"递增工具注册表版本失败: {str(e)}")
+        self._checked_at = 0.0
+        self._version = None
+
+    # ---- 查询 ----
+
+    def get_by_id(self, tool_id: int) -> Optional[RegisteredTool]:
+        self.refresh()
+        return self._by_id.get(tool_id)
+
+    def get_by_name(self, name: str) -> Optional[RegisteredTool]:
+        self.refresh()
+        return self._by_name.get(name)
+
+    async def aget_by_id(self, tool_id: int) -> Optional[RegisteredTool]:
+        await self.arefresh()
+        return self._by_id.get(tool_id)
+
+    async def aget_by_name(self, name: str) -> Optional[RegisteredTool]:
+        await self.arefresh()
+        return self._by_name.get(name)
+
+    async def aactive_tools(self) -> Tuple[RegisteredTool, ...]:
+        """所有激活的工具，按ID排序"""
+        await self.arefresh()
+        return self._tools
+
+    async def amcp_listing(self) -> MCPListing:
+        """预先序列化的MCP工具列表"""
+        await self.arefresh()
+        return self._mcp_listing
+
+    def stats(self) -> Dict[str, Any]:
+        """注册表统计信息"""
+        return {
+            "version": self.version,
+            "tools": len(self._tools),
+            "mcp_digest": self._mcp_listing.digest,
+            "reloads": self._reloads
+        }
+
+
+# 进程内共享的工具注册表
+tool_registry = ToolRegistry()
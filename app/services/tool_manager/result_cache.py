@@ -0,0 +1,136 @@
+"""
+工具调用结果缓存
+对声明了缓存时间（Tool.cache_ttl）的确定性工具，按 工具名/版本/规范化参数 缓存调用结果；
+先查进程内LRU，再查Redis（跨进程共享），未命中时才真正调用工具
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.db.redis import get_async_redis
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY_PREFIX = "tool_result"
+
+
+def canonicalize_params(params: Optional[Dict[str, Any]]) -> str:
+    """参数规范化：键排序、去除空白，保证等价参数得到相同的缓存键"""
+    return json.dumps(params or {}, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def is_cacheable(result: Any, error: Optional[str]) -> bool:
+    """只缓存成功的结果，API工具以 {"error": ...} 形式返回的失败同样不缓存"""
+    if error or result is None:
+        return False
+    return not (isinstance(result, dict) and "error" in result)
+
+
+class _LRUCache:
+    """带过期时间的进程内LRU缓存"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class ToolResultCache:
+    """两级工具结果缓存：进程内LRU + Redis"""
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self._local = _LRUCache(max_entries or settings.TOOL_RESULT_CACHE_MAX_ENTRIES)
+        self._hits = {"local": 0, "redis": 0}
+        self._misses = 0
+
+    @staticmethod
+    def key_for(tool_name: str, version: int, params: Optional[Dict[str, Any]]) -> str:
+        digest = hashlib.sha256(canonicalize_params(params).encode("utf-8")).hexdigest()
+        return f"{CACHE_KEY_PREFIX}:{tool_name}:v{version}:{digest}"
+
+    def _local_ttl(self, redis_ttl: int) -> float:
+        # 进程内副本的有效期不超过Redis中的剩余时间
+        return min(settings.TOOL_RESULT_CACHE_LOCAL_TTL, redis_ttl) if redis_ttl > 0 else settings.TOOL_RESULT_CACHE_LOCAL_TTL
+
+    def _local_get(self, key: str) -> Optional[Any]:
+        value = self._local.get(key)
+        if value is not None:
+            self._hits["local"] += 1
+        return value
+
+    async def get(self, key: str) -> Optional[Any]:
+        """查询缓存，未命中返回None"""
+        value = self._local_get(key)
+        if value is not None:
+            return value
+        try:
+            client = get_async_redis()
+            pipe = client.pipeline(transaction=False)
+            pipe.get(key)
+            pipe.ttl(key)
+            raw, ttl = await pipe.execute()
+        except Exception as e:
+            logger.warning(f"读取工具结果缓存失败: {str(e)}")
+            raw = None
+        return self._from_redis(key, raw, ttl if raw is not None else 0)
+
+    def _from_redis(self, key: str, raw: Optional[str], ttl: int) -> Optional[Any]:
+        if raw is None:
+            self._misses += 1
+            return None
+        value = json.loads(raw)
+        self._local.set(key, value, self._local_ttl(ttl))
+        self._hits["redis"] += 1
+        return value
+
+    async def set(self, key: str, value: Any, ttl: int) -> None:
+        """写入缓存，Redis不可用时只写入进程内缓存"""
+        self._local.set(key, value, self._local_ttl(ttl))
+        try:
+            await get_async_redis().set(key, json.dumps(value, ensure_ascii=False, default=str), ex=ttl)
+        except Exception as e:
+            logger.warning(f"写入工具结果缓存失败: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        hits = sum(self._hits.values())
+        total = hits + self._misses
+        return {
+            "local_entries": len(self._local),
+            "local_hits": self._hits["local"],
+            "redis_hits": self._hits["redis"],
+            "misses": self._misses,
+            "hit_ratio": round(hits / total, 4) if total else 0.0
+        }
+
+
+# 进程内共享的结果缓存
+tool_result_cache = ToolResultCache()
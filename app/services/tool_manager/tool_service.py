@@ -1,14 +1,23 @@
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple, Union
 import uuid
 from datetime import datetime
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 import httpx
 import json
 import asyncio
 from fastapi import HTTPException, status
 
-from app.schemas.tool import ToolCreate, ToolResponse, ToolInvocationResponse
+from app.core.config import settings
+from app.core.security import decode_cursor, encode_cursor
+from app.schemas.tool import ToolCreate, ToolUpdate, ToolResponse, ToolInvocationResponse, ToolBatchResultItem
 from app.models.tool import Tool, ToolInvocation
+from app.services.tool_manager.executor import ToolJob, tool_executor
+from app.services.tool_manager.http_pool import tool_http_pool
+from app.services.tool_manager.registry import RegisteredTool, tool_registry
+from app.services.tool_manager.result_cache import tool_result_cache
+from app.services.tool_manager.validation import format_validation_error, validate_params
 from app.services.tool_manager.example_tools import (
     mock_weather_api, 
     mock_document_summary, 
@@ -37,6 +46,9 @@ def register_tool(db: Session, tool_in: ToolCreate) -> Tool:
         auth_type=tool_in.auth_type,
         auth_info=tool_in.auth_info,
         required_role=tool_in.required_role,
+        timeout=tool_in.timeout,
+        cache_ttl=tool_in.cache_ttl,
+        requires_approval=tool_in.requires_approval,
         input_schema=tool_in.input_schema,
         capabilities=tool_in.capabilities,
         status="active"  # 默认为激活状态
@@ -45,6 +57,7 @@ def register_tool(db: Session, tool_in: ToolCreate) -> Tool:
     db.add(db_tool)
     db.commit()
     db.refresh(db_tool)
+    tool_registry.invalidate()
     return db_tool
 
 def register_example_tools(db: Session) -> List[Tool]:
@@ -53,6 +66,7 @@ def register_example_tools(db: Session) -> List[Tool]:
     """
     example_tools = get_example_tools()
     registered_tools = []
+    created = False
     
     for tool_data in example_tools:
         # 检查工具是否已存在
@@ -69,6 +83,8 @@ def register_example_tools(db: Session) -> List[Tool]:
             description=tool_data["description"],
             auth_type=tool_data["auth_type"],
             auth_info=tool_data.get("auth_info"),
+            cache_ttl=tool_data.get("cache_ttl"),
+            requires_approval=tool_data.get("requires_approval", False),
             input_schema=tool_data["input_schema"],
             capabilities=tool_data.get("capabilities"),
             status="active"
@@ -76,10 +92,13 @@ def register_example_tools(db: Session) -> List[Tool]:
         
         db.add(tool)
         registered_tools.append(tool)
+        created = True
     
     db.commit()
     for tool in registered_tools:
         db.refresh(tool)
+    if created:
+        tool_registry.invalidate()
     
     return registered_tools
 
@@ -99,7 +118,7 @@ def get_tool_by_id(db: Session, tool_id: int) -> Optional[Tool]:
     """
     return db.query(Tool).filter(Tool.id == tool_id).first()
 
-async def _call_api_tool(endpoint: str, params: Dict[str, Any], auth_info: Dict[str, Any] = None) -> Dict[str, Any]:
+async def _call_api_tool(endpoint: str, params: Dict[str, Any], auth_info: Dict[str, Any] = None, timeout: Optional[float] = None) -> Dict[str, Any]:
     """
     调用API类型的工具
     """
@@ -124,96 +143,430 @@ async def _call_api_tool(endpoint: str, params: Dict[str, Any], auth_info: Dict[
             headers[auth_info.get("header", "X-API-Key")] = auth_info.get("key")
     
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                endpoint,
-                json=params,
-                headers=headers,
-                timeout=30.0
-            )
-            response.raise_for_status()
-            return response.json()
+        # 使用按主机复用连接的客户端，避免每次调用都重新建立TCP/TLS连接
+        response = await tool_http_pool.post(endpoint, json=params, headers=headers, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+    except httpx.TimeoutException:
+        return {"error": f"调用超时: {timeout or settings.TOOL_HTTP_TIMEOUT}秒"}
     except httpx.HTTPError as e:
         return {"error": f"HTTP错误: {str(e)}"}
     except Exception as e:
         return {"error": f"调用API错误: {str(e)}"}
 
-def invoke_tool(db: Session, tool_id: int, params: Dict[str, Any], user_id: int) -> ToolInvocationResponse:
+def _cache_key(tool: RegisteredTool, params: Dict[str, Any]) -> Optional[str]:
     """
-    调用工具并记录调用
+    工具启用了结果缓存时返回缓存键，否则返回None
     """
-    # 获取工具信息
-    tool = get_tool_by_id(db, tool_id)
-    if not tool or tool.status != "active":
+    if not tool.cache_ttl:
         return None
-    
-    # 创建调用记录
-    invoke_id = str(uuid.uuid4())
+    return tool_result_cache.key_for(tool.name, tool.version or 1, params)
+
+def _cached_invocation(tool: RegisteredTool, params: Dict[str, Any], user_id: int, output: Any) -> ToolInvocation:
+    """
+    构建命中缓存的调用记录
+    """
     now = datetime.now()
-    
-    invocation = ToolInvocation(
-        invoke_id=invoke_id,
-        tool_id=tool_id,
+    return ToolInvocation(
+        invoke_id=str(uuid.uuid4()),
+        tool_id=tool.id,
         user_id=user_id,
         params=params,
-        status="running",
-        started_at=now
+        status="success",
+        output=output,
+        cache_hit=True,
+        started_at=now,
+        finished_at=now
     )
-    
-    db.add(invocation)
-    db.commit()
-    db.refresh(invocation)
-    
-    # 异步调用工具
-    asyncio.create_task(_process_tool_invocation(db, tool, invocation))
-    
-    # 返回初始状态
-    return ToolInvocationResponse(
+
+def _build_job(tool: RegisteredTool, invocation_id: int, invoke_id: str, params: Optional[Dict[str, Any]]) -> ToolJob:
+    """
+    构建执行任务，只复制执行所需的数据
+    """
+    return ToolJob(
+        invocation_id=invocation_id,
         invoke_id=invoke_id,
-        tool_id=tool_id,
-        status="running",
-        started_at=now
+        tool_id=tool.id,
+        tool_name=tool.name,
+        tool_type=tool.type,
+        endpoint=tool.endpoint,
+        auth_info=tool.auth_info,
+        params=params or {},
+        timeout=tool.timeout,
+        cache_key=_cache_key(tool, params),
+        cache_ttl=tool.cache_ttl
     )
 
-async def _process_tool_invocation(db: Session, tool: Tool, invocation: ToolInvocation):
+async def _execute_tool(tool_type: str, endpoint: str, auth_info: Optional[Dict[str, Any]], params: Dict[str, Any], timeout: Optional[float] = None):
     """
-    异步处理工具调用
+    执行工具，返回 (结果, 错误信息)
     """
     result = None
     error = None
     
     try:
-        if tool.type == "api":
+        if tool_type == "api":
             # 调用API类型工具
-            result = await _call_api_tool(tool.endpoint, invocation.params, tool.auth_info)
-        elif tool.type == "script":
+            result = await _call_api_tool(endpoint, params, auth_info, timeout)
+        elif tool_type == "script":
             # 处理脚本类型工具
-            if "db_query.py" in tool.endpoint:
+            if "db_query.py" in endpoint:
                 # 模拟数据库查询
                 result = mock_database_query(
-                    query=invocation.params.get("query", ""),
-                    database=invocation.params.get("database", "")
+                    query=params.get("query", ""),
+                    database=params.get("database", "")
                 )
             else:
                 # 其他脚本类型工具
                 result = {"message": "脚本执行功能尚未实现"}
                 error = "不支持的工具类型"
         else:
-            error = f"不支持的工具类型: {tool.type}"
+            error = f"不支持的工具类型: {tool_type}"
     except Exception as e:
         error = str(e)
     
-    # 更新调用记录
-    invocation.status = "success" if not error else "failed"
-    invocation.output = result
-    invocation.error = error
-    invocation.finished_at = datetime.now()
-    
-    db.add(invocation)
-    db.commit()
+    return result, error
 
 def get_tool_invocation(db: Session, invoke_id: str) -> Optional[ToolInvocation]:
     """
     获取工具调用状态
     """
-    return db.query(ToolInvocation).filter(ToolInvocation.invoke_id == invoke_id).first() 
\ No newline at end of file
+    return db.query(ToolInvocation).filter(ToolInvocation.invoke_id == invoke_id).first() 
+
+# ---- 异步版本，使用异步数据库会话，供async接口调用 ----
+
+async def aregister_tool(db: AsyncSession, tool_in: ToolCreate) -> Tool:
+    """
+    注册新工具到系统（异步版本）
+    """
+    existing = await db.execute(select(Tool.id).where(Tool.name == tool_in.name))
+    if existing.first():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="工具名称已存在"
+        )
+    
+    db_tool = Tool(
+        name=tool_in.name,
+        type=tool_in.type,
+        endpoint=tool_in.endpoint,
+        description=tool_in.description,
+        auth_type=tool_in.auth_type,
+        auth_info=tool_in.auth_info,
+        required_role=tool_in.required_role,
+        timeout=tool_in.timeout,
+        cache_ttl=tool_in.cache_ttl,
+        requires_approval=tool_in.requires_approval,
+        input_schema=tool_in.input_schema,
+        capabilities=tool_in.capabilities,
+        status="active"
+    )
+    db.add(db_tool)
+    await db.commit()
+    await db.refresh(db_tool)
+    await tool_registry.ainvalidate()
+    return db_tool
+
+# 影响调用结果的工具配置，修改后工具版本递增，旧版本的缓存结果不再命中
+VERSIONED_FIELDS = ("endpoint", "auth_type", "auth_info", "input_schema")
+
+async def aupdate_tool(db: AsyncSession, tool_id: int, tool_in: ToolUpdate) -> Tool:
+    """
+    修改工具（异步版本）：接口、认证或参数Schema变化时版本号递增，
+    显式指定的版本号不低于当前版本时才生效
+    """
+    db_tool = await db.get(Tool, tool_id)
+    if not db_tool:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="工具不存在"
+        )
+    values = tool_in.model_dump(exclude_unset=True)
+    requested_version = values.pop("version", None)
+    if values.get("name") and values["name"] != db_tool.name:
+        existing = await db.execute(select(Tool.id).where(Tool.name == values["name"]))
+        if existing.first():
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="工具名称已存在"
+            )
+
+    current_version = db_tool.version or 1
+    changed = any(field in values and values[field] != getattr(db_tool, field) for field in VERSIONED_FIELDS)
+    for field, value in values.items():
+        setattr(db_tool, field, value)
+    db_tool.version = max(current_version + 1 if changed else current_version, requested_version or 0)
+
+    await db.commit()
+    await db.refresh(db_tool)
+    await tool_registry.ainvalidate()
+    return db_tool
+
+async def aget_tools(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    status: Optional[str] = None,
+    after_id: Optional[int] = None
+) -> List[Tool]:
+    """
+    获取工具列表，按ID排序，可按状态筛选（异步版本）
+
+    指定after_id时使用键集分页（id > after_id），耗时与翻页深度无关，并发插入时也不会跳过或重复
+    """
+    query = select(Tool).order_by(Tool.id)
+    if status:
+        query = query.where(Tool.status == status)
+    if after_id is not None:
+        query = query.where(Tool.id > after_id)
+    elif skip:
+        query = query.offset(skip)
+    result = await db.execute(query.limit(limit))
+    return list(result.scalars().all())
+
+def encode_page_cursor(after_id: int, scope: str) -> str:
+    """
+    生成分页游标，scope区分不同的列表，游标不能跨列表使用
+    """
+    return encode_cursor({"after": after_id, "scope": scope})
+
+def decode_page_cursor(cursor: str, scope: str) -> int:
+    """
+    解析分页游标，返回上一页最后一个ID
+    """
+    payload = decode_cursor(cursor)
+    if not payload or payload.get("scope") != scope or not isinstance(payload.get("after"), int):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="无效的分页游标"
+        )
+    return payload["after"]
+
+async def aget_tool_by_id(db: AsyncSession, tool_id: int) -> Optional[Tool]:
+    """
+    根据ID获取工具（异步版本）
+    """
+    return await db.get(Tool, tool_id)
+
+async def aget_tool_by_name(db: AsyncSession, name: str, status: Optional[str] = "active") -> Optional[Tool]:
+    """
+    根据名称获取工具（异步版本）
+    """
+    query = select(Tool).where(Tool.name == name)
+    if status:
+        query = query.where(Tool.status == status)
+    result = await db.execute(query)
+    return result.scalars().first()
+
+async def ainvoke_tool(db: AsyncSession, tool_id: int, params: Dict[str, Any], user_id: int) -> Optional[ToolInvocationResponse]:
+    """
+    调用工具并记录调用（异步版本）
+    """
+    tool = await tool_registry.aget_by_id(tool_id)
+    if not tool:
+        return None
+    
+    # 调用前校验参数，不合法时直接返回422
+    params = validate_params(tool, params)
+    
+    # 命中结果缓存时直接返回，不进入执行队列
+    cache_key = _cache_key(tool, params)
+    cached = await tool_result_cache.get(cache_key) if cache_key else None
+    if cached is not None:
+        invocation = _cached_invocation(tool, params, user_id, cached)
+        db.add(invocation)
+        await db.commit()
+        return ToolInvocationResponse.model_validate(invocation)
+    
+    # 队列已满时直接拒绝，不创建调用记录
+    tool_executor.check_capacity()
+    
+    invoke_id = str(uuid.uuid4())
+    now = datetime.now()
+    invocation = ToolInvocation(
+        invoke_id=invoke_id,
+        tool_id=tool_id,
+        user_id=user_id,
+        params=params,
+        status="running",
+        started_at=now
+    )
+    db.add(invocation)
+    await db.commit()
+    
+    # 交给执行引擎排队执行，结果由执行引擎使用独立的会话写入，不依赖请求的会话
+    try:
+        tool_executor.submit(_build_job(tool, invocation.id, invocation.invoke_id, invocation.params))
+    except HTTPException:
+        invocation.status = "failed"
+        invocation.error = "工具调用过多，已拒绝"
+        invocation.finished_at = datetime.now()
+        await db.commit()
+        raise
+    
+    return ToolInvocationResponse(
+        invoke_id=invoke_id,
+        tool_id=tool_id,
+        status="running",
+        started_at=now
+    )
+
+async def aget_tool_invocation(db: AsyncSession, invoke_id: str) -> Optional[ToolInvocation]:
+    """
+    获取工具调用状态（异步版本）
+    """
+    result = await db.execute(select(ToolInvocation).where(ToolInvocation.invoke_id == invoke_id))
+    return result.scalars().first()
+
+async def await_tool_invocation(db: AsyncSession, invoke_id: str, timeout: float) -> Optional[ToolInvocation]:
+    """
+    等待工具调用完成，最多等待timeout秒，返回最新的调用记录
+    """
+    invocations = await await_tool_invocations(db, [invoke_id], timeout)
+    return invocations.get(invoke_id)
+
+async def await_tool_invocations(db: AsyncSession, invoke_ids: List[str], timeout: float) -> Dict[str, ToolInvocation]:
+    """
+    等待一组工具调用完成，最多等待timeout秒，返回 调用ID -> 最新的调用记录
+
+    调用由本进程执行时完成后立即唤醒；由其他进程执行时按固定间隔重新查询
+    """
+    waiters = {invoke_id: tool_executor.watch(invoke_id) for invoke_id in invoke_ids}
+    try:
+        # 先登记再查询，避免在两者之间完成的调用被错过
+        invocations = await _afetch_tool_invocations(db, invoke_ids)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            running = [i for i in invocations.values() if i.status == "running"]
+            remaining = deadline - loop.time()
+            if not running or remaining <= 0:
+                break
+            await asyncio.wait(
+                [waiters[i.invoke_id] for i in running],
+                timeout=min(remaining, settings.TOOL_STATUS_POLL_INTERVAL),
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            invocations.update(await _afetch_tool_invocations(db, [i.invoke_id for i in running]))
+        return invocations
+    finally:
+        for invoke_id, waiter in waiters.items():
+            tool_executor.unwatch(invoke_id, waiter)
+
+async def _afetch_tool_invocations(db: AsyncSession, invoke_ids: List[str]) -> Dict[str, ToolInvocation]:
+    """
+    批量查询调用记录，忽略会话中已缓存的旧状态
+    """
+    result = await db.execute(
+        select(ToolInvocation)
+        .where(ToolInvocation.invoke_id.in_(invoke_ids))
+        .execution_options(populate_existing=True)
+    )
+    return {invocation.invoke_id: invocation for invocation in result.scalars()}
+
+async def ainvoke_tools_batch(
+    db: AsyncSession,
+    calls: List[Tuple[Union[int, str], Dict[str, Any]]],
+    user_id: int,
+    wait: float = 0
+) -> List[ToolBatchResultItem]:
+    """
+    批量调用工具：从注册表解析所有工具，一次插入所有调用记录，在执行引擎的并发限制下并发执行
+
+    Args:
+        db: 数据库会话
+        calls: (工具ID或工具名, 参数) 列表
+        user_id: 用户ID
+        wait: 等待结果的最长时间（秒），0表示提交后立即返回
+
+    Returns:
+        与calls顺序一致的结果列表，每项单独给出状态
+    """
+    if len(calls) > settings.TOOL_BATCH_MAX_CALLS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"单次批量调用最多{settings.TOOL_BATCH_MAX_CALLS}个"
+        )
+    
+    now = datetime.now()
+    results: List[Optional[ToolBatchResultItem]] = [None] * len(calls)
+    rows_to_insert = []
+    to_submit = []  # (序号, 工具, 调用ID, 参数)
+    for index, (ref, params) in enumerate(calls):
+        # 从注册表解析工具，不访问数据库
+        tool = await tool_registry.aget_by_id(ref) if isinstance(ref, int) else await tool_registry.aget_by_name(ref)
+        if tool is None:
+            results[index] = ToolBatchResultItem(index=index, status="failed", error=f"工具 '{ref}' 不存在或未激活")
+            continue
+        try:
+            params = validate_params(tool, params)
+        except HTTPException as e:
+            results[index] = ToolBatchResultItem(index=index, tool_id=tool.id, status="failed", error=format_validation_error(e))
+            continue
+        invoke_id = str(uuid.uuid4())
+        cache_key = _cache_key(tool, params)
+        cached = await tool_result_cache.get(cache_key) if cache_key else None
+        row = {
+            "invoke_id": invoke_id,
+            "tool_id": tool.id,
+            "user_id": user_id,
+            "params": params,
+            "status": "success" if cached is not None else "running",
+            "output": cached,
+            "cache_hit": cached is not None,
+            "started_at": now,
+            "finished_at": now if cached is not None else None
+        }
+        rows_to_insert.append(row)
+        results[index] = ToolBatchResultItem(
+            index=index,
+            tool_id=tool.id,
+            invoke_id=invoke_id,
+            status=row["status"],
+            output=cached,
+            cache_hit=row["cache_hit"]
+        )
+        if cached is None:
+            to_submit.append((index, tool, invoke_id, params))
+    
+    # 队列放不下整批时整体拒绝，不创建调用记录
+    if to_submit:
+        tool_executor.check_capacity(len(to_submit))
+    
+    # 一次插入所有调用记录
+    if rows_to_insert:
+        invocation_ids = dict((await db.execute(
+            insert(ToolInvocation).returning(ToolInvocation.invoke_id, ToolInvocation.id, sort_by_parameter_order=True),
+            rows_to_insert
+        )).all())
+        await db.commit()
+    
+    rejected = []
+    for index, tool, invoke_id, params in to_submit:
+        try:
+            tool_executor.submit(_build_job(tool, invocation_ids[invoke_id], invoke_id, params))
+        except HTTPException:
+            rejected.append(invoke_id)
+            results[index].status = "failed"
+            results[index].error = "工具调用过多，已拒绝"
+    if rejected:
+        await db.execute(
+            update(ToolInvocation)
+            .where(ToolInvocation.invoke_id.in_(rejected))
+            .values(status="failed", error="工具调用过多，已拒绝", finished_at=datetime.now())
+        )
+        await db.commit()
+    
+    # 在等待时间内收集执行结果
+    running = [item.invoke_id for item in results if item.status == "running"]
+    if running and wait > 0:
+        invocations = await await_tool_invocations(db, running, wait)
+        for item in results:
+            invocation = invocations.get(item.invoke_id)
+            if invocation is not None and invocation.status != "running":
+                item.status = invocation.status
+                item.output = invocation.output
+                item.error = invocation.error
+                item.cache_hit = invocation.cache_hit
+                item.finished_at = invocation.finished_at
+    return results
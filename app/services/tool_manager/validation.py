@@ -0,0 +1,116 @@
+"""
+工具调用参数校验
+按工具的 input_schema 在调用前校验参数：先做简单的类型转换（如 "200" -> 200）并填充默认值，
+再使用注册表中预编译的校验器校验，不合法的调用直接拒绝，不占用执行队列和外部连接
+"""
+
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException, status
+
+_TRUE_STRINGS = {"true", "1", "yes", "on"}
+_FALSE_STRINGS = {"false", "0", "no", "off"}
+
+
+def _schema_types(schema: Dict[str, Any]) -> List[str]:
+    types = schema.get("type")
+    if isinstance(types, str):
+        return [types]
+    return list(types or [])
+
+
+def _coerce_scalar(value: Any, types: List[str]) -> Any:
+    """将字符串转换为schema声明的标量类型，无法转换时保持原值交给校验器报错"""
+    if not isinstance(value, str):
+        if types == ["string"] and isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+        return value
+    if "string" in types:
+        return value
+    text = value.strip()
+    if "integer" in types:
+        try:
+            return int(text)
+        except ValueError:
+            pass
+    if "number" in types:
+        try:
+            return float(text)
+        except ValueError:
+            pass
+    if "boolean" in types:
+        if text.lower() in _TRUE_STRINGS:
+            return True
+        if text.lower() in _FALSE_STRINGS:
+            return False
+    if "null" in types and text.lower() in ("", "null", "none"):
+        return None
+    return value
+
+
+def coerce_params(value: Any, schema: Optional[Dict[str, Any]]) -> Any:
+    """
+    按schema递归转换参数类型并填充默认值，返回新对象，不修改传入的参数
+
+    Args:
+        value: 参数值
+        schema: 对应的JSON Schema
+
+    Returns:
+        转换后的参数
+    """
+    if not isinstance(schema, dict):
+        return value
+    types = _schema_types(schema)
+    if isinstance(value, dict) and (not types or "object" in types):
+        properties = schema.get("properties") or {}
+        result = {key: coerce_params(item, properties.get(key)) for key, item in value.items()}
+        for key, prop in properties.items():
+            if key not in result and isinstance(prop, dict) and "default" in prop:
+                result[key] = prop["default"]
+        return result
+    if isinstance(value, list) and (not types or "array" in types):
+        items = schema.get("items")
+        return [coerce_params(item, items) for item in value] if isinstance(items, dict) else list(value)
+    return _coerce_scalar(value, types) if types else value
+
+
+def validate_params(tool: Any, params: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    校验工具调用参数，返回转换类型、填充默认值后的参数
+
+    Args:
+        tool: 注册表中的工具，使用其预编译的校验器
+        params: 调用参数
+
+    Returns:
+        校验通过的参数
+
+    Raises:
+        HTTPException: 参数不合法时返回422，detail为各项错误
+    """
+    params = params or {}
+    if not tool.input_schema:
+        return params
+    coerced = coerce_params(params, tool.input_schema)
+    if tool.validator is None:
+        return coerced
+    errors = sorted(tool.validator.iter_errors(coerced), key=lambda e: list(e.path))
+    if errors:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=[
+                {"loc": ["params", *error.path], "msg": error.message, "type": f"schema.{error.validator}"}
+                for error in errors
+            ]
+        )
+    return coerced
+
+
+def format_validation_error(exc: HTTPException) -> str:
+    """将参数校验错误整理为一段文本，用于MCP的错误响应"""
+    if isinstance(exc.detail, list):
+        return "参数校验失败: " + "; ".join(
+            f"{'.'.join(str(part) for part in item['loc'][1:]) or '(root)'}: {item['msg']}" for item in exc.detail
+        )
+    return str(exc.detail)